@@ -1,39 +1,210 @@
 import os
-import time
-import glob
 import threading
 import datetime
-import pygame
+import queue
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from mutagen.mp3 import MP3
-from mutagen.flac import FLAC
-from mutagen.wave import WAVE
-from ttkthemes import ThemedStyle
+from music_metrics import setup_metrics_from_env, shutdown_metrics
+from music_engine import (MusicTimerEngine, RecurrenceRule, format_duration, parse_time,
+                          parse_duration, parse_dates, CONFLICT_POLICIES, DEFAULT_POLICY)
+from schedule_io import read_schedule, write_schedule, ScheduleImportError
 
 
-class MusicPlayer:
-    def __init__(self):
-        pygame.mixer.init()
-        self.current_volume = 0.7
-        self.stop_event = threading.Event()
-        
-    def load(self, file_path):
-        pygame.mixer.music.load(file_path)
-        self.set_volume(self.current_volume)
-        
-    def play(self):
-        pygame.mixer.music.play()
-        
-    def stop(self):
-        pygame.mixer.music.stop()
-        
-    def set_volume(self, volume):
-        self.current_volume = max(0.0, min(1.0, volume))
-        pygame.mixer.music.set_volume(self.current_volume)
-        
-    def is_playing(self):
-        return pygame.mixer.music.get_busy()
+WATCH_INTERVAL_MS = 60 * 1000
+REPEAT_OPTIONS = {"单次": None, "每天": 'daily', "工作日": 'weekdays', "Cron": 'cron'}
+POLICY_OPTIONS = {label: policy for policy, label in CONFLICT_POLICIES.items()}
+SOUND_FILE_TYPES = [("音频文件", "*.mp3 *.flac *.wav"), ("所有文件", "*.*")]
+EVENT_POLL_MS = 50
+EVENT_BATCH_LIMIT = 1000
+# 同一批事件中只保留最后一次的事件，值为取合并键的函数
+COALESCED_EVENTS = {
+    'scan_progress': lambda data: None,
+    'loudness_progress': lambda data: None,
+    'task_updated': lambda data: data['task']['id'],
+    'volume_changed': lambda data: None,
+}
+# 相邻的同类事件把列表拼在一起一次处理
+MERGED_EVENTS = {'tracks_added': 'tracks', 'tracks_updated': 'tracks', 'tracks_removed': 'paths',
+                 'tasks_added': 'tasks'}
+IMPORT_ERROR_LINES = 20
+SCHEDULE_FILE_TYPES = [("CSV 文件", "*.csv"), ("JSON 文件", "*.json *.jsonl"), ("所有文件", "*.*")]
+DEFAULT_ROW_HEIGHT = 20
+HEADING_HEIGHT = 25
+WHEEL_ROWS = 3
+
+
+def coalesce_events(events):
+    latest = {}
+    for index, (event, data) in enumerate(events):
+        key_of = COALESCED_EVENTS.get(event)
+        if key_of is not None:
+            latest[(event, key_of(data))] = index
+    
+    result = []
+    for index, (event, data) in enumerate(events):
+        key_of = COALESCED_EVENTS.get(event)
+        if key_of is not None and latest[(event, key_of(data))] != index:
+            continue
+        field = MERGED_EVENTS.get(event)
+        if field is not None:
+            if result and result[-1][0] == event:
+                result[-1][1][field].extend(data[field])
+                continue
+            data = dict(data, **{field: list(data[field])})
+        result.append((event, data))
+    return result
+
+
+class VirtualListView:
+    # 只为窗口中可见的几十行创建 Treeview 条目，滚动或数据变化时按序号从模型取数据重新填充。
+    # fetch(start, count) 返回 [(键, 各列的值)]，count() 返回总行数，index_of(键) 返回序号或 None；
+    # 选中项按键记录，滚出可见范围后仍然保留
+    def __init__(self, parent, columns, fetch, count, index_of):
+        self.fetch = fetch
+        self.count = count
+        self.index_of = index_of
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings", style="Treeview",
+                                 selectmode="browse")
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.top = 0
+        self.page_size = 1
+        self.row_keys = []
+        self.row_values = []
+        self.selected_key = None
+        self.refresh_pending = False
+        
+        self.tree.bind("<Configure>", self.on_configure)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-WHEEL_ROWS))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(WHEEL_ROWS))
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", None), ("<Next>", None)):
+            self.tree.bind(key, lambda event, step=step, key=key: self.on_key(step, key))
+    
+    def grid(self, row, column):
+        self.tree.grid(row=row, column=column, sticky="nsew")
+        self.scrollbar.grid(row=row, column=column + 1, sticky="ns")
+    
+    def row_iid(self, row):
+        return f"row{row}"
+    
+    def key_at(self, iid):
+        # iid 对应的行的键，不是当前显示的行时返回 None
+        if not iid:
+            return None
+        row = int(iid[3:])
+        return self.row_keys[row] if row < len(self.row_keys) else None
+    
+    def select(self, key, index=None):
+        self.selected_key = key
+        if index is not None:
+            self.see(index)
+        self.invalidate()
+    
+    def see(self, index):
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + self.page_size:
+            self.top = index - self.page_size + 1
+    
+    def scroll(self, rows):
+        self.top += rows
+        self.refresh()
+    
+    def reset(self):
+        self.top = 0
+        self.selected_key = None
+        self.invalidate()
+    
+    def invalidate(self):
+        # 同一轮事件里的多次变化只重绘一次
+        if not self.refresh_pending:
+            self.refresh_pending = True
+            self.tree.after_idle(self.refresh)
+    
+    def refresh(self):
+        self.refresh_pending = False
+        total = self.count()
+        self.top = max(0, min(self.top, total - self.page_size))
+        rows = self.fetch(self.top, self.page_size)
+        
+        selected_iid = None
+        for row, (key, values) in enumerate(rows):
+            iid = self.row_iid(row)
+            tag = 'evenrow' if (self.top + row) % 2 == 0 else 'oddrow'
+            if row >= len(self.row_keys):
+                self.tree.insert("", "end", iid=iid, values=values, tags=(tag,))
+                self.row_keys.append(key)
+                self.row_values.append((values, tag))
+            elif self.row_values[row] != (values, tag):
+                self.tree.item(iid, values=values, tags=(tag,))
+                self.row_values[row] = (values, tag)
+            self.row_keys[row] = key
+            if key == self.selected_key:
+                selected_iid = iid
+        for row in range(len(rows), len(self.row_keys)):
+            self.tree.delete(self.row_iid(row))
+        del self.row_keys[len(rows):]
+        del self.row_values[len(rows):]
+        
+        if selected_iid is not None:
+            if self.tree.selection() != (selected_iid,):
+                self.tree.selection_set(selected_iid)
+        elif self.tree.selection():
+            self.tree.selection_remove(self.tree.selection())
+        
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + self.page_size) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+    
+    def on_configure(self, event):
+        # 主题在窗口显示后才切换，行高每次重新查询
+        row_height = ttk.Style(self.tree).lookup("Treeview", "rowheight")
+        row_height = int(float(row_height)) if row_height else DEFAULT_ROW_HEIGHT
+        page_size = max(1, (event.height - HEADING_HEIGHT) // row_height)
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self.invalidate()
+    
+    def on_select(self, event):
+        # 选中的行滚出可见范围时 Treeview 会清空选择，这里只记录新的选择
+        selection = self.tree.selection()
+        if selection:
+            key = self.key_at(selection[0])
+            if key is not None:
+                self.selected_key = key
+    
+    def on_scrollbar(self, action, amount, unit=None):
+        total = self.count()
+        if action == "moveto":
+            self.top = int(float(amount) * total)
+        elif unit == "pages":
+            self.top += int(amount) * self.page_size
+        else:
+            self.top += int(amount)
+        self.refresh()
+    
+    def on_mousewheel(self, event):
+        self.scroll(-WHEEL_ROWS if event.delta > 0 else WHEEL_ROWS)
+        return "break"
+    
+    def on_key(self, step, key):
+        # 键盘移动选择时越过可见范围也能继续，按序号向模型取行
+        if step is None:
+            step = -self.page_size if key == "<Prior>" else self.page_size
+        total = self.count()
+        if not total:
+            return "break"
+        index = self.index_of(self.selected_key) if self.selected_key is not None else None
+        index = self.top if index is None else max(0, min(total - 1, index + step))
+        self.see(index)
+        self.top = max(0, min(self.top, total - self.page_size))
+        rows = self.fetch(index, 1)
+        if rows:
+            self.selected_key = rows[0][0]
+        self.refresh()
+        return "break"
 
 
 class MusicTimerApp:
@@ -49,33 +220,48 @@ class MusicTimerApp:
         except:
             pass
         
-        self.style = ThemedStyle(self.root)
-        self.style.set_theme("arc")
-        
-        self.style.configure("Accent.TButton", font=("微软雅黑", 10, "bold"), foreground="#2c6fbb")
-        self.style.configure("Statusbar.TFrame", background="#e0e0e0")
-        self.style.configure("Statusbar.TLabel", background="#e0e0e0", font=("微软雅黑", 9))
-        self.style.configure("Toolbutton", font=("微软雅黑", 9), foreground="#666666")
-        self.style.configure("Readonly.TEntry", fieldbackground="#f8f8f8", foreground="#555555")
+        self.style = ttk.Style(self.root)
+        self.configure_styles()
         
-        self.player = MusicPlayer()
+        self.metrics_exporter = setup_metrics_from_env()
+        self.engine = MusicTimerEngine()
         
-        self.music_files = []
-        self.scheduled_tasks = []
-        self.current_task = None
-        self.is_playing = False
-        self.current_file = ""
-        self.current_remaining = 0
-        self.total_duration = 0
-        self.playback_thread = None
+        self.scan_thread = None
+        self.scan_cancel_event = threading.Event()
+        self.scan_quiet = False
+        self.task_rows = {}
+        self.shown_text = {}
+        self.event_queue = queue.SimpleQueue()
         
         self.create_widgets()
         
-        self.scheduler_thread = threading.Thread(target=self.check_schedule, daemon=True)
-        self.scheduler_thread.start()
+        # 引擎事件可能来自任意线程，统一放入队列由主线程处理
+        self.engine.subscribe(lambda event, data: self.event_queue.put((event, data)))
+        self.engine.start()
+        self.control_server = self.start_control_server()
         
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.process_engine_events()
         self.update_status()
+        # ttkthemes 导入较慢，窗口先用默认主题显示，空闲后再切换
+        self.root.after_idle(self.apply_theme)
+    
+    def configure_styles(self):
+        self.style.configure("Accent.TButton", font=("微软雅黑", 10, "bold"), foreground="#2c6fbb")
+        self.style.configure("Statusbar.TFrame", background="#e0e0e0")
+        self.style.configure("Statusbar.TLabel", background="#e0e0e0", font=("微软雅黑", 9))
+        self.style.configure("Toolbutton", font=("微软雅黑", 9), foreground="#666666")
+        self.style.configure("Readonly.TEntry", fieldbackground="#f8f8f8", foreground="#555555")
+    
+    def apply_theme(self):
+        try:
+            from ttkthemes import ThemedStyle
+        except ImportError:
+            return
+        self.style = ThemedStyle(self.root)
+        self.style.set_theme("arc")
+        # 样式设置只作用于当前主题，切换后重新应用
+        self.configure_styles()
     
     def create_widgets(self):
         default_font = ("微软雅黑", 10)
@@ -96,6 +282,21 @@ class MusicTimerApp:
         folder_entry.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         ttk.Button(folder_frame, text="浏览", command=self.browse_folder).pack(side=tk.LEFT)
         
+        scan_frame = ttk.Frame(main_frame)
+        scan_frame.pack(fill=tk.X, pady=(0, 5))
+        self.scan_progress = ttk.Progressbar(scan_frame, orient=tk.HORIZONTAL, mode='determinate')
+        self.scan_progress.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        self.scan_status_var = tk.StringVar(value="")
+        ttk.Label(scan_frame, textvariable=self.scan_status_var, width=24).pack(side=tk.LEFT, padx=5)
+        self.scan_cancel_button = ttk.Button(scan_frame, text="取消扫描", command=self.cancel_scan,
+                                             state=tk.DISABLED, style="Toolbutton")
+        self.scan_cancel_button.pack(side=tk.LEFT)
+        ttk.Button(scan_frame, text="重新扫描", command=self.rescan_library,
+                   style="Toolbutton").pack(side=tk.LEFT, padx=5)
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(scan_frame, text="自动监视", variable=self.watch_var,
+                        command=self.toggle_watch).pack(side=tk.LEFT)
+        
         settings_frame = ttk.Frame(main_frame)
         settings_frame.pack(fill=tk.X, pady=5)
         
@@ -125,12 +326,41 @@ class MusicTimerApp:
         self.duration_var = tk.StringVar(value="00:10:00")
         duration_entry = ttk.Entry(duration_frame, textvariable=self.duration_var, width=10)
         duration_entry.pack(side=tk.LEFT, padx=5)
+        self.gapless_var = tk.BooleanVar(value=self.engine.gapless)
+        ttk.Checkbutton(duration_frame, text="无缝衔接", variable=self.gapless_var,
+                        command=self.toggle_gapless).pack(side=tk.LEFT, padx=10)
+        # 到点时已有播放的处理方式；叠加播放可以指定一个音频文件 (如提示音)，不指定时叠加播放曲库
+        ttk.Label(duration_frame, text="已有播放时:").pack(side=tk.LEFT, padx=(10, 0))
+        self.policy_var = tk.StringVar(value=CONFLICT_POLICIES[DEFAULT_POLICY])
+        ttk.Combobox(duration_frame, textvariable=self.policy_var, values=list(POLICY_OPTIONS),
+                     state='readonly', width=6).pack(side=tk.LEFT, padx=5)
+        self.sound_var = tk.StringVar()
+        ttk.Button(duration_frame, text="叠加音频", command=self.browse_sound,
+                   style="Toolbutton").pack(side=tk.LEFT, padx=5)
+        ttk.Entry(duration_frame, textvariable=self.sound_var, width=24, state='readonly',
+                  style="Readonly.TEntry").pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+        
+        repeat_frame = ttk.Frame(main_frame)
+        repeat_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(repeat_frame, text="重复:").pack(side=tk.LEFT)
+        self.repeat_var = tk.StringVar(value="单次")
+        ttk.Combobox(repeat_frame, textvariable=self.repeat_var, values=list(REPEAT_OPTIONS),
+                     state='readonly', width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Label(repeat_frame, text="Cron (分 时 日 月 周):").pack(side=tk.LEFT, padx=(10, 0))
+        self.cron_var = tk.StringVar(value="0 8 * * 1-5")
+        ttk.Entry(repeat_frame, textvariable=self.cron_var, width=16).pack(side=tk.LEFT, padx=5)
+        ttk.Label(repeat_frame, text="排除日期:").pack(side=tk.LEFT, padx=(10, 0))
+        self.exclude_var = tk.StringVar()
+        ttk.Entry(repeat_frame, textvariable=self.exclude_var, width=24).pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=10)
         ttk.Button(button_frame, text="添加定时", command=self.add_schedule, style="Accent.TButton").pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="立即播放", command=self.start_play_now).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="停止播放", command=self.stop_playback).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="继续播放", command=self.resume_playback).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="导入任务", command=self.import_schedule).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="导出任务", command=self.export_schedule).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="关于", command=self.show_about, style="Toolbutton").pack(side=tk.RIGHT, padx=5)
         
         notebook = ttk.Notebook(main_frame)
@@ -139,18 +369,16 @@ class MusicTimerApp:
         music_frame = ttk.Frame(notebook)
         notebook.add(music_frame, text="音乐文件", padding=5)
         
+        # 曲库可能有十万首以上，列表只显示可见的行，数据按需从引擎读取
         columns = ("filename", "duration")
-        self.music_tree = ttk.Treeview(music_frame, columns=columns, show="headings", style="Treeview")
+        self.music_view = VirtualListView(music_frame, columns, self.fetch_music_rows,
+                                          lambda: len(self.engine.music_files), self.engine.track_index)
+        self.music_tree = self.music_view.tree
         self.music_tree.heading("filename", text="音乐文件")
         self.music_tree.heading("duration", text="时长")
         self.music_tree.column("filename", width=500, anchor=tk.W)
         self.music_tree.column("duration", width=150, anchor=tk.CENTER)
-        
-        music_scrollbar = ttk.Scrollbar(music_frame, orient=tk.VERTICAL, command=self.music_tree.yview)
-        self.music_tree.configure(yscrollcommand=music_scrollbar.set)
-        
-        self.music_tree.grid(row=0, column=0, sticky="nsew")
-        music_scrollbar.grid(row=0, column=1, sticky="ns")
+        self.music_view.grid(row=0, column=0)
         
         music_frame.grid_rowconfigure(0, weight=1)
         music_frame.grid_columnconfigure(0, weight=1)
@@ -158,13 +386,17 @@ class MusicTimerApp:
         schedule_frame = ttk.Frame(notebook)
         notebook.add(schedule_frame, text="定时任务", padding=5)
         
-        columns = ("time", "duration", "status")
+        columns = ("time", "duration", "repeat", "policy", "status")
         self.schedule_tree = ttk.Treeview(schedule_frame, columns=columns, show="headings", style="Treeview")
         self.schedule_tree.heading("time", text="播放时间")
         self.schedule_tree.heading("duration", text="播放时长")
+        self.schedule_tree.heading("repeat", text="重复")
+        self.schedule_tree.heading("policy", text="已有播放时")
         self.schedule_tree.heading("status", text="状态")
         self.schedule_tree.column("time", width=200, anchor=tk.CENTER)
         self.schedule_tree.column("duration", width=150, anchor=tk.CENTER)
+        self.schedule_tree.column("repeat", width=150, anchor=tk.CENTER)
+        self.schedule_tree.column("policy", width=100, anchor=tk.CENTER)
         self.schedule_tree.column("status", width=150, anchor=tk.CENTER)
         
         tree_scrollbar = ttk.Scrollbar(schedule_frame, orient=tk.VERTICAL, command=self.schedule_tree.yview)
@@ -208,8 +440,9 @@ class MusicTimerApp:
     
     def show_music_context_menu(self, event):
         item = self.music_tree.identify_row(event.y)
-        if item:
-            self.music_tree.selection_set(item)
+        key = self.music_view.key_at(item)
+        if key is not None:
+            self.music_view.select(key)
             self.music_context_menu.post(event.x_root, event.y_root)
     
     def show_schedule_context_menu(self, event):
@@ -219,6 +452,14 @@ class MusicTimerApp:
             self.schedule_context_menu.post(event.x_root, event.y_root)
     
     def move_item(self, treeview, direction):
+        if treeview == self.music_tree:
+            # 按选中曲目的路径向引擎查询序号，不遍历列表
+            path = self.music_view.selected_key
+            index = self.engine.track_index(path) if path is not None else None
+            if index is not None:
+                self.engine.move_track(index, index + direction)
+            return
+        
         selected = treeview.selection()
         if not selected:
             return
@@ -231,47 +472,61 @@ class MusicTimerApp:
             new_index = index + direction
             
             if 0 <= new_index < len(items):
-                if treeview == self.music_tree:
-                    self.music_files[index], self.music_files[new_index] = \
-                        self.music_files[new_index], self.music_files[index]
-                
                 treeview.move(selected_item, "", new_index)
         except ValueError:
             pass
     
     def delete_item(self, treeview):
+        if treeview == self.music_tree:
+            if self.music_view.selected_key is not None:
+                self.engine.remove_tracks([self.music_view.selected_key])
+            return
+        
         selected = treeview.selection()
         if not selected:
             return
             
         selected_item = selected[0]
-        items = list(treeview.get_children())
-        index = items.index(selected_item)
-        
-        if treeview == self.music_tree and index < len(self.music_files):
-            del self.music_files[index]
         
-        treeview.delete(selected_item)
+        if self.engine.remove_task(int(selected_item)) is None:
+            self.task_rows.pop(selected_item, None)
+            treeview.delete(selected_item)
+    
+    def toggle_gapless(self):
+        self.engine.gapless = self.gapless_var.get()
     
     def update_volume(self, value):
         volume = float(value) / 100.0
-        self.player.set_volume(volume)
+        self.engine.set_volume(volume)
         self.volume_label.config(text=f"{int(self.volume_var.get())}%")
     
     def update_status(self):
         current_time = datetime.datetime.now().strftime('%H:%M:%S')
         
-        if self.is_playing:
-            hours, remainder = divmod(self.current_remaining, 3600)
+        if self.engine.is_playing:
+            hours, remainder = divmod(self.engine.current_remaining, 3600)
             minutes, seconds = divmod(remainder, 60)
-            status_text = (f"播放中: {self.current_file} | "
+            status_text = (f"播放中: {self.engine.current_file} | "
                           f"剩余时间: {int(hours):02d}:{int(minutes):02d}:{int(seconds):02d} | "
                           f"系统时间: {current_time}")
         else:
             status_text = f"就绪 | 系统时间: {current_time}"
             
-        self.status_var.set(status_text)
-        self.root.after(1000, self.update_status)
+        self.set_text(self.status_var, status_text)
+        # 对齐到下一个整秒，避免系统时间显示跳秒
+        self.root.after(1000 - datetime.datetime.now().microsecond // 1000, self.update_status)
+    
+    def set_text(self, var, text):
+        # 文本没有变化时不写入，避免无谓的重绘
+        name = str(var)
+        if self.shown_text.get(name) != text:
+            self.shown_text[name] = text
+            var.set(text)
+    
+    def set_scan_progress(self, value, maximum):
+        if self.shown_text.get('scan_progress') != (value, maximum):
+            self.shown_text['scan_progress'] = (value, maximum)
+            self.scan_progress.configure(value=value, maximum=maximum)
     
     def browse_folder(self):
         folder_path = filedialog.askdirectory(title="选择音乐文件夹")
@@ -279,142 +534,224 @@ class MusicTimerApp:
             self.folder_var.set(folder_path)
             self.scan_music_folder(folder_path)
     
-    def scan_music_folder(self, folder_path):
-        self.music_files = []
-        supported_extensions = ('*.mp3', '*.flac', '*.wav')
-        
-        for ext in supported_extensions:
-            self.music_files.extend(glob.glob(os.path.join(folder_path, ext)))
-        
-        if not self.music_files:
-            self.show_error(f"在 '{folder_path}' 中未找到支持的音乐文件")
+    def scan_music_folder(self, folder_path, quiet=False):
+        self.cancel_scan()
+        
+        self.scan_cancel_event = threading.Event()
+        self.scan_quiet = quiet
+        self.set_scan_progress(0, 1)
+        self.set_text(self.scan_status_var, "正在查找音乐文件...")
+        self.scan_cancel_button.configure(state=tk.NORMAL)
+        
+        self.scan_thread = threading.Thread(target=self.engine.scan_library,
+                                            args=(folder_path, self.scan_cancel_event),
+                                            daemon=True)
+        self.scan_thread.start()
+    
+    def rescan_library(self, quiet=False):
+        if self.engine.library_folder:
+            self.scan_music_folder(self.engine.library_folder, quiet=quiet)
+    
+    def is_scanning(self):
+        return self.scan_thread is not None and self.scan_thread.is_alive()
+    
+    def cancel_scan(self):
+        self.scan_cancel_event.set()
+    
+    def toggle_watch(self):
+        if self.watch_var.get():
+            self.root.after(WATCH_INTERVAL_MS, self.watch_library)
+    
+    def watch_library(self):
+        if not self.watch_var.get():
             return
-        
-        for item in self.music_tree.get_children():
-            self.music_tree.delete(item)
-        
-        valid_files = []
-        for i, file_path in enumerate(self.music_files):
-            duration = self.get_music_duration(file_path)
-            if duration is not None:
-                filename = os.path.basename(file_path)
-                formatted_duration = self.format_duration(duration)
-                tag = 'evenrow' if i % 2 == 0 else 'oddrow'
-                self.music_tree.insert("", "end", values=(filename, formatted_duration), tags=(tag,))
-                valid_files.append(file_path)
-        
-        self.music_files = valid_files
-        
-        if len(valid_files) < len(self.music_files):
-            self.show_warning("部分文件不支持或已损坏，已自动过滤")
+        if self.engine.library_folder and not self.is_scanning():
+            self.rescan_library(quiet=True)
+        self.root.after(WATCH_INTERVAL_MS, self.watch_library)
     
-    def get_music_duration(self, file_path):
+    def process_engine_events(self):
+        # 每次最多取 EVENT_BATCH_LIMIT 个事件，合并重复的更新后一起处理，Tk 在空闲时统一重绘
+        events = []
         try:
-            if file_path.lower().endswith('.mp3'):
-                audio = MP3(file_path)
-            elif file_path.lower().endswith('.flac'):
-                audio = FLAC(file_path)
-            elif file_path.lower().endswith('.wav'):
-                audio = WAVE(file_path)
-            else:
-                return None
-            return int(audio.info.length)
-        except Exception:
-            return None
+            while len(events) < EVENT_BATCH_LIMIT:
+                events.append(self.event_queue.get_nowait())
+        except queue.Empty:
+            pass
+        for event, data in coalesce_events(events):
+            handler = getattr(self, 'on_' + event, None)
+            if handler is not None:
+                handler(**data)
+        # 还有积压时尽快处理下一批
+        delay = 1 if len(events) >= EVENT_BATCH_LIMIT else EVENT_POLL_MS
+        self.root.after(delay, self.process_engine_events)
+    
+    def fetch_music_rows(self, start, count):
+        return [(path, (os.path.basename(path), self.format_duration(duration)))
+                for path, duration in self.engine.get_tracks(start, count)]
+    
+    def on_library_reset(self, folder):
+        self.music_view.reset()
+    
+    def on_tracks_added(self, tracks):
+        self.music_view.invalidate()
+    
+    def on_tracks_updated(self, tracks):
+        self.music_view.invalidate()
+    
+    def on_tracks_removed(self, paths):
+        if self.music_view.selected_key in paths:
+            self.music_view.selected_key = None
+        self.music_view.invalidate()
+    
+    def on_track_moved(self, path, index, new_index):
+        if path == self.music_view.selected_key:
+            self.music_view.select(path, new_index)
+        else:
+            self.music_view.invalidate()
+    
+    def on_scan_progress(self, done, total):
+        self.set_scan_progress(done, max(1, total))
+        self.set_text(self.scan_status_var, f"扫描中 {done}/{total}")
+    
+    def on_scan_finished(self, invalid_count, cancelled, count):
+        self.scan_cancel_button.configure(state=tk.DISABLED)
+        if cancelled:
+            self.set_text(self.scan_status_var, f"已取消 ({count} 首)")
+        else:
+            self.set_text(self.scan_status_var, f"扫描完成 ({count} 首)")
+            if invalid_count and not self.scan_quiet:
+                self.show_warning("部分文件不支持或已损坏，已自动过滤")
+    
+    def on_loudness_progress(self, done, total):
+        self.set_text(self.scan_status_var, f"响度分析 {done}/{total}")
+    
+    def on_loudness_finished(self, analyzed, failed, cancelled):
+        if not cancelled:
+            self.set_text(self.scan_status_var, f"扫描完成 ({len(self.engine.music_files)} 首)")
+    
+    def on_loudness_error(self, message):
+        # 响度分析失败不影响播放，只在状态栏提示，曲目按原音量播放
+        self.set_text(self.scan_status_var, f"响度分析失败: {message}")
+    
+    def on_scan_empty(self, folder):
+        self.scan_cancel_button.configure(state=tk.DISABLED)
+        self.set_text(self.scan_status_var, "")
+        if not self.scan_quiet:
+            self.show_error(f"在 '{folder}' 中未找到支持的音乐文件")
+    
+    def on_scan_error(self, message):
+        self.scan_cancel_button.configure(state=tk.DISABLED)
+        self.set_text(self.scan_status_var, "")
+        if not self.scan_quiet:
+            self.show_error(f"扫描时出现错误: {message}")
+    
+    def on_tasks_loaded(self, tasks):
+        for task in tasks:
+            self.on_task_added(task)
+    
+    def on_task_added(self, task):
+        tag = 'evenrow' if task['id'] % 2 == 0 else 'oddrow'
+        iid = str(task['id'])
+        self.task_rows[iid] = self.task_row_values(task)
+        self.schedule_tree.insert("", "end", iid=iid, values=self.task_rows[iid], tags=(tag,))
+    
+    def on_tasks_added(self, tasks):
+        for task in tasks:
+            self.on_task_added(task)
+    
+    def on_schedule_imported(self, path, count):
+        self.show_info(f"已从 {os.path.basename(path)} 导入 {count} 个定时任务")
+    
+    def on_schedule_import_failed(self, path, message):
+        self.show_error(f"导入 {os.path.basename(path)} 失败，{message}")
+    
+    def on_task_updated(self, task):
+        # 只有显示内容变化的行才刷新
+        iid = str(task['id'])
+        values = self.task_row_values(task)
+        if iid in self.task_rows and self.task_rows[iid] != values:
+            self.task_rows[iid] = values
+            self.schedule_tree.item(iid, values=values)
+    
+    def task_row_values(self, task):
+        return (f"{task['date']} {task['time']}", task['duration'], task['repeat'],
+                CONFLICT_POLICIES[task['policy']], task['status'])
+    
+    def on_task_removed(self, task):
+        iid = str(task['id'])
+        if self.task_rows.pop(iid, None) is not None:
+            self.schedule_tree.delete(iid)
+    
+    def on_preroll_failed(self, task, message):
+        self.show_warning(f"定时任务 {task['date']} {task['time']} 预备失败，到点可能无法播放: {message}")
+    
+    def on_playback_error(self, message):
+        self.show_error(f"播放时出现错误: {message}")
     
     def format_duration(self, seconds):
-        hours, remainder = divmod(seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        return format_duration(seconds)
     
     def parse_time(self, time_str):
         try:
-            h, m, s = map(int, time_str.split(':'))
-            if not (0 <= h <= 23 and 0 <= m <= 59 and 0 <= s <= 59):
-                raise ValueError
-            return h, m, s
-        except (ValueError, AttributeError):
-            self.show_error("时间格式错误，请使用 H:M:S 格式")
+            return parse_time(time_str)
+        except ValueError as e:
+            self.show_error(str(e))
             return None
     
     def parse_duration(self, duration_str):
         try:
-            h, m, s = map(int, duration_str.split(':'))
-            if not (0 <= m <= 59 and 0 <= s <= 59):
-                raise ValueError
-            return h * 3600 + m * 60 + s
-        except (ValueError, AttributeError):
-            self.show_error("时长格式错误，请使用 H:M:S 格式")
+            return parse_duration(duration_str)
+        except ValueError as e:
+            self.show_error(str(e))
             return None
     
     def add_schedule(self):
-        if not self.music_files:
+        if not self.engine.music_files:
             self.show_error("请先选择音乐文件夹并扫描音乐文件!")
             return
             
-        time_parts = self.parse_time(self.time_var.get())
-        if time_parts is None:
-            return
+        kind = REPEAT_OPTIONS.get(self.repeat_var.get())
+        time_parts = None
+        if kind != 'cron':
+            time_parts = self.parse_time(self.time_var.get())
+            if time_parts is None:
+                return
             
         duration_seconds = self.parse_duration(self.duration_var.get())
         if duration_seconds is None:
             return
-            
-        now = datetime.datetime.now()
-        target_time = now.replace(hour=time_parts[0], minute=time_parts[1], second=time_parts[2])
         
-        if target_time < now:
-            target_time += datetime.timedelta(days=1)
-            
-        task_id = len(self.scheduled_tasks) + 1
-        task = {
-            'id': task_id,
-            'time': target_time.strftime("%H:%M:%S"),
-            'date': target_time.strftime("%Y-%m-%d"),
-            'datetime': target_time,
-            'duration': self.format_duration(duration_seconds),
-            'duration_seconds': duration_seconds,
-            'status': '等待中'
-        }
-        self.scheduled_tasks.append(task)
-        
-        tag = 'evenrow' if len(self.scheduled_tasks) % 2 == 0 else 'oddrow'
-        self.schedule_tree.insert("", "end", 
-                                values=(f"{task['date']} {task['time']}", 
-                                        task['duration'], 
-                                        task['status']),
-                                tags=(tag,))
-        
-        self.show_info(f"已添加定时任务: {task['date']} {task['time']} 播放 {task['duration']}")
-    
-    def check_schedule(self):
-        while True:
-            now = datetime.datetime.now()
-            
-            for task in self.scheduled_tasks[:]:
-                if task['status'] == '等待中' and now >= task['datetime']:
-                    task['status'] = '执行中'
-                    self.current_task = task
-                    
-                    for item in self.schedule_tree.get_children():
-                        if self.schedule_tree.item(item, 'values')[0] == f"{task['date']} {task['time']}":
-                            self.schedule_tree.item(item, values=(
-                                f"{task['date']} {task['time']}", 
-                                task['duration'], 
-                                task['status']))
-                            break
-                    
-                    self.start_playback(task['duration_seconds'])
-            
-            self.scheduled_tasks = [t for t in self.scheduled_tasks if t['status'] != '已完成']
-            time.sleep(1)
+        try:
+            rule = None
+            if kind is not None:
+                rule = RecurrenceRule(kind, time_parts, self.cron_var.get().strip(),
+                                      parse_dates(self.exclude_var.get()))
+            policy = POLICY_OPTIONS[self.policy_var.get()]
+            task = self.engine.add_task(time_parts, duration_seconds, rule, policy,
+                                        self.sound_var.get() if policy == 'mix' else None)
+        except ValueError as e:
+            self.show_error(str(e))
+            return
+        message = f"已添加定时任务: {task['date']} {task['time']} 播放 {task['duration']} ({task['repeat']})"
+        conflicts = self.engine.task_conflicts(task)
+        if conflicts:
+            others = len(conflicts) - conflicts.count(task['id'])
+            overlap = f"与 {others} 个定时任务" if others else "与自身的下一次"
+            self.show_warning(f"{message}\n\n{overlap}的播放时间重叠，"
+                              f"到点时按“{self.policy_var.get()}”处理")
+        else:
+            self.show_info(message)
+    
+    def browse_sound(self):
+        # 取消选择时清空，叠加播放曲库
+        self.sound_var.set(filedialog.askopenfilename(title="选择叠加播放的音频", filetypes=SOUND_FILE_TYPES))
     
     def start_play_now(self):
-        if not self.music_files:
+        if not self.engine.music_files:
             self.show_error("请先选择音乐文件夹并扫描音乐文件!")
             return
             
-        if self.is_playing:
+        if self.engine.is_playing:
             self.show_error("音乐正在播放中!")
             return
             
@@ -422,77 +759,48 @@ class MusicTimerApp:
         if duration_seconds is None:
             return
             
-        self.start_playback(duration_seconds)
+        self.engine.start_playback(duration_seconds)
     
-    def start_playback(self, duration_seconds):
-        self.player.stop_event.clear()
-        
-        self.total_duration = duration_seconds
-        self.current_remaining = duration_seconds
-        self.is_playing = True
-        
-        self.playback_thread = threading.Thread(target=self.play_music_sequence, args=(duration_seconds,), daemon=True)
-        self.playback_thread.start()
+    def stop_playback(self):
+        # 同时停止叠加播放，排队中的任务不再播放
+        self.engine.stop_all()
+    
+    def import_schedule(self):
+        path = filedialog.askopenfilename(title="导入定时任务", filetypes=SCHEDULE_FILE_TYPES)
+        if not path:
+            return
+        # 大文件的解析和写库放到后台线程，结果和任务一样通过事件队列交给主线程
+        threading.Thread(target=self.run_schedule_import, args=(path,), daemon=True).start()
     
-    def play_music_sequence(self, duration_seconds):
+    def run_schedule_import(self, path):
         try:
-            total_played = 0
-            start_time = time.time()
-            
-            for file_path in self.music_files:
-                if self.player.stop_event.is_set() or total_played >= duration_seconds:
-                    break
-                    
-                music_duration = self.get_music_duration(file_path)
-                if music_duration is None:
-                    continue
-                
-                remaining_time = duration_seconds - total_played
-                play_duration = min(music_duration, remaining_time)
-                
-                self.current_file = os.path.basename(file_path)
-                
-                self.player.load(file_path)
-                self.player.play()
-                
-                while (time.time() - start_time) < total_played + play_duration:
-                    if self.player.stop_event.is_set():
-                        self.player.stop()
-                        return
-                    
-                    elapsed = time.time() - start_time
-                    self.current_remaining = max(0, duration_seconds - elapsed)
-                    time.sleep(0.1)
-                
-                total_played += play_duration
-            
-            # 先停止播放再显示完成消息
-            self.stop_playback()
-            if not self.player.stop_event.is_set():  # 如果不是手动停止的
-                self.root.after(100, lambda: self.show_info("播放完成"))
-            
-        except Exception as e:
-            self.stop_playback()
-            self.root.after(100, lambda: self.show_error(f"播放时出现错误: {str(e)}"))
+            tasks = self.engine.add_tasks(read_schedule(path))
+        except ScheduleImportError as e:
+            message = f"{e}，未导入任何任务:\n{e.describe(IMPORT_ERROR_LINES)}"
+            self.event_queue.put(('schedule_import_failed', {'path': path, 'message': message}))
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            self.event_queue.put(('schedule_import_failed', {'path': path, 'message': str(e)}))
+        else:
+            self.event_queue.put(('schedule_imported', {'path': path, 'count': len(tasks)}))
     
-    def stop_playback(self):
-        self.is_playing = False
-        self.player.stop_event.set()
-        self.player.stop()
-        self.current_remaining = 0
-        
-        # 更新当前任务状态
-        if self.current_task:
-            self.current_task['status'] = '已完成'
-            # 更新UI中的任务状态
-            for item in self.schedule_tree.get_children():
-                if self.schedule_tree.item(item, 'values')[0] == f"{self.current_task['date']} {self.current_task['time']}":
-                    self.schedule_tree.item(item, values=(
-                        f"{self.current_task['date']} {self.current_task['time']}", 
-                        self.current_task['duration'], 
-                        '已完成'))
-                    break
-            self.current_task = None
+    def export_schedule(self):
+        path = filedialog.asksaveasfilename(title="导出定时任务", defaultextension=".csv",
+                                            filetypes=SCHEDULE_FILE_TYPES)
+        if not path:
+            return
+        try:
+            count = write_schedule(self.engine.list_tasks(), path)
+        except OSError as e:
+            self.show_error(f"导出失败: {e}")
+            return
+        self.show_info(f"已导出 {count} 个定时任务到 {os.path.basename(path)}")
+    
+    def resume_playback(self):
+        if self.engine.is_playing:
+            self.show_error("音乐正在播放中!")
+            return
+        if not self.engine.resume_session():
+            self.show_error("没有可以继续的播放，或音乐文件夹与上次不同")
     
     def show_about(self):
         about_window = tk.Toplevel(self.root)
@@ -500,8 +808,6 @@ class MusicTimerApp:
         about_window.geometry("500x600")
         about_window.resizable(False, False)
         
-        ThemedStyle(about_window).set_theme("arc")
-        
         main_frame = ttk.Frame(about_window, padding=20)
         main_frame.pack(fill=tk.BOTH, expand=True)
         
@@ -587,10 +893,24 @@ class MusicTimerApp:
     def show_warning(self, message):
         messagebox.showwarning("警告", message)
     
+    def start_control_server(self):
+        # 设置了 MUSIC_TIMER_CONTROL_PORT 时才导入 asyncio 并启动控制接口
+        if not os.environ.get("MUSIC_TIMER_CONTROL_PORT"):
+            return None
+        from control_server import start_control_from_env
+        try:
+            return start_control_from_env(self.engine)
+        except (OSError, ValueError) as e:
+            self.show_warning(f"控制接口启动失败: {e}")
+            return None
+    
     def on_closing(self):
         if messagebox.askokcancel("退出", "确定要退出定时音乐播放器吗？"):
-            self.stop_playback()
-            pygame.mixer.quit()
+            self.cancel_scan()
+            if self.control_server is not None:
+                self.control_server.stop()
+            self.engine.shutdown()
+            shutdown_metrics(self.metrics_exporter)
             self.root.destroy()
 
 
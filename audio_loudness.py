@@ -0,0 +1,165 @@
+import os
+import math
+import wave
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+# 响度按 ITU-R BS.1770 的分块门限计算 (不做 K 计权): 每 100 ms 一段求均方，相邻 4 段组成一个 400 ms 的块
+# (重叠 75%)，去掉低于 -70 dB 的块和低于其余块平均值 10 dB 的块后取平均。增益把响度拉到目标值，
+# 提升和衰减都有上限
+LOUDNESS_TARGET_DB = -18.0
+MAX_BOOST_DB = 6.0
+MAX_CUT_DB = 12.0
+ABSOLUTE_GATE_DB = -70.0
+RELATIVE_GATE_DB = -10.0
+SEGMENT_SECONDS = 0.1
+SEGMENTS_PER_BLOCK = 4
+READ_FRAMES = 64 * 1024
+LOUDNESS_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+WORKER_NICE = 10
+MIXER_FORMAT = (44100, -16, 2)
+
+# 子进程中解码 MP3、FLAC 用的混音器，第一次用到时初始化
+WORKER_MIXER = None
+
+
+def loudness_available():
+    # 分析需要 NumPy，没有安装时不做响度均衡，所有曲目按原音量播放
+    return importlib.util.find_spec("numpy") is not None
+
+
+def pcm_samples(np, data, sampwidth):
+    # 小端 PCM 字节转换成 [-1, 1) 的 float32 数组
+    if sampwidth == 1:
+        return (np.frombuffer(data, np.uint8).astype(np.float32) - 128.0) / 128.0
+    if sampwidth == 3:
+        raw = np.frombuffer(data, np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        values = np.where(values >= 1 << 23, values - (1 << 24), values)
+        return values.astype(np.float32) / float(1 << 23)
+    if sampwidth not in (2, 4):
+        raise ValueError(f"不支持的采样位数: {sampwidth * 8}")
+    dtype = '<i2' if sampwidth == 2 else '<i4'
+    return np.frombuffer(data, dtype).astype(np.float32) / float(1 << (sampwidth * 8 - 1))
+
+
+class LoudnessMeter:
+    # 分块送入交错排列的样本，累积每 100 ms 一段的均方，最后按门限求响度
+    def __init__(self, np, rate, channels):
+        self.np = np
+        self.channels = channels
+        self.segment = max(1, int(rate * SEGMENT_SECONDS))
+        self.carry = np.zeros(0, np.float32)
+        self.segments = []
+        self.total_power = 0.0
+        self.total_frames = 0
+
+    def feed(self, samples):
+        np = self.np
+        usable = len(samples) - len(samples) % self.channels
+        power = np.square(samples[:usable].reshape(-1, self.channels)).mean(axis=1)
+        self.total_power += float(power.sum(dtype=np.float64))
+        self.total_frames += len(power)
+        power = np.concatenate((self.carry, power))
+        whole = len(power) - len(power) % self.segment
+        if whole:
+            self.segments.append(power[:whole].reshape(-1, self.segment).mean(axis=1, dtype=np.float64))
+        self.carry = power[whole:]
+
+    def loudness(self):
+        # 整首曲目的响度 (dBFS)，静音时返回 None
+        np = self.np
+        segments = np.concatenate(self.segments) if self.segments else np.zeros(0)
+        if len(segments) >= SEGMENTS_PER_BLOCK:
+            blocks = np.convolve(segments, np.ones(SEGMENTS_PER_BLOCK) / SEGMENTS_PER_BLOCK, mode='valid')
+        elif self.total_frames:
+            # 不足一个块的短曲目整体算一块
+            blocks = np.array([self.total_power / self.total_frames])
+        else:
+            return None
+        blocks = blocks[blocks > 10 ** (ABSOLUTE_GATE_DB / 10)]
+        if not len(blocks):
+            return None
+        gated = blocks[blocks >= blocks.mean() * 10 ** (RELATIVE_GATE_DB / 10)]
+        return 10 * math.log10(float(gated.mean()))
+
+
+def wav_loudness(np, file_path):
+    # WAV 直接按块读取 PCM，不把整个文件读进内存
+    with wave.open(file_path, 'rb') as w:
+        meter = LoudnessMeter(np, w.getframerate(), w.getnchannels())
+        sampwidth = w.getsampwidth()
+        while True:
+            data = w.readframes(READ_FRAMES)
+            if not data:
+                break
+            meter.feed(pcm_samples(np, data, sampwidth))
+    return meter.loudness()
+
+
+def worker_mixer():
+    global WORKER_MIXER
+    if WORKER_MIXER is None:
+        import pygame
+        pygame.mixer.init(*MIXER_FORMAT)
+        WORKER_MIXER = pygame.mixer
+    return WORKER_MIXER
+
+
+def decoded_loudness(np, file_path):
+    # 其他格式由 SDL_mixer 整首解码成混音器的 16 位格式，再按块计算
+    mixer = worker_mixer()
+    rate, size, channels = mixer.get_init()
+    if size != -16:
+        raise RuntimeError(f"混音器格式不是 16 位有符号整数: {size}")
+    samples = np.frombuffer(mixer.Sound(file_path).get_raw(), np.int16)
+    meter = LoudnessMeter(np, rate, channels)
+    step = READ_FRAMES * channels
+    for start in range(0, len(samples), step):
+        meter.feed(samples[start:start + step].astype(np.float32) / 32768.0)
+    return meter.loudness()
+
+
+def measure_loudness(file_path):
+    # 整首曲目的响度 (dBFS)，静音时返回 None；无法解码时抛出异常
+    import numpy as np
+    if file_path.lower().endswith('.wav'):
+        try:
+            return wav_loudness(np, file_path)
+        except (wave.Error, EOFError):
+            # 浮点、压缩等 wave 模块不支持的编码交给 SDL_mixer
+            pass
+    return decoded_loudness(np, file_path)
+
+
+def loudness_gain(loudness):
+    if loudness is None:
+        return 0.0
+    return max(-MAX_CUT_DB, min(MAX_BOOST_DB, LOUDNESS_TARGET_DB - loudness))
+
+
+def analyze_track(file_path):
+    # 进程池中执行，返回 (响度, 增益 dB, 错误信息)；无法解码的文件增益为 0，同样写入缓存不再重复分析
+    try:
+        loudness = measure_loudness(file_path)
+    except Exception as e:
+        return None, 0.0, str(e) or type(e).__name__
+    return loudness, loudness_gain(loudness), None
+
+
+def init_worker():
+    # 子进程只解码不出声，不占用音频设备，并降低优先级，把 CPU 让给界面和播放
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    if hasattr(os, "nice"):
+        try:
+            os.nice(WORKER_NICE)
+        except OSError:
+            pass
+
+
+def create_pool(workers=LOUDNESS_WORKERS):
+    # 用 spawn 启动子进程: 不继承父进程中已初始化的混音器和线程，各平台行为一致
+    return ProcessPoolExecutor(workers, multiprocessing.get_context('spawn'), init_worker)
@@ -0,0 +1,204 @@
+import os
+import struct
+
+
+# 只读文件头部的少量字节求时长，算法与 mutagen 一致；无法确定时返回 None，由调用方退回 mutagen
+PROBE_READ_SIZE = 8192
+MAX_SYNC_SEARCH = 64 * 1024
+MAX_RIFF_CHUNKS = 64
+MP3_CHECK_FRAMES = 4
+
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000),
+}
+MP3_MONO = 3
+
+
+def skip_id3v2(f):
+    # 跳过文件开头的 ID3v2 标签 (可能有多个)，返回音频数据的起始位置
+    offset = 0
+    while True:
+        f.seek(offset)
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b"ID3":
+            return offset
+        size = 0
+        for byte in header[6:10]:
+            size = (size << 7) | (byte & 0x7f)
+        if size == 0:
+            return offset
+        # 标志位 0x10 表示带 10 字节的尾部
+        offset += 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def probe_wav(f, file_size):
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+    block_align = sample_rate = None
+    offset = 12
+    for _ in range(MAX_RIFF_CHUNKS):
+        f.seek(offset)
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, chunk_size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if chunk_id == b"fmt ":
+            fmt = f.read(16)
+            if len(fmt) < 16:
+                return None
+            _, _, sample_rate, _, block_align, _ = struct.unpack("<HHIIHH", fmt)
+        elif chunk_id == b"data":
+            if not block_align or not sample_rate:
+                return None
+            # 边录边写的文件 data 大小可能未回填，按实际文件大小截断
+            data_size = min(chunk_size, file_size - offset - 8)
+            return data_size / block_align / sample_rate, 'wav-header'
+        # RIFF 块按偶数字节对齐
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def probe_flac(f, file_size):
+    offset = skip_id3v2(f)
+    f.seek(offset)
+    header = f.read(4 + 4 + 18)
+    if len(header) < 26 or header[:4] != b"fLaC" or header[4] & 0x7f != 0:
+        return None
+    # STREAMINFO 第 10 字节起: 20 位采样率、3 位声道、5 位位深、36 位总采样数
+    packed = int.from_bytes(header[18:26], "big")
+    sample_rate = packed >> 44
+    total_samples = packed & 0xFFFFFFFFF
+    if not sample_rate or not total_samples:
+        return None
+    return total_samples / sample_rate, 'flac-streaminfo'
+
+
+def parse_mp3_frame(data, pos):
+    # 解析 Layer III 帧头，返回 (版本, 声道模式, 码率, 采样率, 每帧采样数, 帧长)，不是有效帧头时返回 None
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version_bits = (data[pos + 1] >> 3) & 0x3
+    layer_bits = (data[pos + 1] >> 1) & 0x3
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = (data[pos + 2] >> 2) & 0x3
+    padding = (data[pos + 2] >> 1) & 0x1
+    mode = data[pos + 3] >> 6
+    if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    version = {0: 2.5, 2: 2, 3: 1}[version_bits]
+    bitrate = MP3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    frame_samples = 1152 if version == 1 else 576
+    frame_length = (frame_samples // 8 * bitrate) // sample_rate + padding
+    return version, mode, bitrate, sample_rate, frame_samples, frame_length
+
+
+def lame_delay(data, pos):
+    # LAME 3.90 以后的扩展标签里记录了编码器在首尾补的采样数
+    tag = data[pos:pos + 36]
+    if len(tag) < 36 or not tag.startswith((b"LAME", b"L3.99")):
+        return 0
+    version = tag[:9].lstrip(b"EMAL")
+    major, rest = version[:1], version[1:].lstrip(b".")
+    minor = b""
+    while rest[len(minor):len(minor) + 1].isdigit():
+        minor = rest[:len(minor) + 1]
+    if not major.isdigit() or not minor or (int(major), int(minor)) < (3, 90):
+        return 0
+    if tag[9] >> 4 != 0:
+        return 0
+    value = int.from_bytes(tag[21:24], "big")
+    return (value >> 12) + (value & 0xFFF)
+
+
+def probe_xing(data, pos, frame):
+    version, mode, _, sample_rate, frame_samples, _ = frame
+    if version == 1:
+        offset = 21 if mode == MP3_MONO else 36
+    else:
+        offset = 13 if mode == MP3_MONO else 21
+    start = pos + offset
+    tag = data[start:start + 4]
+    if tag in (b"Xing", b"Info"):
+        if start + 8 > len(data):
+            return None
+        flags = struct.unpack(">I", data[start + 4:start + 8])[0]
+        if not flags & 0x1:
+            return None
+        cursor = start + 8
+        frames = struct.unpack(">I", data[cursor:cursor + 4])[0]
+        cursor += 4
+        cursor += 4 if flags & 0x2 else 0
+        cursor += 100 if flags & 0x4 else 0
+        cursor += 4 if flags & 0x8 else 0
+        samples = max(0, frame_samples * frames - lame_delay(data, cursor))
+        return samples / sample_rate, 'mp3-xing' if tag == b"Xing" else 'mp3-info'
+    start = pos + 36
+    if data[start:start + 4] == b"VBRI" and start + 18 <= len(data):
+        if struct.unpack(">H", data[start + 4:start + 6])[0] != 1:
+            return None
+        frames = struct.unpack(">I", data[start + 14:start + 18])[0]
+        return frame_samples * frames / sample_rate, 'mp3-vbri'
+    return None
+
+
+def probe_mp3(f, file_size):
+    offset = skip_id3v2(f)
+    f.seek(offset)
+    data = f.read(PROBE_READ_SIZE)
+    searched = 0
+    while True:
+        pos = data.find(b"\xff")
+        while pos != -1:
+            frame = parse_mp3_frame(data, pos)
+            if frame is not None:
+                result = probe_xing(data, pos, frame)
+                if result is not None:
+                    return result
+                # 没有 VBR 头时连续几帧码率相同才按 CBR 用文件大小估算，否则交给 mutagen
+                bitrates = set()
+                checked = 0
+                cursor = pos
+                while checked < MP3_CHECK_FRAMES:
+                    following = parse_mp3_frame(data, cursor)
+                    if following is None or following[3] != frame[3]:
+                        break
+                    bitrates.add(following[2])
+                    cursor += following[5]
+                    checked += 1
+                if checked >= 2 and len(bitrates) == 1:
+                    return 8 * (file_size - offset - searched - pos) / frame[2], 'mp3-cbr'
+                if checked >= 2 or cursor + 4 > len(data):
+                    return None
+            pos = data.find(b"\xff", pos + 1)
+        # 当前块里没有找到有效帧，保留末尾几个字节继续往后找
+        searched += len(data) - 3
+        if searched >= MAX_SYNC_SEARCH or len(data) < PROBE_READ_SIZE:
+            return None
+        f.seek(offset + searched)
+        data = f.read(PROBE_READ_SIZE)
+
+
+HEADER_PROBES = {'wav': probe_wav, 'flac': probe_flac, 'mp3': probe_mp3}
+
+
+def probe_header(file_path, audio_format=None):
+    # 返回 (时长秒数, 使用的解析方式)；格式不支持或文件头不足以确定时长时返回 None
+    if audio_format is None:
+        audio_format = os.path.splitext(file_path)[1].lower().lstrip('.')
+    probe = HEADER_PROBES.get(audio_format)
+    if probe is None:
+        return None
+    with open(file_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        try:
+            return probe(f, file_size)
+        except (struct.error, IndexError, ValueError):
+            return None
@@ -0,0 +1,517 @@
+import os
+import sys
+import json
+import time
+import wave
+import struct
+import shutil
+import random
+import argparse
+import platform
+import datetime
+import tempfile
+import threading
+import subprocess
+
+# 不需要声卡: 在导入 pygame 之前切换到 SDL 的空音频驱动
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import music_engine  # noqa: E402
+from music_engine import (MusicTimerEngine, TaskScheduler, TrackCache, ScheduleStore, TrackList,  # noqa: E402
+                          NullPlayer, RecurrenceRule, TaskIntervalIndex, probe_music_info, audio_readers)
+from music_timer_sim import simulate  # noqa: E402
+from audio_loudness import loudness_available, measure_loudness, LOUDNESS_WORKERS  # noqa: E402
+
+
+MP3_FRAME_HEADER = b"\xff\xfb\x90\x00"  # MPEG-1 Layer III, 128 kbps, 44.1 kHz, 立体声
+MP3_FRAME_SIZE = 417
+MP3_FRAME_SAMPLES = 1152
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED_MODULES = ("pygame", "mutagen", "ttkthemes", "numpy")
+
+# 在全新的解释器里测量启动耗时，打印一行 JSON
+ENGINE_STARTUP_CODE = '''
+import sys, time, json
+start = time.perf_counter()
+import music_engine
+engine = music_engine.MusicTimerEngine()
+engine.start()
+ready = time.perf_counter()
+loaded = [m for m in %r if m in sys.modules]
+engine.shutdown()
+print(json.dumps({"ready_ms": (ready - start) * 1000, "deferred_loaded": loaded}))
+'''
+
+GUI_STARTUP_CODE = '''
+import sys, time, json
+start = time.perf_counter()
+import tkinter as tk
+import Music_Timer
+root = tk.Tk()
+app = Music_Timer.MusicTimerApp(root)
+ready = time.perf_counter()
+loaded = [m for m in %r if m in sys.modules]
+root.update()
+themed = time.perf_counter()
+app.engine.shutdown()
+root.destroy()
+print(json.dumps({"ready_ms": (ready - start) * 1000, "themed_ms": (themed - start) * 1000,
+                  "deferred_loaded": loaded}))
+'''
+
+
+def write_wav(path, seconds, rate=8000):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(rate * seconds))
+
+
+def write_flac(path, seconds, rate=44100):
+    # 只有 STREAMINFO 元数据块、没有音频帧的 FLAC，足以测试时长解析
+    total_samples = int(rate * seconds)
+    streaminfo = struct.pack(">HH", 4096, 4096) + b"\x00\x00\x00" + b"\x00\x00\x00"
+    packed = (rate << 44) | (1 << 41) | (15 << 36) | total_samples
+    streaminfo += packed.to_bytes(8, "big") + b"\x00" * 16
+    header = bytes([0x80]) + len(streaminfo).to_bytes(3, "big")
+    with open(path, "wb") as f:
+        f.write(b"fLaC" + header + streaminfo)
+
+
+def write_mp3(path, seconds):
+    frames = int(seconds * 44100 / MP3_FRAME_SAMPLES)
+    frame = MP3_FRAME_HEADER + b"\x00" * (MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+    with open(path, "wb") as f:
+        f.write(frame * frames)
+
+
+def measure_startup(code, runs, home):
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, env=env,
+                              capture_output=True, text=True)
+        wall_ms = (time.perf_counter() - start) * 1000
+        if proc.returncode != 0:
+            return {"skipped": (proc.stderr.strip().splitlines() or ["exit %d" % proc.returncode])[-1]}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result["process_ms"] = wall_ms
+        samples.append(result)
+    report = {key: summarize([s[key] for s in samples])
+              for key in ("ready_ms", "themed_ms", "process_ms") if key in samples[0]}
+    report["deferred_loaded"] = samples[-1]["deferred_loaded"]
+    return report
+
+
+WRITERS = {".wav": write_wav, ".flac": write_flac, ".mp3": write_mp3}
+
+
+def generate_library(root, count, seconds, dirs=10):
+    paths = []
+    extensions = list(WRITERS)
+    for i in range(count):
+        ext = extensions[i % len(extensions)]
+        folder = os.path.join(root, f"dir{i % dirs:03d}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"track{i:06d}{ext}")
+        WRITERS[ext](path, seconds)
+        paths.append(path)
+    return paths
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "max": samples[-1],
+    }
+
+
+def make_engine(workdir):
+    # 扫描测试不启动后台响度分析，避免与扫描争用 CPU
+    return MusicTimerEngine(player=NullPlayer(),
+                            track_cache=TrackCache(os.path.join(workdir, "track_cache.db")),
+                            schedule_store=ScheduleStore(os.path.join(workdir, "schedule.db")),
+                            normalize=False)
+
+
+def bench_probe(paths, per_format):
+    # 对比只读文件头的解析和 mutagen 完整解析，并记录每个文件实际走的解析方式
+    results = {}
+    for ext in WRITERS:
+        audio_format = ext.lstrip(".")
+        sample = [p for p in paths if p.endswith(ext)][:per_format]
+        methods = {}
+        start = time.perf_counter()
+        for path in sample:
+            method = probe_music_info(path)[1]
+            methods[method] = methods.get(method, 0) + 1
+        elapsed = time.perf_counter() - start
+        
+        reader = audio_readers()[audio_format]
+        mutagen_start = time.perf_counter()
+        for path in sample:
+            try:
+                reader(path)
+            except Exception:
+                pass
+        mutagen_elapsed = time.perf_counter() - mutagen_start
+        
+        count = max(1, len(sample))
+        results[audio_format] = {
+            "files": len(sample),
+            "us_per_file": elapsed / count * 1e6,
+            "mutagen_us_per_file": mutagen_elapsed / count * 1e6,
+            "methods": {str(k): v for k, v in methods.items()},
+        }
+    return results
+
+
+def bench_scan(library, workdir):
+    results = {}
+
+    engine = make_engine(workdir)
+    start = time.perf_counter()
+    engine.scan_library(library)
+    elapsed = time.perf_counter() - start
+    count = len(engine.music_files)
+    results["cold"] = {"files": count, "seconds": elapsed, "files_per_second": count / elapsed}
+
+    start = time.perf_counter()
+    engine.scan_library(library)
+    elapsed = time.perf_counter() - start
+    results["unchanged_rescan"] = {"files": count, "seconds": elapsed, "files_per_second": count / elapsed}
+    engine.shutdown()
+
+    engine = make_engine(workdir)
+    start = time.perf_counter()
+    engine.scan_library(library)
+    elapsed = time.perf_counter() - start
+    results["warm_cache"] = {"files": count, "seconds": elapsed, "files_per_second": count / elapsed}
+
+    start = time.perf_counter()
+    plan = engine.build_play_plan()
+    elapsed = time.perf_counter() - start
+    planned = len(plan)
+    lookups = 10000
+    start = time.perf_counter()
+    for _ in range(lookups):
+        plan.locate(random.random() * plan.total)
+    locate_elapsed = time.perf_counter() - start
+    results["sequence_plan"] = {"tracks": planned, "us_per_track": elapsed / max(1, planned) * 1e6,
+                                "locate_us": locate_elapsed / lookups * 1e6}
+    engine.shutdown()
+    return results
+
+
+def bench_loudness(workdir, files, seconds):
+    # 进程池分析不同电平的合成噪声，以及文件未变化时只读缓存的耗时
+    if not loudness_available():
+        return {"skipped": "numpy 未安装"}
+    import numpy as np
+    folder = os.path.join(workdir, "loudness")
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(files):
+        level = 10 ** (-(6 + i % 24) / 20)
+        samples = np.clip(rng.standard_normal((int(44100 * seconds), 2)) * level * 0.3, -1, 1)
+        path = os.path.join(folder, f"noise{i:04d}.wav")
+        with wave.open(path, "wb") as w:
+            w.setnchannels(2)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes((samples * 32767).astype("<i2").tobytes())
+        paths.append(path)
+
+    start = time.perf_counter()
+    measure_loudness(paths[0])
+    single_ms = (time.perf_counter() - start) * 1000
+
+    engine = make_engine(workdir)
+    engine.scan_library(folder)
+    engine.normalize = True
+    results = {"files": files, "audio_seconds": files * seconds, "workers": LOUDNESS_WORKERS,
+               "single_file_ms": single_ms}
+    for name in ("cold", "cached"):
+        start = time.perf_counter()
+        engine.analyze_loudness(engine.library_folder, threading.Event())
+        elapsed = time.perf_counter() - start
+        results[name] = {"seconds": elapsed, "files_per_second": files / elapsed}
+    results["realtime_factor"] = files * seconds / results["cold"]["seconds"]
+    gains = sorted(engine.track_gains.values())
+    results["gain_db"] = {"min": gains[0], "max": gains[-1]} if gains else {}
+    engine.shutdown()
+    return results
+
+
+def legacy_tick(tasks, now):
+    # 原先 check_schedule 每秒执行一次的工作量: 遍历全部任务并重建列表
+    for task in tasks[:]:
+        if task['status'] == '等待中' and now >= task['datetime']:
+            pass
+    return [t for t in tasks if t['status'] != '已完成']
+
+
+def bench_scheduler(task_counts, fire_count):
+    results = {}
+    for n in task_counts:
+        far = datetime.datetime.now() + datetime.timedelta(days=1)
+        tasks = [{'id': i, 'datetime': far + datetime.timedelta(seconds=random.random() * 86400),
+                  'status': '等待中'} for i in range(n)]
+
+        scheduler = TaskScheduler(lambda task: None)
+        start = time.perf_counter()
+        for task in tasks:
+            scheduler.add(task)
+        add_us = (time.perf_counter() - start) / n * 1e6
+
+        rounds = 1000
+        start = time.perf_counter()
+        for _ in range(rounds):
+            with scheduler.condition:
+                scheduler.check_clock()
+                scheduler.pop_due(time.monotonic())
+        tick_us = (time.perf_counter() - start) / rounds * 1e6
+
+        legacy_rounds = max(1, min(100, 1000000 // n))
+        now = datetime.datetime.now()
+        start = time.perf_counter()
+        for _ in range(legacy_rounds):
+            legacy_tick(tasks, now)
+        legacy_tick_us = (time.perf_counter() - start) / legacy_rounds * 1e6
+
+        latencies = []
+        done = threading.Event()
+
+        def on_due(task):
+            latency = time.monotonic() - task['due_monotonic']
+            latencies.append(latency)
+            if len(latencies) >= fire_count:
+                done.set()
+
+        scheduler.on_due = on_due
+        scheduler.start()
+        base = datetime.datetime.now() + datetime.timedelta(milliseconds=200)
+        for i in range(fire_count):
+            scheduler.add({'id': n + i, 'datetime': base + datetime.timedelta(milliseconds=5 * i),
+                           'status': '等待中'})
+        done.wait(timeout=30 + fire_count * 0.005)
+        scheduler.stop()
+
+        start = time.perf_counter()
+        for task in tasks[: min(n, 1000)]:
+            scheduler.remove(task)
+        remove_us = (time.perf_counter() - start) / min(n, 1000) * 1e6
+
+        results[str(n)] = {
+            "add_us": add_us,
+            "remove_us": remove_us,
+            "idle_tick_us": tick_us,
+            "legacy_tick_us": legacy_tick_us,
+            "firing_latency_ms": {k: v * 1000 for k, v in summarize(latencies).items() if k != "count"},
+            "fired": len(latencies),
+        }
+    return results
+
+
+def bench_conflicts(task_counts, queries=1000):
+    # 添加任务时的重叠检测: 区间索引与逐个比较全部任务对比；时长 1 分钟到 2 小时，分布在 30 天内
+    results = {}
+    base = datetime.datetime.now() + datetime.timedelta(days=1)
+    for n in task_counts:
+        rng = random.Random(n)
+        tasks = [{'id': i, 'datetime': base + datetime.timedelta(seconds=rng.random() * 30 * 86400),
+                  'duration_seconds': rng.randint(60, 7200)} for i in range(n)]
+        index = TaskIntervalIndex()
+        start = time.perf_counter()
+        for task in tasks:
+            index.add(task)
+        add_us = (time.perf_counter() - start) / n * 1e6
+
+        probes = [tasks[rng.randrange(n)] for _ in range(queries)]
+        found = 0
+        start = time.perf_counter()
+        for task in probes:
+            found += len(index.overlapping(*TaskIntervalIndex.span_of(task), exclude=task['id']))
+        query_us = (time.perf_counter() - start) / queries * 1e6
+
+        spans = [(task['id'],) + TaskIntervalIndex.span_of(task) for task in tasks]
+        linear_rounds = max(1, min(queries, 1000000 // n))
+        start = time.perf_counter()
+        for task in probes[:linear_rounds]:
+            task_start, task_end = TaskIntervalIndex.span_of(task)
+            [i for i, s, e in spans if i != task['id'] and s < task_end and e > task_start]
+        linear_us = (time.perf_counter() - start) / linear_rounds * 1e6
+
+        # 再加一个覆盖全部 30 天的任务，查询不应因此退化成线性扫描
+        index.add({'id': n, 'datetime': base, 'duration_seconds': 30 * 86400})
+        start = time.perf_counter()
+        for task in probes:
+            index.overlapping(*TaskIntervalIndex.span_of(task), exclude=task['id'])
+        long_query_us = (time.perf_counter() - start) / queries * 1e6
+
+        results[str(n)] = {"add_us": add_us, "query_us": query_us, "long_task_query_us": long_query_us,
+                           "linear_query_us": linear_us, "mean_conflicts": found / queries}
+    return results
+
+
+def bench_simulation(days):
+    # 虚拟时钟下跑完整的调度和播放流程: 两个工作日定时任务加每 5 分钟一次的 Cron 任务
+    requests = [((8, 0, 0), 60, RecurrenceRule('weekdays', (8, 0, 0))),
+                ((12, 0, 0), 60, RecurrenceRule('weekdays', (12, 0, 0))),
+                (None, 60, RecurrenceRule('cron', cron="*/5 * * * *"))]
+    start = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return simulate(days, requests, track_seconds=25.0, start=start)
+
+
+def bench_track_list(size, operations=2000):
+    # 曲目列表模型的按序号取行、求序号、相邻交换和删除，与直接在 list 上线性查找对比
+    paths = [f"/music/dir{i % 100:03d}/track{i:07d}.mp3" for i in range(size)]
+    start = time.perf_counter()
+    tracks = TrackList(paths)
+    build_ms = (time.perf_counter() - start) * 1000
+    picks = [random.randrange(size) for _ in range(operations)]
+    
+    def per_op(func):
+        start = time.perf_counter()
+        for index in picks:
+            func(index)
+        return (time.perf_counter() - start) / operations * 1e6
+    
+    results = {
+        "tracks": size,
+        "build_ms": build_ms,
+        "page_us": per_op(lambda index: tracks.slice(index, index + 30)),
+        "index_us": per_op(lambda index: tracks.index(paths[index])),
+        "list_index_us": per_op(lambda index: paths.index(paths[index])),
+        "swap_us": per_op(lambda index: tracks.swap(index, min(index + 1, size - 1))),
+    }
+    victims = random.sample(list(tracks), min(operations, size // 4))
+    start = time.perf_counter()
+    for path in victims:
+        tracks.remove(path)
+    results["remove_us"] = (time.perf_counter() - start) / max(1, len(victims)) * 1e6
+    return results
+
+
+def bench_treeview(rows):
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+    except Exception as e:
+        return {"skipped": str(e)}
+    try:
+        root.withdraw()
+        tree = ttk.Treeview(root, columns=("filename", "duration"), show="headings")
+        start = time.perf_counter()
+        for i in range(rows):
+            tree.insert("", "end", values=(f"track{i:06d}.mp3", "00:03:00"))
+        elapsed = time.perf_counter() - start
+        return {"rows": rows, "us_per_row": elapsed / rows * 1e6}
+    finally:
+        root.destroy()
+
+
+def bench_startup(runs, budget_ms, workdir):
+    # 启动预算以 ready_ms 的中位数为准: 从导入到引擎 (或窗口) 可用，不含解释器自身启动
+    home = os.path.join(workdir, "home")
+    os.makedirs(home, exist_ok=True)
+    results = {"budget_ms": budget_ms}
+    for name, code in (("engine", ENGINE_STARTUP_CODE), ("gui", GUI_STARTUP_CODE)):
+        report = measure_startup(code % (DEFERRED_MODULES,), runs, home)
+        if "ready_ms" in report:
+            report["within_budget"] = report["ready_ms"]["p50"] <= budget_ms and not report["deferred_loaded"]
+        results[name] = report
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="定时音乐播放器性能基准 (无需音频设备)")
+    parser.add_argument("--files", type=int, default=1000, help="合成曲库的文件数量")
+    parser.add_argument("--track-seconds", type=float, default=5.0, help="每个合成文件的时长")
+    parser.add_argument("--probe-files", type=int, default=200, help="每种格式测试解析的文件数")
+    parser.add_argument("--tasks", default="10,100,1000,10000,100000", help="调度器测试的任务数量，逗号分隔")
+    parser.add_argument("--fire", type=int, default=200, help="测量触发延迟的任务数")
+    parser.add_argument("--tree-rows", type=int, default=10000, help="Treeview 插入测试的行数")
+    parser.add_argument("--list-tracks", type=int, default=100000, help="曲目列表模型测试的曲目数")
+    parser.add_argument("--sim-days", type=float, default=7.0, help="虚拟时钟模拟的天数")
+    parser.add_argument("--loudness-files", type=int, default=16, help="响度分析测试的文件数")
+    parser.add_argument("--loudness-seconds", type=float, default=20.0, help="响度分析测试每个文件的时长")
+    parser.add_argument("--library", help="使用已有的合成曲库目录，不重新生成")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--startup-runs", type=int, default=5, help="启动耗时测量次数")
+    parser.add_argument("--startup-budget-ms", type=float, default=150.0, help="启动耗时预算 (毫秒)")
+    parser.add_argument("--check-budget", action="store_true", help="启动超出预算时以非零状态退出")
+    parser.add_argument("--only", default="startup,probe,scan,loudness,scheduler,conflicts,simulation,tracklist,treeview", help="只运行指定的测试，逗号分隔")
+    args = parser.parse_args(argv)
+    only = set(args.only.split(","))
+
+    workdir = tempfile.mkdtemp(prefix="music_timer_bench_")
+    try:
+        library = args.library
+        if library is None:
+            library = os.path.join(workdir, "library")
+            start = time.perf_counter()
+            paths = generate_library(library, args.files, args.track_seconds)
+            generate_seconds = time.perf_counter() - start
+        else:
+            paths = [e for e in music_engine.walk_music_folder(library)]
+            generate_seconds = 0.0
+
+        report = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": vars(args),
+            "library": {"files": len(paths), "generate_seconds": generate_seconds},
+            "results": {},
+        }
+        if "startup" in only:
+            report["results"]["startup"] = bench_startup(args.startup_runs, args.startup_budget_ms, workdir)
+        if "probe" in only:
+            report["results"]["probe"] = bench_probe(paths, args.probe_files)
+        if "scan" in only:
+            report["results"]["scan"] = bench_scan(library, workdir)
+        if "loudness" in only:
+            report["results"]["loudness"] = bench_loudness(workdir, args.loudness_files, args.loudness_seconds)
+        if "scheduler" in only:
+            counts = [int(n) for n in args.tasks.split(",") if n]
+            report["results"]["scheduler"] = bench_scheduler(counts, args.fire)
+        if "conflicts" in only:
+            counts = [int(n) for n in args.tasks.split(",") if n]
+            report["results"]["conflicts"] = bench_conflicts(counts)
+        if "simulation" in only:
+            report["results"]["simulation"] = bench_simulation(args.sim_days)
+        if "tracklist" in only:
+            report["results"]["tracklist"] = bench_track_list(args.list_tracks)
+        if "treeview" in only:
+            report["results"]["treeview"] = bench_treeview(args.tree_rows)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    
+    startup = report["results"].get("startup", {})
+    if args.check_budget and any(not r.get("within_budget", True) for r in startup.values() if isinstance(r, dict)):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
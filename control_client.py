@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import http.client
+from control_server import DEFAULT_CONTROL_HOST
+
+
+class ControlClientError(Exception):
+    def __init__(self, status, message, errors=None):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.errors = errors or []
+
+
+class ControlClient:
+    # 控制接口的同步客户端，只用标准库，供脚本批量管理或离线自测
+    def __init__(self, port, host=DEFAULT_CONTROL_HOST, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        # 复用长连接，服务端关闭了连接时重连一次
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = json.loads(response.read() or b"null")
+                break
+            except (ConnectionError, http.client.RemoteDisconnected, http.client.BadStatusLine):
+                self.close()
+                if attempt:
+                    raise
+        if response.status >= 400:
+            raise ControlClientError(response.status, data.get('error'), data.get('errors'))
+        return data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def status(self):
+        return self.request('GET', '/status')
+
+    def tasks(self):
+        return self.request('GET', '/tasks')['tasks']
+
+    def add_task(self, time=None, duration="00:10:00", repeat="once", date=None, cron=None, exclude=None,
+                 policy=None, sound=None):
+        record = {'time': time, 'duration': duration, 'repeat': repeat, 'date': date, 'cron': cron,
+                  'exclude': exclude, 'policy': policy, 'sound': sound}
+        return self.add_tasks([record])[0]
+
+    def add_tasks(self, records):
+        return self.request('POST', '/tasks', list(records))['tasks']
+
+    def delete_task(self, task_id):
+        return self.request('DELETE', f'/tasks/{task_id}')['removed']
+
+    def delete_tasks(self, task_ids):
+        return self.request('POST', '/tasks/delete', {'ids': list(task_ids)})['removed']
+
+    def play(self, duration):
+        return self.request('POST', '/play', {'duration': duration})
+
+    def stop(self):
+        return self.request('POST', '/stop')
+
+    def resume(self):
+        return self.request('POST', '/resume')
+
+    def set_volume(self, volume):
+        return self.request('POST', '/volume', {'volume': volume})['volume']
+
+    def events(self):
+        # 逐个产出 {'event': ..., 'data': ...}，第一条是当前状态；使用单独的连接
+        conn = http.client.HTTPConnection(self.host, self.port)
+        try:
+            conn.request('GET', '/events')
+            response = conn.getresponse()
+            if response.status != 200:
+                raise ControlClientError(response.status, response.read().decode('utf-8', 'replace'))
+            while True:
+                line = response.readline()
+                if not line:
+                    return
+                yield json.loads(line)
+        finally:
+            conn.close()
+
+
+def selftest():
+    # 在临时目录里启动一个引擎和控制接口，走一遍全部接口，不需要音乐文件和音频设备
+    from music_engine import MusicTimerEngine, TrackCache, ScheduleStore
+    from control_server import ControlServer
+
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = MusicTimerEngine(track_cache=TrackCache(os.path.join(workdir, "track_cache.db")),
+                                  schedule_store=ScheduleStore(os.path.join(workdir, "schedule.db")))
+        engine.start()
+        server = ControlServer(engine)
+        server.start()
+        client = ControlClient(server.port)
+        received = []
+        stream_ready = threading.Event()
+
+        def watch():
+            for event in client.events():
+                received.append(event['event'])
+                stream_ready.set()
+                if event['event'] == 'task_removed':
+                    return
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        try:
+            stream_ready.wait(5)
+            checks = []
+            checks.append(("status", client.status()['is_playing'] is False))
+            added = client.add_tasks([{'time': '08:00:00', 'duration': '00:05:00'},
+                                      {'time': '09:00:00', 'duration': '00:05:00', 'repeat': 'weekdays'},
+                                      {'duration': '00:01:00', 'repeat': 'cron', 'cron': '0 12 * * *'},
+                                      {'time': '08:02:00', 'duration': '00:01:00', 'policy': 'mix'}])
+            checks.append(("bulk add", len(added) == 4))
+            try:
+                client.add_tasks([{'time': '08:00:00', 'duration': '00:05:00'}, {'time': '25:00:00'}])
+                checks.append(("reject invalid", False))
+            except ControlClientError as e:
+                checks.append(("reject invalid", e.status == 400 and len(e.errors) == 1))
+            checks.append(("list", {task['id'] for task in client.tasks()} == {task['id'] for task in added}))
+            checks.append(("delete", client.delete_task(added[0]['id']) == [added[0]['id']]))
+            checks.append(("bulk delete", client.delete_tasks([task['id'] for task in added]) ==
+                           [task['id'] for task in added[1:]]))
+            checks.append(("volume", client.set_volume(35) == 35))
+            try:
+                client.play("00:00:10")
+                checks.append(("play without library", False))
+            except ControlClientError as e:
+                checks.append(("play without library", e.status == 409))
+            checks.append(("stop", client.stop()['is_playing'] is False))
+            try:
+                client.request('POST', '/play', ["00:00:10"])
+                checks.append(("reject non-object body", False))
+            except ControlClientError as e:
+                checks.append(("reject non-object body", e.status == 400))
+            watcher.join(5)
+            checks.append(("events", 'tasks_added' in received and 'task_removed' in received))
+            checks.append(("conflict", 'task_conflict' in received and added[3]['policy'] == 'mix'))
+
+            # 仍有事件流订阅和空闲长连接时服务也能停止
+            subscriber = threading.Thread(target=lambda: list(ControlClient(server.port).events()), daemon=True)
+            subscriber.start()
+            client.status()
+            for _ in range(50):
+                if server.streams:
+                    break
+                time.sleep(0.1)
+            subscribed = bool(server.streams)
+            stopper = threading.Thread(target=server.stop, daemon=True)
+            stopper.start()
+            stopper.join(5)
+            checks.append(("stop with open connections", subscribed and not stopper.is_alive()))
+        finally:
+            client.close()
+            server.stop()
+            engine.shutdown()
+    for name, ok in checks:
+        print(f"{'通过' if ok else '失败'}: {name}")
+    return 0 if all(ok for _, ok in checks) else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="定时音乐播放器控制接口客户端")
+    parser.add_argument("--host", default=DEFAULT_CONTROL_HOST)
+    parser.add_argument("--port", type=int, help="控制接口端口")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="查看播放状态")
+    commands.add_parser("tasks", help="列出待执行的任务")
+    add = commands.add_parser("add", help="从 JSON 文件 (对象数组) 批量添加任务")
+    add.add_argument("file")
+    delete = commands.add_parser("delete", help="删除任务")
+    delete.add_argument("ids", type=int, nargs="+")
+    play = commands.add_parser("play", help="立即播放")
+    play.add_argument("duration", metavar="H:M:S")
+    commands.add_parser("stop", help="停止播放")
+    commands.add_parser("resume", help="从上次中断的位置继续播放")
+    volume = commands.add_parser("volume", help="设置音量")
+    volume.add_argument("volume", type=float)
+    commands.add_parser("events", help="持续输出播放和任务事件")
+    commands.add_parser("selftest", help="在临时环境中启动服务并测试全部接口")
+    args = parser.parse_args(argv)
+
+    if args.command == "selftest":
+        return selftest()
+    if args.port is None:
+        parser.error("需要指定 --port")
+    client = ControlClient(args.port, args.host)
+    try:
+        if args.command == "add":
+            with open(args.file, encoding="utf-8") as f:
+                result = client.add_tasks(json.load(f))
+        elif args.command == "delete":
+            result = client.delete_tasks(args.ids)
+        elif args.command == "play":
+            result = client.play(args.duration)
+        elif args.command == "volume":
+            result = client.set_volume(args.volume)
+        elif args.command == "events":
+            for event in client.events():
+                print(json.dumps(event, ensure_ascii=False), flush=True)
+            return 0
+        else:
+            result = getattr(client, args.command)()
+    except ControlClientError as e:
+        print(e, file=sys.stderr)
+        for error in e.errors:
+            print(f"  第 {error['index'] + 1} 项: {error['error']}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        client.close()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
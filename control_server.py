@@ -0,0 +1,361 @@
+import os
+import json
+import asyncio
+import datetime
+import threading
+from music_engine import RecurrenceRule, TIME_FORMAT, parse_duration
+from schedule_io import parse_record
+
+
+DEFAULT_CONTROL_HOST = "127.0.0.1"
+MAX_REQUEST_BODY = 16 * 1024 * 1024
+# 事件流客户端积压超过这个数量时断开，由客户端重新连接
+EVENT_QUEUE_LIMIT = 1000
+HTTP_REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error",
+}
+
+
+class ControlError(Exception):
+    def __init__(self, status, message, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors
+
+    def payload(self):
+        payload = {'error': str(self)}
+        if self.errors:
+            payload['errors'] = self.errors
+        return payload
+
+
+def task_payload(task):
+    return {'id': task['id'], 'date': task['date'], 'time': task['time'], 'duration': task['duration'],
+            'duration_seconds': task['duration_seconds'], 'repeat': task['repeat'],
+            'rule': task['rule'].to_dict() if task['rule'] is not None else None, 'status': task['status'],
+            'policy': task['policy'], 'sound': task['sound']}
+
+
+def json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(TIME_FORMAT)
+    if isinstance(value, RecurrenceRule):
+        return value.to_dict()
+    return str(value)
+
+
+def event_payload(event, data):
+    data = dict(data)
+    if data.get('task') is not None:
+        data['task'] = task_payload(data['task'])
+    if data.get('tasks') is not None:
+        data['tasks'] = [task_payload(task) for task in data['tasks']]
+    return {'event': event, 'data': data}
+
+
+def encode_json(payload):
+    return json.dumps(payload, ensure_ascii=False, default=json_default).encode('utf-8')
+
+
+class ControlServer:
+    # 本机 HTTP/JSON 控制接口，在独立线程的 asyncio 事件循环中运行，不占用 Tk 主循环。
+    # 调用引擎的操作放到线程池中执行，GET /events 以每行一个 JSON 的形式推送引擎事件
+    def __init__(self, engine, port=0, host=DEFAULT_CONTROL_HOST):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.thread = None
+        self.stopping = None
+        self.ready = threading.Event()
+        self.error = None
+        self.streams = set()
+        self.connections = set()
+        self.playback_lock = threading.Lock()
+        self.routes = {
+            ('GET', '/status'): self.get_status,
+            ('GET', '/tasks'): self.list_tasks,
+            ('POST', '/tasks'): self.add_tasks,
+            ('POST', '/tasks/delete'): self.delete_tasks,
+            ('POST', '/play'): self.play,
+            ('POST', '/stop'): self.stop_playback,
+            ('POST', '/resume'): self.resume,
+            ('POST', '/volume'): self.set_volume,
+        }
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        # 端口绑定完成后才返回，绑定失败时在调用线程抛出
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        self.engine.subscribe(self.on_engine_event)
+
+    def stop(self):
+        self.engine.unsubscribe(self.on_engine_event)
+        if self.thread is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.stopping.set)
+            self.thread.join()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.serve())
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+        finally:
+            self.loop.close()
+
+    async def serve(self):
+        self.stopping = asyncio.Event()
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        async with server:
+            await self.stopping.wait()
+            # 先结束事件流和空闲的长连接: Python 3.12 起退出 async with 时要等全部连接关闭
+            server.close()
+            for queue in list(self.streams):
+                queue.put_nowait(None)
+            for task in list(self.connections):
+                task.cancel()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+
+    def on_engine_event(self, event, data):
+        # 由发出事件的线程调用: 在这里就序列化，之后任务内容再变化也不影响已发出的事件
+        if not self.streams:
+            return
+        line = encode_json(event_payload(event, data)) + b"\n"
+        try:
+            self.loop.call_soon_threadsafe(self.publish, line)
+        except RuntimeError:
+            pass
+
+    def publish(self, line):
+        for queue in list(self.streams):
+            if queue.qsize() >= EVENT_QUEUE_LIMIT:
+                self.streams.discard(queue)
+                queue.put_nowait(None)
+            else:
+                queue.put_nowait(line)
+
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except ControlError as e:
+                    await self.send_json(writer, e.status, e.payload(), keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if method == 'GET' and path.rstrip('/') == '/events':
+                    await self.stream_events(writer)
+                    break
+                status, payload = await self.dispatch(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.send_json(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split()
+        except ValueError:
+            raise ControlError(400, "请求行格式错误")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise ControlError(400, "Content-Length 格式错误")
+        if length > MAX_REQUEST_BODY:
+            raise ControlError(413, "请求内容过大")
+        body = await reader.readexactly(length) if length > 0 else b""
+        return method.upper(), target.split('?', 1)[0], headers, body
+
+    def route(self, method, path):
+        parts = [part for part in path.split('/') if part]
+        if len(parts) == 2 and parts[0] == 'tasks' and parts[1] != 'delete':
+            if method != 'DELETE':
+                raise ControlError(405, f"{path} 不支持 {method}")
+            try:
+                return self.delete_task, (int(parts[1]),)
+            except ValueError:
+                raise ControlError(404, f"没有编号为 {parts[1]} 的任务")
+        path = '/' + '/'.join(parts)
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(known == path for _, known in self.routes):
+                raise ControlError(405, f"{path} 不支持 {method}")
+            raise ControlError(404, f"未知的接口: {path}")
+        return handler, ()
+
+    async def dispatch(self, method, path, body):
+        try:
+            handler, args = self.route(method, path)
+            try:
+                data = json.loads(body) if body else None
+            except ValueError:
+                raise ControlError(400, "请求内容不是有效的 JSON")
+            return await self.loop.run_in_executor(None, handler, data, *args)
+        except ControlError as e:
+            return e.status, e.payload()
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+    async def send_json(self, writer, status, payload, keep_alive=True):
+        body = encode_json(payload)
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                "Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def stream_events(self, writer):
+        # 先发送一次当前状态，之后逐行推送引擎事件，直到客户端断开或服务停止
+        queue = asyncio.Queue()
+        self.streams.add(queue)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: application/x-ndjson; charset=utf-8\r\n"
+                         b"Cache-Control: no-cache\r\n"
+                         b"Connection: close\r\n\r\n")
+            writer.write(encode_json({'event': 'status', 'data': self.status()}) + b"\n")
+            await writer.drain()
+            while True:
+                line = await queue.get()
+                if line is None:
+                    break
+                writer.write(line)
+                await writer.drain()
+        finally:
+            self.streams.discard(queue)
+
+    def status(self):
+        engine = self.engine
+        task = engine.current_task
+        return {
+            'is_playing': engine.is_playing,
+            'current_file': engine.current_file if engine.is_playing else "",
+            'remaining_seconds': engine.current_remaining,
+            'total_duration': engine.total_duration if engine.is_playing else 0,
+            'volume': round(engine.player.current_volume * 100),
+            'task': task_payload(task) if task is not None else None,
+            'task_count': len(engine.tasks),
+            'queued_tasks': [task['id'] for task in list(engine.waiting)],
+            'overlay_tasks': [task['id'] for task, _ in list(engine.overlays.values())],
+            'library_folder': engine.library_folder,
+            'track_count': len(engine.music_files),
+            'last_track_gap': engine.last_track_gap,
+        }
+
+    def get_status(self, data):
+        return 200, self.status()
+
+    def list_tasks(self, data):
+        return 200, {'tasks': [task_payload(task) for task in self.engine.list_tasks()]}
+
+    def add_tasks(self, data):
+        # 单个对象或对象数组，字段与导入文件相同；全部校验通过才添加
+        records = data if isinstance(data, list) else [data]
+        if data is None or not records:
+            raise ControlError(400, "缺少任务内容")
+        now = datetime.datetime.now()
+        entries = []
+        errors = []
+        for index, record in enumerate(records):
+            try:
+                entries.append(parse_record(record, now))
+            except ValueError as e:
+                errors.append({'index': index, 'error': str(e)})
+        if errors:
+            raise ControlError(400, f"{len(errors)} 处错误，未添加任何任务", errors)
+        tasks = self.engine.add_tasks(entries)
+        # conflicts: 与已有任务播放时间重叠的新任务 {编号: [重叠的任务编号]}
+        conflicts = {}
+        for task in tasks:
+            task_conflicts = self.engine.task_conflicts(task)
+            if task_conflicts:
+                conflicts[task['id']] = task_conflicts
+        return 201, {'tasks': [task_payload(task) for task in tasks], 'conflicts': conflicts}
+
+    def delete_task(self, data, task_id):
+        if not self.engine.remove_tasks([task_id]):
+            raise ControlError(404, f"没有编号为 {task_id} 的待执行任务")
+        return 200, {'removed': [task_id]}
+
+    def delete_tasks(self, data):
+        ids = data.get('ids') if isinstance(data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(task_id, int) for task_id in ids):
+            raise ControlError(400, "ids 必须是任务编号的数组")
+        removed = self.engine.remove_tasks(ids)
+        return 200, {'removed': [task['id'] for task in removed]}
+
+    def play(self, data):
+        if data is not None and not isinstance(data, dict):
+            raise ControlError(400, "请求内容必须是 JSON 对象")
+        try:
+            duration_seconds = parse_duration((data or {}).get('duration'))
+        except ValueError as e:
+            raise ControlError(400, str(e))
+        with self.playback_lock:
+            if not self.engine.music_files:
+                raise ControlError(409, "曲库为空，请先扫描音乐文件夹")
+            if self.engine.is_playing:
+                raise ControlError(409, "音乐正在播放中")
+            self.engine.start_playback(duration_seconds)
+        return 200, self.status()
+
+    def stop_playback(self, data):
+        # 同时停止叠加播放，排队中的任务不再播放
+        self.engine.stop_all()
+        return 200, self.status()
+
+    def resume(self, data):
+        with self.playback_lock:
+            if not self.engine.resume_session():
+                raise ControlError(409, "没有可以继续的播放，或正在播放中")
+        return 200, self.status()
+
+    def set_volume(self, data):
+        volume = (data or {}).get('volume') if isinstance(data, dict) else None
+        if isinstance(volume, bool) or not isinstance(volume, (int, float)) or not 0 <= volume <= 100:
+            raise ControlError(400, "volume 必须是 0-100 的数字")
+        self.engine.set_volume(volume / 100.0)
+        return 200, {'volume': round(self.engine.player.current_volume * 100)}
+
+
+def start_control_from_env(engine, environ=None):
+    # 图形界面通过环境变量 MUSIC_TIMER_CONTROL_PORT 开启控制接口，未设置时返回 None
+    environ = os.environ if environ is None else environ
+    port = environ.get("MUSIC_TIMER_CONTROL_PORT")
+    if not port:
+        return None
+    server = ControlServer(engine, int(port), environ.get("MUSIC_TIMER_CONTROL_HOST", DEFAULT_CONTROL_HOST))
+    server.start()
+    return server
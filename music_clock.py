@@ -0,0 +1,165 @@
+import math
+import time
+import datetime
+import threading
+
+
+class SystemClock:
+    # 真实时钟，调度器和播放线程默认使用
+    def monotonic(self):
+        return time.monotonic()
+
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def event(self):
+        return threading.Event()
+
+    def condition(self):
+        return threading.Condition()
+
+    def thread(self, target, args=()):
+        return threading.Thread(target=target, args=args, daemon=True)
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+class SimulatedEvent:
+    def __init__(self, clock):
+        self.clock = clock
+        self.flag = False
+
+    def is_set(self):
+        return self.flag
+
+    def set(self):
+        with self.clock.cond:
+            self.flag = True
+            self.clock.cond.notify_all()
+
+    def clear(self):
+        with self.clock.cond:
+            self.flag = False
+
+    def wait(self, timeout=None):
+        return self.clock.wait_for(self.is_set, timeout)
+
+
+class SimulatedCondition:
+    # 只实现调度器用到的 with / wait / notify；wait 前后须持有锁
+    def __init__(self, clock):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def __enter__(self):
+        self.lock.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.lock.release()
+        return False
+
+    def notify(self, n=1):
+        with self.clock.cond:
+            self.generation += 1
+            self.clock.cond.notify_all()
+
+    notify_all = notify
+
+    def wait(self, timeout=None):
+        generation = self.generation
+        self.lock.release()
+        try:
+            return self.clock.wait_for(lambda: self.generation != generation, timeout)
+        finally:
+            self.lock.acquire()
+
+
+class SimulatedClock:
+    # 虚拟时钟: 通过 thread() 创建的线程都停在时钟的等待上 (或已退出) 时，
+    # advance() 才把时间直接跳到最早的唤醒时刻，一周的调度可以在几秒内跑完
+    def __init__(self, start=None):
+        self.start = start if start is not None else datetime.datetime.now().replace(microsecond=0)
+        self.epoch = self.start.timestamp()
+        self.current = 0.0
+        self.cond = threading.Condition()
+        self.active = 0
+        self.waiters = []
+
+    def monotonic(self):
+        return self.current
+
+    def time(self):
+        return self.epoch + self.current
+
+    def now(self):
+        return self.start + datetime.timedelta(seconds=self.current)
+
+    def event(self):
+        return SimulatedEvent(self)
+
+    def condition(self):
+        return SimulatedCondition(self)
+
+    def thread(self, target, args=()):
+        # 创建时就计为活动线程，避免线程还没开始运行时时间被推进
+        with self.cond:
+            self.active += 1
+
+        def run():
+            try:
+                target(*args)
+            finally:
+                with self.cond:
+                    self.active -= 1
+                    self.cond.notify_all()
+
+        return threading.Thread(target=run, daemon=True)
+
+    def wait_for(self, predicate, timeout=None):
+        with self.cond:
+            if predicate():
+                return True
+            waiter = (predicate, self.current + timeout if timeout is not None else math.inf)
+            self.waiters.append(waiter)
+            self.active -= 1
+            self.cond.notify_all()
+            try:
+                while not predicate() and self.current < waiter[1]:
+                    self.cond.wait()
+            finally:
+                self.waiters.remove(waiter)
+                self.active += 1
+            return predicate()
+
+    def sleep(self, seconds):
+        self.wait_for(lambda: False, seconds)
+
+    def idle(self):
+        return self.active <= 0 and not any(predicate() or deadline <= self.current
+                                            for predicate, deadline in self.waiters)
+
+    def settle(self):
+        # 等所有线程都停在时钟上或已退出，不推进时间
+        with self.cond:
+            while not self.idle():
+                self.cond.wait()
+
+    def advance(self, until=None):
+        # 等所有线程都停下后推进到最早的唤醒时刻 (不超过 until)；没有可推进的时刻时返回 False
+        with self.cond:
+            while not self.idle():
+                self.cond.wait()
+            target = min((deadline for _, deadline in self.waiters), default=math.inf)
+            if until is not None:
+                target = min(target, until)
+            if target == math.inf or target <= self.current:
+                return False
+            self.current = target
+            self.cond.notify_all()
+            return True
@@ -0,0 +1,2051 @@
+import os
+import time
+import threading
+import datetime
+import sqlite3
+import json
+import bisect
+import heapq
+import itertools
+import random
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from music_metrics import metrics
+from music_clock import SYSTEM_CLOCK
+from audio_probe import probe_header
+from audio_loudness import loudness_available, analyze_track, create_pool, LOUDNESS_WORKERS
+
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".music_timer")
+SCAN_WORKERS = min(16, (os.cpu_count() or 1) * 4)
+SCAN_BATCH_SIZE = 200
+SCAN_BATCH_INTERVAL = 0.2
+SUPPORTED_EXTENSIONS = ('.mp3', '.flac', '.wav')
+MISSED_GRACE_SECONDS = 300
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+GAP_HISTORY = 100
+TRACK_END_RECHECK = 0.05
+MAX_PLAYBACK_WAIT = 30
+MAX_SCHEDULER_SLEEP = 60
+CLOCK_JUMP_TOLERANCE = 1.0
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+MIXER_INIT_ATTEMPTS = 5
+PREROLL_SECONDS = 5.0
+PREROLL_WARM_TRACKS = 2
+PREROLL_WARM_BYTES = 256 * 1024
+MIXER_RETRY_DELAY = 1.0
+SESSION_CHECKPOINT_SECONDS = 10.0
+TASK_BATCH_SIZE = 500
+LOUDNESS_BATCH_SIZE = 50
+# 任务到点时已有播放在进行: 排队等它结束、打断它、跳过本次，或在混音通道上叠加播放
+CONFLICT_POLICIES = {'queue': "排队", 'preempt': "抢占", 'skip': "跳过", 'mix': "叠加"}
+DEFAULT_POLICY = 'queue'
+
+# pygame 和 mutagen 导入较慢，推迟到第一次播放或解析时再导入
+AUDIO_READERS = None
+
+
+def audio_readers():
+    global AUDIO_READERS
+    if AUDIO_READERS is None:
+        from mutagen.mp3 import MP3
+        from mutagen.flac import FLAC
+        from mutagen.wave import WAVE
+        AUDIO_READERS = {'mp3': MP3, 'flac': FLAC, 'wav': WAVE}
+    return AUDIO_READERS
+
+
+def probe_music_info(file_path):
+    # 先只读文件头求时长，不行再用 mutagen 完整解析；返回 (时长, 解析方式)，无法解析时返回 (None, None)
+    audio_format = os.path.splitext(file_path)[1].lower().lstrip('.')
+    try:
+        with metrics.timer('probe', format=audio_format):
+            result = probe_header(file_path, audio_format)
+            if result is None:
+                reader = audio_readers().get(audio_format)
+                if reader is None:
+                    return None, None
+                result = reader(file_path).info.length, 'mutagen'
+        metrics.incr('probe_path', format=audio_format, path=result[1])
+        return round(result[0], 3), result[1]
+    except Exception:
+        metrics.incr('probe_errors', format=audio_format)
+        return None, None
+
+
+def probe_music_duration(file_path):
+    return probe_music_info(file_path)[0]
+
+
+def walk_music_folder(folder_path, cancel_event=None):
+    # 递归遍历，每个目录只 scandir 一次，返回 {路径: (大小, 修改时间)}
+    snapshot = {}
+    stack = [os.path.abspath(folder_path)]
+    while stack:
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.lower().endswith(SUPPORTED_EXTENSIONS) and entry.is_file():
+                    st = entry.stat()
+                    snapshot[entry.path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+        stack.extend(reversed(subdirs))
+    return snapshot
+
+
+def diff_snapshots(old, new):
+    added = [path for path in new if path not in old]
+    removed = [path for path in old if path not in new]
+    modified = [path for path, key in new.items() if path in old and old[path] != key]
+    return added, removed, modified
+
+
+class TrackList:
+    # 按播放顺序保存曲目路径的数组。删除只留空位，用树状数组 (Fenwick) 统计每个位置之前的曲目数，
+    # 按序号取曲目、求曲目序号、删除和相邻交换都是 O(log n)；空位超过一半时整体压缩
+    def __init__(self, paths=()):
+        self.rebuild(list(paths))
+    
+    def rebuild(self, paths):
+        self.slots = paths
+        self.slot_of = {path: slot for slot, path in enumerate(paths)}
+        self.count = len(paths)
+        self.tree = [0] * (len(paths) + 1)
+        for i in range(1, len(paths) + 1):
+            self.tree[i] += 1
+            parent = i + (i & -i)
+            if parent <= len(paths):
+                self.tree[parent] += self.tree[i]
+    
+    def __len__(self):
+        return self.count
+    
+    def __iter__(self):
+        return (path for path in self.slots if path is not None)
+    
+    def __contains__(self, path):
+        return path in self.slot_of
+    
+    def prefix(self, slot):
+        # 位置 slot 之前 (不含) 的曲目数
+        total = 0
+        while slot > 0:
+            total += self.tree[slot]
+            slot -= slot & -slot
+        return total
+    
+    def add(self, slot, delta):
+        i = slot + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+    
+    def find_slot(self, index):
+        # 第 index 首 (从 0 开始) 所在的位置
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("曲目序号超出范围")
+        slot = 0
+        remaining = index + 1
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            following = slot + step
+            if following < len(self.tree) and self.tree[following] < remaining:
+                slot = following
+                remaining -= self.tree[following]
+            step >>= 1
+        return slot
+    
+    def __getitem__(self, index):
+        return self.slots[self.find_slot(index)]
+    
+    def index(self, path):
+        slot = self.slot_of.get(path)
+        if slot is None:
+            raise ValueError(f"{path} 不在曲目列表中")
+        return self.prefix(slot)
+    
+    def slice(self, start, stop):
+        start = max(0, start)
+        stop = min(stop, self.count)
+        if start >= stop:
+            return []
+        result = []
+        slot = self.find_slot(start)
+        while len(result) < stop - start:
+            path = self.slots[slot]
+            if path is not None:
+                result.append(path)
+            slot += 1
+        return result
+    
+    def append(self, path):
+        # 新节点的值是它覆盖的区间 (i - lowbit(i), i] 内的曲目数
+        slot = len(self.slots)
+        self.slots.append(path)
+        self.slot_of[path] = slot
+        i = slot + 1
+        self.tree.append(1 + self.prefix(i - 1) - self.prefix(i - (i & -i)))
+        self.count += 1
+    
+    def remove(self, path):
+        slot = self.slot_of.pop(path)
+        self.slots[slot] = None
+        self.add(slot, -1)
+        self.count -= 1
+        if self.count < len(self.slots) // 2:
+            self.rebuild(list(self))
+    
+    def swap(self, index, other):
+        slot, other_slot = self.find_slot(index), self.find_slot(other)
+        path, other_path = self.slots[slot], self.slots[other_slot]
+        self.slots[slot], self.slots[other_slot] = other_path, path
+        self.slot_of[path], self.slot_of[other_path] = other_slot, slot
+
+
+class PlayPlan:
+    # 一次播放会话的曲目顺序和各曲目在会话中的起始偏移 (前缀和)，
+    # 由已播放的时长二分查找所在曲目和曲内位置
+    def __init__(self, tracks=()):
+        self.paths = []
+        self.durations = []
+        self.offsets = []
+        self.total = 0.0
+        for path, duration in tracks:
+            self.paths.append(path)
+            self.durations.append(duration)
+            self.offsets.append(self.total)
+            self.total += duration
+    
+    def __len__(self):
+        return len(self.paths)
+    
+    def locate(self, elapsed):
+        # 返回 (曲目序号, 曲内偏移秒数)，超出计划总长时返回 None
+        elapsed = max(0.0, elapsed)
+        if elapsed >= self.total:
+            return None
+        index = bisect.bisect_right(self.offsets, elapsed) - 1
+        return index, elapsed - self.offsets[index]
+
+
+class TrackCache:
+    # 以 (路径, 大小, 修改时间) 为键的时长缓存，文件未变化时不再重复解析
+    FLUSH_THRESHOLD = 500
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            db_path = os.path.join(CACHE_DIR, "track_cache.db")
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.pending = []
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tracks ("
+                          "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, duration REAL)")
+        # 响度分析结果单独一张表，同样以大小和修改时间判断文件是否变化
+        self.conn.execute("CREATE TABLE IF NOT EXISTS loudness ("
+                          "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, loudness REAL, gain REAL)")
+        # 旧版本缓存的是取整后的秒数，升级时清空重新解析
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            self.conn.execute("DELETE FROM tracks")
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.commit()
+
+    @staticmethod
+    def _prefix_range(folder_path):
+        prefix = os.path.join(os.path.abspath(folder_path), "")
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def preload(self, folder_path):
+        low, high = self._prefix_range(folder_path)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, size, mtime_ns, duration FROM tracks WHERE path >= ? AND path < ?",
+                (low, high)).fetchall()
+            for path, size, mtime_ns, duration in rows:
+                self.entries[path] = (size, mtime_ns, duration)
+
+    def get_duration(self, file_path, probe=probe_music_duration, key=None):
+        path = os.path.abspath(file_path)
+        if key is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            key = (st.st_size, st.st_mtime_ns)
+
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                row = self.conn.execute(
+                    "SELECT size, mtime_ns, duration FROM tracks WHERE path = ?", (path,)).fetchone()
+                if row is not None:
+                    entry = self.entries[path] = tuple(row)
+            if entry is not None and entry[:2] == key:
+                return entry[2]
+
+        duration = probe(path)
+
+        with self.lock:
+            self.entries[path] = key + (duration,)
+            self.pending.append((path,) + key + (duration,))
+            if len(self.pending) >= self.FLUSH_THRESHOLD:
+                self._flush_locked()
+        return duration
+
+    def load_gains(self, folder_path):
+        # 该文件夹下已分析过的 {路径: (大小, 修改时间, 增益 dB)}
+        low, high = self._prefix_range(folder_path)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, size, mtime_ns, gain FROM loudness WHERE path >= ? AND path < ?",
+                (low, high)).fetchall()
+        return {path: (size, mtime_ns, gain) for path, size, mtime_ns, gain in rows}
+
+    def save_gains(self, rows):
+        # rows: [(路径, 大小, 修改时间, 响度, 增益 dB)]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        self.conn.executemany("INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?)", self.pending)
+        self.conn.commit()
+        self.pending = []
+
+    def evict_missing(self, folder_path, present_paths):
+        # 清理该文件夹下已不存在的文件记录
+        low, high = self._prefix_range(folder_path)
+        present = {os.path.abspath(p) for p in present_paths}
+        with self.lock:
+            self._flush_locked()
+            stale = [(path,) for (path,) in self.conn.execute(
+                "SELECT path FROM tracks WHERE path >= ? AND path < ?", (low, high))
+                if path not in present]
+            if stale:
+                self.conn.executemany("DELETE FROM tracks WHERE path = ?", stale)
+                self.conn.commit()
+                for (path,) in stale:
+                    self.entries.pop(path, None)
+            stale_gains = [(path,) for (path,) in self.conn.execute(
+                "SELECT path FROM loudness WHERE path >= ? AND path < ?", (low, high))
+                if path not in present]
+            if stale_gains:
+                self.conn.executemany("DELETE FROM loudness WHERE path = ?", stale_gains)
+                self.conn.commit()
+        return len(stale)
+
+    def close(self):
+        with self.lock:
+            self._flush_locked()
+            self.conn.close()
+
+
+def parse_dates(text):
+    try:
+        return [datetime.date.fromisoformat(part.strip())
+                for part in text.replace('，', ',').split(',') if part.strip()]
+    except ValueError:
+        raise ValueError("日期格式错误，请使用 YYYY-MM-DD 格式，多个日期用逗号分隔")
+
+
+def parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = map(int, part.split('-', 1))
+        else:
+            start = end = int(part)
+            if step != 1:
+                end = high
+        if not (low <= start <= end <= high):
+            raise ValueError
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class RecurrenceRule:
+    # 重复规则只负责计算下一次触发时间，调度器中每条规则只保留一个待触发的任务
+    KINDS = ('daily', 'weekdays', 'cron')
+    SEARCH_DAYS = 366 * 5
+    
+    def __init__(self, kind, time_parts=None, cron=None, exclude_dates=()):
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的重复类型: {kind}")
+        self.kind = kind
+        self.time_parts = tuple(time_parts) if time_parts is not None else None
+        self.cron = cron
+        self.exclude_dates = frozenset(exclude_dates)
+        
+        if kind == 'cron':
+            try:
+                fields = cron.split()
+                if len(fields) != 5:
+                    raise ValueError
+                minutes = parse_cron_field(fields[0], 0, 59)
+                hours = parse_cron_field(fields[1], 0, 23)
+                self.days = parse_cron_field(fields[2], 1, 31)
+                self.months = parse_cron_field(fields[3], 1, 12)
+                # cron 中 0 和 7 都表示周日，转换为 datetime.weekday() 的编号
+                self.weekdays = {(d - 1) % 7 for d in parse_cron_field(fields[4], 0, 7)}
+            except (ValueError, AttributeError):
+                raise ValueError("Cron 表达式格式错误，请使用 \"分 时 日 月 周\" 格式")
+            self.any_day = fields[2] == '*'
+            self.any_weekday = fields[4] == '*'
+            self.day_minutes = sorted(h * 60 + m for h in hours for m in minutes)
+        elif self.time_parts is None:
+            raise ValueError("缺少播放时间")
+    
+    @classmethod
+    def from_dict(cls, data):
+        time_parts = tuple(map(int, data['time'].split(':'))) if data.get('time') else None
+        exclude_dates = [datetime.date.fromisoformat(d) for d in data.get('exclude', [])]
+        return cls(data['kind'], time_parts, data.get('cron'), exclude_dates)
+    
+    def to_dict(self):
+        data = {'kind': self.kind}
+        if self.time_parts is not None:
+            data['time'] = "%02d:%02d:%02d" % self.time_parts
+        if self.cron is not None:
+            data['cron'] = self.cron
+        if self.exclude_dates:
+            data['exclude'] = sorted(d.isoformat() for d in self.exclude_dates)
+        return data
+    
+    def describe(self):
+        if self.kind == 'daily':
+            text = "每天"
+        elif self.kind == 'weekdays':
+            text = "工作日"
+        else:
+            text = f"Cron: {self.cron}"
+        if self.exclude_dates:
+            text += f" (排除 {len(self.exclude_dates)} 天)"
+        return text
+    
+    def day_matches(self, day):
+        if day in self.exclude_dates:
+            return False
+        if self.kind == 'weekdays':
+            return day.weekday() < 5
+        if self.kind == 'cron':
+            if day.month not in self.months:
+                return False
+            # 与 cron 一致: 日和周都有限制时满足其一即可
+            day_ok = day.day in self.days
+            weekday_ok = day.weekday() in self.weekdays
+            if self.any_day or self.any_weekday:
+                return day_ok and weekday_ok
+            return day_ok or weekday_ok
+        return True
+    
+    def next_after(self, after):
+        # 返回严格晚于 after 的下一次触发时间，找不到时返回 None
+        day = after.date()
+        for _ in range(self.SEARCH_DAYS):
+            if self.kind == 'cron' and day.month not in self.months:
+                day = (day.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+                continue
+            if self.day_matches(day):
+                if self.kind == 'cron':
+                    index = 0
+                    if day == after.date():
+                        index = bisect.bisect_right(self.day_minutes, after.hour * 60 + after.minute)
+                    if index < len(self.day_minutes):
+                        hour, minute = divmod(self.day_minutes[index], 60)
+                        return datetime.datetime.combine(day, datetime.time(hour, minute))
+                else:
+                    candidate = datetime.datetime.combine(day, datetime.time(*self.time_parts))
+                    if candidate > after:
+                        return candidate
+            day += datetime.timedelta(days=1)
+        return None
+
+
+class ScheduleStore:
+    # 定时任务持久化 (SQLite WAL)，增删改时立即写入，重启后一次查询即可恢复
+    FINISHED_RETENTION_DAYS = 7
+    
+    def __init__(self, db_path=None):
+        if db_path is None:
+            db_path = os.path.join(CACHE_DIR, "schedule.db")
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tasks ("
+                          "id INTEGER PRIMARY KEY, target TEXT, duration_seconds INTEGER, status TEXT, rule TEXT)")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(tasks)")]
+        for column in ('rule', 'policy', 'sound'):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} TEXT")
+        # 只保留最近一次播放会话的位置，中途停止或异常退出后可以接着播放
+        self.conn.execute("CREATE TABLE IF NOT EXISTS session ("
+                          "id INTEGER PRIMARY KEY CHECK (id = 1), task_id INTEGER, folder TEXT, path TEXT, "
+                          "position REAL, plan_offset REAL, remaining REAL, duration_seconds REAL, saved_at TEXT)")
+        self.conn.commit()
+    
+    def load(self):
+        # 清理过期的已结束任务，返回其余任务 (id, 触发时间, 时长, 状态, 重复规则, 冲突策略, 叠加音频)
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=self.FINISHED_RETENTION_DAYS)
+        with self.lock:
+            self.conn.execute("DELETE FROM tasks WHERE status NOT IN ('等待中', '执行中', '排队中') AND target < ?",
+                              (cutoff.strftime(TIME_FORMAT),))
+            self.conn.commit()
+            rows = self.conn.execute(
+                "SELECT id, target, duration_seconds, status, rule, policy, sound FROM tasks ORDER BY id").fetchall()
+        return [(task_id, datetime.datetime.fromisoformat(target), duration_seconds, status,
+                 RecurrenceRule.from_dict(json.loads(rule)) if rule else None, policy or DEFAULT_POLICY, sound)
+                for task_id, target, duration_seconds, status, rule, policy, sound in rows]
+    
+    def max_id(self):
+        with self.lock:
+            row = self.conn.execute("SELECT MAX(id) FROM tasks").fetchone()
+        return row[0] or 0
+    
+    def insert(self, tasks):
+        rows = [(task['id'], task['datetime'].strftime(TIME_FORMAT), task['duration_seconds'], task['status'],
+                 json.dumps(task['rule'].to_dict()) if task['rule'] else None, task['policy'], task['sound'])
+                for task in tasks]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO tasks (id, target, duration_seconds, status, rule, "
+                                  "policy, sound) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+    
+    def update(self, tasks):
+        with self.lock:
+            self.conn.executemany("UPDATE tasks SET target = ?, status = ? WHERE id = ?",
+                                  [(task['datetime'].strftime(TIME_FORMAT), task['status'], task['id'])
+                                   for task in tasks])
+            self.conn.commit()
+    
+    def delete(self, task_ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM tasks WHERE id = ?", [(task_id,) for task_id in task_ids])
+            self.conn.commit()
+    
+    def save_session(self, state):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO session VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              (state['task_id'], state['folder'], state['path'], state['position'],
+                               state['plan_offset'], state['remaining'], state['duration_seconds'],
+                               datetime.datetime.now().strftime(TIME_FORMAT)))
+            self.conn.commit()
+    
+    def load_session(self):
+        with self.lock:
+            row = self.conn.execute("SELECT task_id, folder, path, position, plan_offset, remaining, "
+                                    "duration_seconds, saved_at FROM session WHERE id = 1").fetchone()
+        if row is None:
+            return None
+        keys = ('task_id', 'folder', 'path', 'position', 'plan_offset', 'remaining', 'duration_seconds', 'saved_at')
+        return dict(zip(keys, row))
+    
+    def clear_session(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM session")
+            self.conn.commit()
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def wall_clock_offset(clock=SYSTEM_CLOCK):
+    return clock.time() - clock.monotonic()
+
+
+class LatencyHistogram:
+    # 任务触发延迟 (目标时间到实际出声) 的分桶统计
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.lock = threading.Lock()
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def observe(self, seconds):
+        milliseconds = seconds * 1000.0
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets_ms, milliseconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+    
+    def percentile(self, fraction):
+        # 返回该分位所在桶的上限 (毫秒)，超过最大桶时返回 None
+        with self.lock:
+            target = fraction * self.count
+            seen = 0
+            for bound, count in zip(self.buckets_ms + (None,), self.counts):
+                seen += count
+                if count and seen >= target:
+                    return bound
+        return None
+    
+    def snapshot(self):
+        with self.lock:
+            cumulative = []
+            seen = 0
+            for bound, count in zip(self.buckets_ms, self.counts):
+                seen += count
+                cumulative.append((bound, seen))
+            return {
+                'count': self.count,
+                'sum_seconds': self.total,
+                'max_seconds': self.max,
+                'buckets_ms': cumulative,
+            }
+
+
+class IntervalNode:
+    __slots__ = ('key', 'end', 'priority', 'left', 'right', 'max_end')
+    
+    def __init__(self, key, end, priority):
+        self.key = key
+        self.end = end
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.max_end = end
+    
+    def update(self):
+        self.max_end = self.end
+        for child in (self.left, self.right):
+            if child is not None and child.max_end > self.max_end:
+                self.max_end = child.max_end
+
+
+class TaskIntervalIndex:
+    # 待执行任务下一次播放的时间段 [开始, 开始 + 时长) 组成的区间树: 按 (开始时间, 任务编号) 排序的 treap，
+    # 每个节点记录子树中最晚的结束时间。增删期望 O(log n)；查找重叠时跳过结束时间都不晚于 start 的子树，
+    # 每个结果最多多走 O(log n) 个节点，个别很长的任务不会让其他查询退化成线性扫描
+    def __init__(self):
+        self.root = None
+        self.spans = {}
+        self.random = random.Random()
+    
+    def __len__(self):
+        return len(self.spans)
+    
+    @staticmethod
+    def span_of(task):
+        start = task['datetime'].timestamp()
+        return start, start + task['duration_seconds']
+    
+    @classmethod
+    def split(cls, node, key):
+        # 拆成键小于 key 和不小于 key 的两棵树
+        if node is None:
+            return None, None
+        if node.key < key:
+            node.right, right = cls.split(node.right, key)
+            node.update()
+            return node, right
+        left, node.left = cls.split(node.left, key)
+        node.update()
+        return left, node
+    
+    @classmethod
+    def merge(cls, left, right):
+        # left 的键全部小于 right 的键
+        if left is None or right is None:
+            return left if right is None else right
+        if left.priority > right.priority:
+            left.right = cls.merge(left.right, right)
+            left.update()
+            return left
+        right.left = cls.merge(left, right.left)
+        right.update()
+        return right
+    
+    @classmethod
+    def delete(cls, node, key):
+        if node is None:
+            return None
+        if node.key == key:
+            return cls.merge(node.left, node.right)
+        if key < node.key:
+            node.left = cls.delete(node.left, key)
+        else:
+            node.right = cls.delete(node.right, key)
+        node.update()
+        return node
+    
+    def add(self, task):
+        self.remove(task['id'])
+        start, end = self.span_of(task)
+        key = (start, task['id'])
+        self.spans[task['id']] = key
+        left, right = self.split(self.root, key)
+        node = IntervalNode(key, end, self.random.random())
+        self.root = self.merge(self.merge(left, node), right)
+    
+    def remove(self, task_id):
+        key = self.spans.pop(task_id, None)
+        if key is not None:
+            self.root = self.delete(self.root, key)
+    
+    def clear(self):
+        self.root = None
+        self.spans = {}
+    
+    def overlapping(self, start, end, exclude=None):
+        # 与 [start, end) 重叠的任务编号，按开始时间排序
+        found = []
+        stack = [self.root] if end > start else []
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end <= start:
+                continue
+            stack.append(node.left)
+            if node.key[0] < end:
+                # 右子树的开始时间都不早于本节点，本节点已经不早于 end 时整棵右子树都不会重叠
+                stack.append(node.right)
+                if node.end > start and node.key[1] != exclude:
+                    found.append(node.key)
+        found.sort()
+        return [task_id for _, task_id in found]
+
+
+class TaskScheduler:
+    # 按触发时间排列的最小堆，空闲时在条件变量上休眠到最早的任务到期。
+    # 堆中保存单调时钟上的截止时间，系统时间跳变 (NTP 校时、夏令时) 时按任务的目标时间重新换算。
+    # 设置了 on_preroll 时每个任务先在提前 preroll_seconds 的时刻触发预备，再以原目标时间重新入堆
+    def __init__(self, on_due, on_preroll=None, preroll_seconds=0.0, clock=SYSTEM_CLOCK):
+        self.clock = clock
+        self.on_due = on_due
+        self.on_preroll = on_preroll
+        self.preroll_seconds = preroll_seconds if on_preroll is not None else 0.0
+        self.heap = []
+        self.entries = {}
+        self.cancelled_count = 0
+        self.counter = itertools.count()
+        self.condition = clock.condition()
+        self.running = False
+        self.thread = None
+        self.clock_offset = wall_clock_offset(clock)
+    
+    def deadline_of(self, task, stage='due'):
+        deadline = task['datetime'].timestamp() - self.clock_offset
+        if stage == 'preroll':
+            deadline -= self.preroll_seconds
+        return deadline
+    
+    def make_entry(self, task):
+        stage = 'preroll' if self.preroll_seconds > 0 else 'due'
+        return [self.deadline_of(task, stage), next(self.counter), task, True, stage]
+    
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = self.clock.thread(self.run)
+        self.thread.start()
+    
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+    
+    def add(self, task):
+        with self.condition:
+            previous = self.entries.get(task['id'])
+            if previous is not None:
+                previous[3] = False
+                self.cancelled_count += 1
+            entry = self.make_entry(task)
+            self.entries[task['id']] = entry
+            heapq.heappush(self.heap, entry)
+            if self.heap[0] is entry:
+                self.condition.notify()
+    
+    def add_many(self, tasks):
+        with self.condition:
+            for task in tasks:
+                entry = self.make_entry(task)
+                self.entries[task['id']] = entry
+                self.heap.append(entry)
+            heapq.heapify(self.heap)
+            self.condition.notify()
+    
+    def remove(self, task):
+        with self.condition:
+            entry = self.entries.pop(task['id'], None)
+            if entry is None:
+                return False
+            entry[3] = False
+            self.cancelled_count += 1
+            if self.cancelled_count > len(self.heap) // 2:
+                self.heap = [e for e in self.heap if e[3]]
+                heapq.heapify(self.heap)
+                self.cancelled_count = 0
+            self.condition.notify()
+            return True
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def pop_due(self, now):
+        # 返回 [(阶段, 任务)]，预备阶段到期的任务换成正式触发的条目重新入堆
+        due = []
+        while self.heap and (not self.heap[0][3] or self.heap[0][0] <= now):
+            entry = heapq.heappop(self.heap)
+            if not entry[3]:
+                self.cancelled_count -= 1
+                continue
+            task = entry[2]
+            if entry[4] == 'preroll':
+                following = [self.deadline_of(task), next(self.counter), task, True, 'due']
+                self.entries[task['id']] = following
+                heapq.heappush(self.heap, following)
+            else:
+                del self.entries[task['id']]
+                task['due_monotonic'] = entry[0]
+            due.append((entry[4], task))
+        return due
+    
+    def check_clock(self):
+        # 系统时间相对单调时钟跳变时，按新的对应关系重算全部截止时间
+        offset = wall_clock_offset(self.clock)
+        if abs(offset - self.clock_offset) <= CLOCK_JUMP_TOLERANCE:
+            return False
+        self.clock_offset = offset
+        self.heap = [e for e in self.heap if e[3]]
+        self.cancelled_count = 0
+        for entry in self.heap:
+            entry[0] = self.deadline_of(entry[2], entry[4])
+        heapq.heapify(self.heap)
+        return True
+    
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.running:
+                        return
+                    metrics.incr('scheduler_ticks')
+                    with metrics.timer('scheduler_tick'):
+                        self.check_clock()
+                        due = self.pop_due(self.clock.monotonic())
+                    if due:
+                        break
+                    # 最长休眠 MAX_SCHEDULER_SLEEP 秒，以便及时发现系统时间跳变
+                    if self.heap:
+                        delay = self.heap[0][0] - self.clock.monotonic()
+                        self.condition.wait(min(max(0.0, delay), MAX_SCHEDULER_SLEEP))
+                    else:
+                        self.condition.wait(MAX_SCHEDULER_SLEEP)
+            
+            for stage, task in due:
+                if stage == 'preroll':
+                    metrics.incr('tasks_prerolled')
+                    metrics.run(self.on_preroll, task)
+                else:
+                    metrics.incr('tasks_due')
+                    metrics.run(self.on_due, task)
+
+
+class MusicPlayer:
+    # 混音器在第一次加载曲目时才初始化，音频设备尚未就绪时按间隔重试，
+    # 仍然失败则抛出异常，下一次播放会重新尝试
+    def __init__(self, init_attempts=MIXER_INIT_ATTEMPTS, retry_delay=MIXER_RETRY_DELAY):
+        self.init_attempts = init_attempts
+        self.retry_delay = retry_delay
+        self.mixer = None
+        self.mixer_lock = threading.Lock()
+        self.loaded_path = None
+        self.current_volume = 0.7
+        # 当前曲目的响度均衡增益 (线性)，与音量相乘后设置到混音器
+        self.gain = 1.0
+        self.stop_event = threading.Event()
+        
+    def ensure_mixer(self):
+        with self.mixer_lock:
+            if self.mixer is not None:
+                return self.mixer
+            import pygame
+            with metrics.timer('mixer_init'):
+                for attempt in range(1, self.init_attempts + 1):
+                    try:
+                        pygame.mixer.init()
+                        break
+                    except pygame.error:
+                        metrics.incr('mixer_init_failures')
+                        if attempt == self.init_attempts:
+                            raise
+                        time.sleep(self.retry_delay)
+            pygame.mixer.music.set_volume(self.effective_volume())
+            self.mixer = pygame.mixer
+            return self.mixer
+        
+    def load(self, file_path, gain=1.0):
+        mixer = self.ensure_mixer()
+        with metrics.timer('player_load'):
+            self.loaded_path = None
+            mixer.music.load(file_path)
+            self.loaded_path = file_path
+            self.gain = gain
+            self.set_volume(self.current_volume)
+        
+    def warm(self, file_path):
+        # 读入文件开头，到点加载时不必等磁盘
+        with open(file_path, 'rb') as f:
+            f.read(PREROLL_WARM_BYTES)
+        
+    def play(self, start=0.0):
+        # 从 start 秒处开始播放，返回实际的起始位置；格式不支持定位时从头播放
+        with metrics.timer('player_play'):
+            music = self.ensure_mixer().music
+            if start > 0 and (self.loaded_path or '').lower().endswith('.wav'):
+                # SDL_mixer 对 WAV 只能定位到整秒，取整后记录的位置才与实际一致
+                start = float(int(start))
+            if start > 0:
+                import pygame
+                try:
+                    music.play(start=start)
+                    return start
+                except pygame.error:
+                    metrics.incr('seek_failures')
+            music.play()
+            return 0.0
+        
+    def queue(self, file_path):
+        # 当前曲目结束后由混音器直接接着播放，不再有加载间隙
+        with metrics.timer('player_queue'):
+            self.ensure_mixer().music.queue(file_path)
+            # 混音器稍后自行切换，之后加载的是哪个文件已不确定，预备好的曲目不能再直接播放
+            self.loaded_path = None
+        
+    def get_position(self):
+        # 当前曲目已播放的秒数，混音器切换到排队的曲目后从 0 重新计数
+        if self.mixer is None:
+            return 0.0
+        return max(0, self.mixer.music.get_pos()) / 1000.0
+        
+    def wait_for_track_end(self, track_length, deadline, started=None):
+        # 阻塞到当前曲目结束 (混音器空闲或已切换到排队的曲目)、到达 deadline 或被停止，
+        # 返回 'ended' / 'deadline' / 'stopped'。按混音器位置推算结束时间，只在预计结束后才短暂复查
+        # 混音器切换曲目后位置归零，推算出的开始时间会向后跳约一首曲目的长度；
+        # 分段等待时由调用方传入 started (位置为 0 的时间)，跨段切换也能发现
+        if started is None:
+            started = time.monotonic() - self.get_position()
+        tolerance = min(0.5, track_length / 2)
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return 'deadline'
+            position = self.get_position()
+            if not self.is_playing() or (now - position) - started > tolerance:
+                return 'ended'
+            remaining = track_length - position
+            timeout = remaining if remaining > 0 else TRACK_END_RECHECK
+            if self.stop_event.wait(min(timeout, deadline - now, MAX_PLAYBACK_WAIT)):
+                return 'stopped'
+        
+    def stop(self):
+        if self.mixer is not None:
+            self.mixer.music.stop()
+        
+    def effective_volume(self):
+        # 增益提升后超过满音量的部分截断
+        return min(1.0, self.current_volume * self.gain)
+        
+    def set_gain(self, gain):
+        # 混音器自行切换到排队的曲目后，换成该曲目的增益
+        self.gain = gain
+        self.set_volume(self.current_volume)
+        
+    def set_volume(self, volume):
+        self.current_volume = max(0.0, min(1.0, volume))
+        if self.mixer is not None:
+            self.mixer.music.set_volume(self.effective_volume())
+        
+    def is_playing(self):
+        return self.mixer is not None and self.mixer.music.get_busy()
+    
+    def play_overlay(self, file_path, gain=1.0, length=None):
+        # 整段解码后在混音通道上播放，与音乐流同时出声；返回 (通道, 时长)。length 只供不出声的后端使用
+        mixer = self.ensure_mixer()
+        with metrics.timer('overlay_load'):
+            sound = mixer.Sound(file_path)
+        # 通道都在使用时让出播放最久的一路
+        channel = mixer.find_channel(True)
+        channel.set_volume(min(1.0, self.current_volume * gain))
+        channel.play(sound)
+        return channel, sound.get_length()
+    
+    def stop_overlay(self, channel):
+        if self.mixer is not None:
+            channel.stop()
+    
+    def quit(self):
+        with self.mixer_lock:
+            if self.mixer is not None:
+                self.mixer.quit()
+                self.mixer = None
+                self.loaded_path = None
+
+
+class NullPlayer:
+    # 不出声的播放后端，接口与 MusicPlayer 相同: 按时钟推算播放位置，曲目在等待结束时按时长"播完"，
+    # 排队的曲目在上一首结束的时刻无缝接上。配合 SimulatedClock 可以在虚拟时间里模拟播放
+    def __init__(self, clock=SYSTEM_CLOCK):
+        self.clock = clock
+        self.stop_event = clock.event()
+        self.current_volume = 0.7
+        self.gain = 1.0
+        self.loaded_path = None
+        self.queued_path = None
+        self.playing = False
+        self.started = 0.0
+        self.track_end = None
+    
+    def ensure_mixer(self):
+        return self
+    
+    def warm(self, file_path):
+        pass
+    
+    def load(self, file_path, gain=1.0):
+        self.loaded_path = file_path
+        self.queued_path = None
+        self.playing = False
+        self.gain = gain
+    
+    def play(self, start=0.0):
+        self.playing = True
+        self.started = self.clock.monotonic()
+        self.track_end = None
+        return start
+    
+    def queue(self, file_path):
+        self.queued_path = file_path
+    
+    def switch_if_ended(self):
+        if self.playing and self.track_end is not None and self.clock.monotonic() >= self.track_end:
+            if self.queued_path is not None:
+                self.loaded_path, self.queued_path = self.queued_path, None
+                self.started, self.track_end = self.track_end, None
+            else:
+                self.playing = False
+    
+    def get_position(self):
+        self.switch_if_ended()
+        return self.clock.monotonic() - self.started if self.playing else 0.0
+    
+    def wait_for_track_end(self, track_length, deadline, started=None):
+        if started is None:
+            started = self.clock.monotonic() - self.get_position()
+        track_end = self.track_end = started + track_length
+        if self.stop_event.wait(max(0.0, min(track_end, deadline) - self.clock.monotonic())):
+            return 'stopped'
+        return 'ended' if track_end <= deadline else 'deadline'
+    
+    def stop(self):
+        self.playing = False
+        self.queued_path = None
+    
+    def set_gain(self, gain):
+        self.gain = gain
+    
+    def set_volume(self, volume):
+        self.current_volume = max(0.0, min(1.0, volume))
+    
+    def is_playing(self):
+        self.switch_if_ended()
+        return self.playing
+    
+    def play_overlay(self, file_path, gain=1.0, length=None):
+        return file_path, length if length is not None else 0.0
+    
+    def stop_overlay(self, channel):
+        pass
+    
+    def quit(self):
+        self.stop()
+        self.loaded_path = None
+
+
+def format_duration(seconds):
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def parse_time(time_str):
+    try:
+        h, m, s = map(int, time_str.split(':'))
+    except (ValueError, AttributeError):
+        raise ValueError("时间格式错误，请使用 H:M:S 格式")
+    if not (0 <= h <= 23 and 0 <= m <= 59 and 0 <= s <= 59):
+        raise ValueError("时间格式错误，请使用 H:M:S 格式")
+    return h, m, s
+
+
+def parse_duration(duration_str):
+    try:
+        h, m, s = map(int, duration_str.split(':'))
+    except (ValueError, AttributeError):
+        raise ValueError("时长格式错误，请使用 H:M:S 格式")
+    if not (0 <= h and 0 <= m <= 59 and 0 <= s <= 59):
+        raise ValueError("时长格式错误，请使用 H:M:S 格式")
+    return h * 3600 + m * 60 + s
+
+
+def check_policy(policy, sound=None):
+    if policy not in CONFLICT_POLICIES:
+        raise ValueError(f"未知的冲突策略: {policy}")
+    if sound and policy != 'mix':
+        raise ValueError("只有叠加播放的任务可以指定音频文件")
+
+
+def next_fire_time(time_parts, now=None, rule=None):
+    if now is None:
+        now = datetime.datetime.now()
+    if rule is not None:
+        return rule.next_after(now)
+    # 去掉微秒: 显示为 08:00:00 的任务就在整秒触发，也与从数据库恢复的任务时间一致
+    target_time = now.replace(hour=time_parts[0], minute=time_parts[1], second=time_parts[2], microsecond=0)
+    if target_time < now:
+        target_time += datetime.timedelta(days=1)
+    return target_time
+
+
+class MusicTimerEngine:
+    # 不依赖界面的核心: 曲库、定时任务和播放顺序都在这里，界面和命令行通过 subscribe 接收事件
+    def __init__(self, player=None, track_cache=None, schedule_store=None,
+                 missed_grace_seconds=MISSED_GRACE_SECONDS, gapless=True, preroll_seconds=PREROLL_SECONDS,
+                 clock=SYSTEM_CLOCK, normalize=True):
+        # clock 换成 SimulatedClock 并配合 NullPlayer 时，调度和播放都在虚拟时间里运行
+        self.clock = clock
+        self.player = player if player is not None else MusicPlayer()
+        self.track_cache = track_cache if track_cache is not None else TrackCache()
+        self.schedule_store = schedule_store if schedule_store is not None else ScheduleStore()
+        self.missed_grace_seconds = missed_grace_seconds
+        self.gapless = gapless
+        self.lock = threading.RLock()
+        self.listeners = []
+        
+        self.music_files = TrackList()
+        self.track_durations = {}
+        self.library_folder = None
+        self.library_snapshot = {}
+        
+        # 响度均衡: 后台分析得到的每首曲目增益 (dB)，加载曲目时与音量一起设置
+        self.normalize = normalize
+        self.track_gains = {}
+        self.loudness_thread = None
+        self.loudness_cancel = threading.Event()
+        
+        # 任务编号只增不减，按编号索引尚未完成的任务
+        self.task_ids = itertools.count(1)
+        self.tasks = {}
+        # 待执行任务下一次播放的时间段，添加任务时即可查出与哪些任务重叠
+        self.intervals = TaskIntervalIndex()
+        # 到点时主播放被占用而排队的任务 (任务字典)，当前播放结束后按到点顺序开始
+        self.waiting = collections.deque()
+        # 在混音通道上进行的叠加播放，{停止事件: (任务, 线程)}；同一个重复任务可能同时有多次叠加播放
+        self.overlays = {}
+        self.current_task = None
+        self.is_playing = False
+        self.current_file = ""
+        self.session_deadline = None
+        self.total_duration = 0
+        self.playback_thread = None
+        # 当前会话的播放计划和 (曲目序号, 曲目开头对应的单调时间)
+        self.play_plan = None
+        self.play_cursor = None
+        self.keep_saved_session = False
+        self.last_track_gap = None
+        self.track_gaps = collections.deque(maxlen=GAP_HISTORY)
+        self.firing_latency = LatencyHistogram()
+        
+        # 预备阶段: (任务编号, 已加载的曲目路径, 曲目时长)
+        self.preroll_seconds = preroll_seconds
+        self.prepared = None
+        self.preroll_thread = None
+        
+        self.scheduler = TaskScheduler(self.on_task_due, self.on_task_preroll, preroll_seconds, clock)
+    
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+    
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+    
+    def emit(self, event, **data):
+        for listener in list(self.listeners):
+            listener(event, data)
+    
+    def start(self):
+        self.load_tasks()
+        self.scheduler.start()
+    
+    def shutdown(self):
+        self.scheduler.stop()
+        for thread in self.stop_all():
+            thread.join()
+        self.cancel_loudness_analysis(wait=True)
+        self.track_cache.close()
+        self.schedule_store.close()
+        self.player.quit()
+    
+    def get_music_duration(self, file_path):
+        return self.track_cache.get_duration(file_path)
+    
+    def scan_library(self, folder_path, cancel_event=None):
+        # 同步执行，由调用方决定放在哪个线程: 与上次快照比较，只解析新增或修改的文件
+        with metrics.timer('scan'):
+            metrics.run(self.scan_folder, folder_path, cancel_event)
+    
+    def scan_folder(self, folder_path, cancel_event):
+        folder_path = os.path.abspath(folder_path)
+        if cancel_event is None:
+            cancel_event = threading.Event()
+        # 上一次的响度分析不等它结束，扫描完成后重新开始
+        self.cancel_loudness_analysis()
+        
+        with self.lock:
+            if folder_path != self.library_folder:
+                self.library_folder = folder_path
+                self.library_snapshot = {}
+                self.music_files = TrackList()
+                self.track_durations = {}
+                self.track_gains = {}
+                self.emit('library_reset', folder=folder_path)
+            snapshot = dict(self.library_snapshot)
+        
+        try:
+            current = walk_music_folder(folder_path, cancel_event)
+            if cancel_event.is_set():
+                self.emit('scan_finished', invalid_count=0, cancelled=True, count=len(self.music_files))
+                return
+            
+            added, removed, modified = diff_snapshots(snapshot, current)
+            self.track_cache.evict_missing(folder_path, current)
+            self.remove_tracks(removed)
+            if not current:
+                with self.lock:
+                    self.library_snapshot = {}
+                self.emit('scan_empty', folder=folder_path)
+                return
+            
+            for path in removed:
+                del snapshot[path]
+            
+            files = modified + added
+            metrics.incr('scan_files_seen', len(current))
+            metrics.incr('scan_files_probed', len(files))
+            self.track_cache.preload(folder_path)
+            self.emit('scan_progress', done=0, total=len(files))
+            
+            batch = []
+            done = 0
+            invalid_count = 0
+            last_sent = time.monotonic()
+            with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+                def submit(path):
+                    return path, executor.submit(self.track_cache.get_duration, path, key=current[path])
+                
+                pending = collections.deque()
+                file_iter = iter(files)
+                for file_path in file_iter:
+                    pending.append(submit(file_path))
+                    if len(pending) >= SCAN_WORKERS * 4:
+                        break
+                
+                while pending and not cancel_event.is_set():
+                    file_path, future = pending.popleft()
+                    duration = future.result()
+                    batch.append((file_path, duration))
+                    snapshot[file_path] = current[file_path]
+                    done += 1
+                    if duration is None:
+                        invalid_count += 1
+                    
+                    next_path = next(file_iter, None)
+                    if next_path is not None:
+                        pending.append(submit(next_path))
+                    
+                    if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - last_sent >= SCAN_BATCH_INTERVAL:
+                        self.apply_scan_batch(batch)
+                        self.emit('scan_progress', done=done, total=len(files))
+                        batch = []
+                        last_sent = time.monotonic()
+                
+                for _, future in pending:
+                    future.cancel()
+            
+            if batch:
+                self.apply_scan_batch(batch)
+                self.emit('scan_progress', done=done, total=len(files))
+            self.track_cache.flush()
+            metrics.incr('scan_files_invalid', invalid_count)
+            with self.lock:
+                self.library_snapshot = snapshot
+            self.emit('scan_finished', invalid_count=invalid_count, cancelled=cancel_event.is_set(),
+                      count=len(self.music_files))
+            if not cancel_event.is_set():
+                self.start_loudness_analysis(folder_path)
+        except Exception as e:
+            self.emit('scan_error', message=str(e))
+    
+    def start_loudness_analysis(self, folder_path):
+        # 在后台线程中分析响度，不占用扫描和播放；没有 NumPy 或关闭了均衡时不分析
+        if not self.normalize or not loudness_available():
+            return
+        cancel_event = self.loudness_cancel = threading.Event()
+        self.loudness_thread = threading.Thread(target=metrics.run, daemon=True,
+                                                args=(self.analyze_loudness, folder_path, cancel_event))
+        self.loudness_thread.start()
+    
+    def cancel_loudness_analysis(self, wait=False):
+        self.loudness_cancel.set()
+        thread = self.loudness_thread
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+    
+    def analyze_loudness(self, folder_path, cancel_event):
+        # 大小和修改时间都没变的直接用缓存，其余按播放顺序送入进程池解码，靠前的曲目先得到增益
+        try:
+            with self.lock:
+                snapshot = self.library_snapshot
+                paths = [path for path in self.music_files if path in snapshot]
+            cached = self.track_cache.load_gains(folder_path)
+            todo = []
+            with self.lock:
+                for path in paths:
+                    entry = cached.get(path)
+                    if entry is not None and entry[:2] == snapshot[path]:
+                        self.track_gains[path] = entry[2]
+                    else:
+                        todo.append(path)
+            if not todo:
+                return
+            
+            self.emit('loudness_progress', done=0, total=len(todo))
+            rows = []
+            done = 0
+            failed = 0
+            with metrics.timer('loudness'), create_pool() as pool:
+                pending = collections.deque()
+                path_iter = iter(todo)
+                for path in itertools.islice(path_iter, LOUDNESS_WORKERS * 2):
+                    pending.append((path, pool.submit(analyze_track, path)))
+                
+                while pending and not cancel_event.is_set():
+                    path, future = pending.popleft()
+                    loudness, gain, error = future.result()
+                    rows.append((path,) + snapshot[path] + (loudness, gain))
+                    with self.lock:
+                        if path in self.track_durations:
+                            self.track_gains[path] = gain
+                    done += 1
+                    if error is not None:
+                        failed += 1
+                    
+                    next_path = next(path_iter, None)
+                    if next_path is not None:
+                        pending.append((next_path, pool.submit(analyze_track, next_path)))
+                    
+                    if len(rows) >= LOUDNESS_BATCH_SIZE:
+                        self.track_cache.save_gains(rows)
+                        self.emit('loudness_progress', done=done, total=len(todo))
+                        rows = []
+                
+                for _, future in pending:
+                    future.cancel()
+            
+            if rows:
+                self.track_cache.save_gains(rows)
+            metrics.incr('loudness_analyzed', done)
+            metrics.incr('loudness_failures', failed)
+            self.emit('loudness_finished', analyzed=done, failed=failed, cancelled=cancel_event.is_set())
+        except Exception as e:
+            self.emit('loudness_error', message=str(e))
+    
+    def track_gain(self, file_path):
+        # 加载曲目时使用的线性增益，尚未分析或关闭均衡时为 1
+        if not self.normalize:
+            return 1.0
+        return 10 ** (self.track_gains.get(file_path, 0.0) / 20)
+    
+    def apply_scan_batch(self, batch):
+        # 已存在的曲目刷新时长，新文件追加到末尾，变为无法解析的文件移除
+        added = []
+        updated = []
+        invalid = []
+        with self.lock:
+            for file_path, duration in batch:
+                known = file_path in self.track_durations
+                if duration is None:
+                    if known:
+                        invalid.append(file_path)
+                    continue
+                self.track_durations[file_path] = duration
+                if known:
+                    updated.append((file_path, duration))
+                else:
+                    self.music_files.append(file_path)
+                    added.append((file_path, duration))
+        
+        if updated:
+            self.emit('tracks_updated', tracks=updated)
+        if added:
+            self.emit('tracks_added', tracks=added)
+        self.remove_tracks(invalid)
+    
+    def remove_tracks(self, paths):
+        with self.lock:
+            removed = [path for path in paths if self.track_durations.pop(path, None) is not None]
+            for path in removed:
+                self.music_files.remove(path)
+                self.track_gains.pop(path, None)
+        if removed:
+            self.emit('tracks_removed', paths=removed)
+    
+    def move_track(self, index, new_index):
+        with self.lock:
+            if not (0 <= index < len(self.music_files) and 0 <= new_index < len(self.music_files)):
+                return False
+            self.music_files.swap(index, new_index)
+            path = self.music_files[new_index]
+        self.emit('track_moved', path=path, index=index, new_index=new_index)
+        return True
+    
+    def track_index(self, path):
+        # 曲目在播放顺序中的序号，不在列表中时返回 None
+        with self.lock:
+            try:
+                return self.music_files.index(path)
+            except ValueError:
+                return None
+    
+    def get_tracks(self, start, count):
+        # 播放顺序中从 start 开始的 count 首 [(路径, 时长)]，供列表按需显示
+        with self.lock:
+            return [(path, self.track_durations[path]) for path in self.music_files.slice(start, start + count)]
+    
+    def next_fire_time(self, time_parts, now=None, rule=None):
+        return next_fire_time(time_parts, now if now is not None else self.clock.now(), rule)
+    
+    def make_task(self, task_id, target_time, duration_seconds, status='等待中', rule=None,
+                  policy=DEFAULT_POLICY, sound=None):
+        task = {
+            'id': task_id,
+            'duration': format_duration(duration_seconds),
+            'duration_seconds': duration_seconds,
+            'status': status,
+            'rule': rule,
+            'repeat': rule.describe() if rule is not None else "单次",
+            'policy': policy,
+            'sound': sound
+        }
+        self.set_task_time(task, target_time)
+        return task
+    
+    def set_task_time(self, task, target_time):
+        date_text, time_text = target_time.strftime(TIME_FORMAT).split(' ')
+        task['datetime'] = target_time
+        task['date'] = date_text
+        task['time'] = time_text
+    
+    def advance_task(self, task, now=None):
+        # 重复任务: 计算下一次触发时间并重新放入调度器，没有下一次时返回 False
+        if now is None:
+            now = self.clock.now()
+        next_time = task['rule'].next_after(max(task['datetime'], now))
+        if next_time is None:
+            return False
+        self.set_task_time(task, next_time)
+        with self.lock:
+            if task['id'] in self.tasks:
+                self.intervals.add(task)
+        self.scheduler.add(task)
+        return True
+    
+    def load_tasks(self):
+        # 恢复上次退出前的任务: 停机期间错过但仍在宽限时间内的任务立即补播，其余标记为已错过，
+        # 重复任务则直接跳到下一次触发时间
+        now = self.clock.now()
+        loaded = []
+        pending = []
+        changed = []
+        for task_id, target_time, duration_seconds, status, rule, policy, sound in self.schedule_store.load():
+            task = self.make_task(task_id, target_time, duration_seconds, status, rule, policy, sound)
+            loaded.append(task)
+            if status not in ('等待中', '执行中', '排队中'):
+                continue
+            
+            missed = (now - target_time).total_seconds() > self.missed_grace_seconds
+            if rule is not None and (missed or status != '等待中'):
+                next_time = rule.next_after(now)
+                if next_time is not None:
+                    self.set_task_time(task, next_time)
+                    task['status'] = '等待中'
+                    pending.append(task)
+                else:
+                    task['status'] = '已完成'
+                changed.append(task)
+            elif status != '等待中':
+                task['status'] = '已中断'
+                changed.append(task)
+            elif missed:
+                task['status'] = '已错过'
+                changed.append(task)
+            else:
+                pending.append(task)
+        
+        if changed:
+            self.schedule_store.update(changed)
+        with self.lock:
+            self.task_ids = itertools.count(self.schedule_store.max_id() + 1)
+            self.tasks = {task['id']: task for task in pending}
+            self.intervals.clear()
+            for task in pending:
+                self.intervals.add(task)
+        self.scheduler.add_many(pending)
+        self.emit('tasks_loaded', tasks=loaded)
+    
+    def add_task(self, time_parts, duration_seconds, rule=None, policy=DEFAULT_POLICY, sound=None):
+        check_policy(policy, sound)
+        target_time = self.next_fire_time(time_parts, rule=rule)
+        if target_time is None:
+            raise ValueError("重复规则在未来没有可触发的时间")
+        with self.lock:
+            task = self.make_task(next(self.task_ids), target_time, duration_seconds, rule=rule,
+                                  policy=policy, sound=sound)
+            conflicts = self.index_task(task)
+        self.schedule_store.insert([task])
+        self.emit('task_added', task=task)
+        if conflicts:
+            self.emit('task_conflict', task=task, conflicts=conflicts)
+        self.scheduler.add(task)
+        return task
+    
+    def add_tasks(self, entries, batch_size=TASK_BATCH_SIZE):
+        # 批量添加 [(触发时间, 时长秒数, 重复规则, 冲突策略, 叠加音频)]: 每批一次写库、一次入堆、一个 tasks_added 事件
+        added = []
+        for start in range(0, len(entries), batch_size):
+            with self.lock:
+                tasks = [self.make_task(next(self.task_ids), target_time, duration_seconds, rule=rule,
+                                        policy=policy, sound=sound)
+                         for target_time, duration_seconds, rule, policy, sound in entries[start:start + batch_size]]
+                conflicts = [(task, self.index_task(task)) for task in tasks]
+            self.schedule_store.insert(tasks)
+            self.emit('tasks_added', tasks=tasks)
+            for task, task_conflicts in conflicts:
+                if task_conflicts:
+                    self.emit('task_conflict', task=task, conflicts=task_conflicts)
+            self.scheduler.add_many(tasks)
+            added.extend(tasks)
+        return added
+    
+    def index_task(self, task):
+        # 调用方持有 self.lock: 登记为待执行任务，返回与它下一次播放时间段重叠的任务编号
+        self.tasks[task['id']] = task
+        self.intervals.add(task)
+        metrics.incr('conflict_checks')
+        return self.find_conflicts(task)
+    
+    def drop_task(self, task_id):
+        # 调用方持有 self.lock
+        self.intervals.remove(task_id)
+        return self.tasks.pop(task_id, None)
+    
+    def find_conflicts(self, task):
+        # 调用方持有 self.lock: 与该任务下一次播放时间段重叠的其他待执行任务编号；
+        # 重复间隔比时长短时下一次会与自己重叠，结果中也包含它自己的编号
+        start, end = TaskIntervalIndex.span_of(task)
+        conflicts = self.intervals.overlapping(start, end, task['id'])
+        if task['rule'] is not None:
+            following = task['rule'].next_after(task['datetime'])
+            if following is not None and following.timestamp() < end:
+                conflicts.append(task['id'])
+        return conflicts
+    
+    def task_conflicts(self, task):
+        with self.lock:
+            return self.find_conflicts(task)
+    
+    def get_task(self, task_id):
+        return self.tasks.get(task_id)
+    
+    def list_tasks(self):
+        # 尚未完成的任务，按下一次触发时间排序
+        with self.lock:
+            tasks = list(self.tasks.values())
+        return sorted(tasks, key=lambda task: task['datetime'])
+    
+    def withdraw_tasks(self, task_ids):
+        # 已删除的任务不再排队等待，进行中的叠加播放也停止
+        task_ids = set(task_ids)
+        with self.lock:
+            waiting = [task for task in self.waiting if task['id'] not in task_ids]
+            self.waiting.clear()
+            self.waiting.extend(waiting)
+            stop_events = [stop_event for stop_event, (task, _) in self.overlays.items() if task['id'] in task_ids]
+        for stop_event in stop_events:
+            stop_event.set()
+    
+    def remove_task(self, task_id):
+        with self.lock:
+            task = self.drop_task(task_id)
+        self.withdraw_tasks([task_id])
+        self.schedule_store.delete([task_id])
+        if task is None:
+            return None
+        self.scheduler.remove(task)
+        self.emit('task_removed', task=task)
+        return task
+    
+    def remove_tasks(self, task_ids):
+        # 批量删除，一次写库；返回实际删除的尚未完成的任务
+        with self.lock:
+            tasks = [self.drop_task(task_id) for task_id in task_ids if task_id in self.tasks]
+        self.withdraw_tasks(task_ids)
+        self.schedule_store.delete(task_ids)
+        for task in tasks:
+            self.scheduler.remove(task)
+            self.emit('task_removed', task=task)
+        return tasks
+    
+    def set_task_status(self, task, status):
+        task['status'] = status
+        self.schedule_store.update([task])
+        self.emit('task_updated', task=task)
+    
+    def on_task_due(self, task):
+        # 由调度线程在任务到期时调用，重复任务先排好下一次再开始播放。
+        # 主播放被占用时按任务的冲突策略处理，重叠在添加任务时已经通过 task_conflict 事件报告过。
+        # 重复间隔比时长短的任务到期时上一次可能还在播放或排队，同样按冲突策略处理
+        if task['rule'] is not None and not self.advance_task(task):
+            with self.lock:
+                self.drop_task(task['id'])
+        policy = task['policy']
+        with self.lock:
+            queued = any(waiting is task for waiting in self.waiting)
+        if queued:
+            # 上一次还在排队，这一次不再重复排队
+            self.record_conflict(task)
+            return
+        if policy == 'mix' and (task['sound'] or self.is_playing):
+            if self.is_playing or task['status'] == '执行中':
+                self.record_conflict(task)
+            self.start_overlay(task)
+            return
+        with self.lock:
+            busy = self.is_playing
+            if not busy:
+                # 先占住主播放，排队的任务不会在这期间开始
+                self.is_playing = True
+            elif policy == 'queue':
+                self.waiting.append(task)
+        if busy:
+            self.record_conflict(task)
+            # 上一次还在播放时保留 '执行中'，结束后由 finish_task 改回等待
+            running = task['status'] == '执行中'
+            if policy == 'queue':
+                if not running:
+                    self.set_task_status(task, '排队中')
+                return
+            if policy == 'skip':
+                if not running:
+                    self.finish_task(task, '已跳过')
+                return
+            self.preempt_playback()
+            self.begin_task(task, keep_saved_session=True)
+            return
+        self.begin_task(task)
+    
+    def record_conflict(self, task):
+        current = self.current_task
+        metrics.incr('task_conflicts')
+        self.emit('conflict_resolved', task=task, policy=task['policy'],
+                  current_id=current['id'] if current is not None else None)
+    
+    def begin_task(self, task, keep_saved_session=False):
+        # 主播放已由调用方占住。预备阶段已加载好第一首时到点只调用 play()，状态更新等放在出声之后
+        try:
+            prepared = self.take_preroll(task)
+            first_track = None
+            if prepared is not None:
+                self.player.play()
+                first_track = prepared + (self.clock.monotonic(),)
+        except Exception as e:
+            with self.lock:
+                self.is_playing = False
+            self.finish_task(task, '已中断')
+            self.emit('playback_error', message=str(e))
+            return
+        self.current_task = task
+        self.set_task_status(task, '执行中')
+        self.start_playback(task['duration_seconds'], first_track, keep_saved_session=keep_saved_session)
+    
+    def finish_task(self, task, status=None):
+        # 单次任务播放结束、被打断或跳过后不再待执行，重复任务回到等待下一次
+        with self.lock:
+            pending = task['rule'] is not None and task['id'] in self.tasks
+            if not pending:
+                self.drop_task(task['id'])
+        self.set_task_status(task, '等待中' if pending else (status or '已完成'))
+    
+    def join_playback_thread(self):
+        # 等上一个播放线程看到停止事件并退出，新会话不会与它同时操作混音器
+        thread = self.playback_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+    
+    def preempt_playback(self):
+        # 打断当前播放 (记下位置，可以继续播放)，然后重新占住主播放
+        self.stop_playback(status='已中断', start_queued=False)
+        self.join_playback_thread()
+        metrics.incr('tasks_preempted')
+        with self.lock:
+            self.is_playing = True
+    
+    def start_waiting(self):
+        # 主播放空闲后开始最早排队的任务，播放完整的时长
+        with self.lock:
+            if self.is_playing or not self.waiting:
+                return
+            task = self.waiting.popleft()
+            self.is_playing = True
+        # 排队等待的时间不计入触发延迟
+        task.pop('due_monotonic', None)
+        self.join_playback_thread()
+        self.begin_task(task)
+    
+    def start_overlay(self, task):
+        # 叠加播放不占用主播放，在混音通道上与当前音乐同时出声
+        stop_event = self.clock.event()
+        thread = self.clock.thread(metrics.run, (self.play_overlay, task, stop_event))
+        self.set_task_status(task, '执行中')
+        # 登记和启动放在同一次加锁中，stop_all 取到的线程都已启动
+        with self.lock:
+            self.overlays[stop_event] = (task, thread)
+            thread.start()
+    
+    def play_overlay(self, task, stop_event):
+        # 指定了音频文件时只播放它一次，否则按播放顺序播放曲库，都以任务时长为限
+        channel = None
+        try:
+            deadline = self.clock.monotonic() + task['duration_seconds']
+            if task['sound']:
+                tracks = [(task['sound'], None)]
+            else:
+                plan = self.build_play_plan()
+                tracks = zip(plan.paths, plan.durations)
+                if not plan:
+                    raise RuntimeError("没有可播放的音乐文件")
+            metrics.incr('overlays_started')
+            self.emit('overlay_started', task=task)
+            for index, (path, length) in enumerate(tracks):
+                remaining = deadline - self.clock.monotonic()
+                if remaining <= 0:
+                    break
+                channel, length = self.player.play_overlay(path, self.track_gain(path), length)
+                if index == 0:
+                    self.record_firing(task)
+                if stop_event.wait(min(length, remaining)):
+                    break
+            if channel is not None:
+                self.player.stop_overlay(channel)
+        except Exception as e:
+            self.emit('playback_error', message=str(e))
+        finally:
+            with self.lock:
+                self.overlays.pop(stop_event, None)
+            self.finish_task(task)
+            self.emit('overlay_stopped', task=task)
+    
+    def stop_all(self):
+        # 停止主播放和全部叠加播放，排队中的任务不再播放
+        with self.lock:
+            waiting = list(self.waiting)
+            self.waiting.clear()
+            overlays = dict(self.overlays)
+        for task in waiting:
+            self.finish_task(task, '已跳过')
+        for stop_event in overlays:
+            stop_event.set()
+        self.stop_playback()
+        return [thread for _, thread in overlays.values()]
+    
+    def on_task_preroll(self, task):
+        # 由调度线程在目标时间前 preroll_seconds 调用，实际准备工作放到单独线程，不耽误其他任务
+        if task['status'] != '等待中':
+            return
+        self.preroll_thread = self.clock.thread(metrics.run, (self.preroll_task, task))
+        self.preroll_thread.start()
+    
+    def preroll_task(self, task):
+        # 提前解析前几首曲目、读入文件开头并初始化混音器，空闲时直接加载第一首；失败在到点前就报告
+        try:
+            if task['sound']:
+                # 叠加播放的音频到点才在混音通道上解码，这里只读入文件开头
+                with metrics.timer('preroll'):
+                    self.player.warm(task['sound'])
+                    self.player.ensure_mixer()
+                self.emit('task_prepared', task=task, path=task['sound'], loaded=False)
+                return
+            with metrics.timer('preroll'):
+                tracks = self.get_tracks(0, PREROLL_WARM_TRACKS)
+                if not tracks:
+                    raise RuntimeError("没有可播放的音乐文件")
+                for file_path, _ in tracks:
+                    self.player.warm(file_path)
+                self.player.ensure_mixer()
+                prepared = None
+                with self.lock:
+                    # 混音器只有一路音乐流，正在播放时不能替换，只做预热，到点再加载
+                    if not self.is_playing:
+                        self.player.load(tracks[0][0], self.track_gain(tracks[0][0]))
+                        prepared = (task['id'],) + tuple(tracks[0])
+                    self.prepared = prepared
+            self.emit('task_prepared', task=task, path=tracks[0][0], loaded=prepared is not None)
+        except Exception as e:
+            metrics.incr('preroll_failures')
+            self.emit('preroll_failed', task=task, message=str(e))
+    
+    def take_preroll(self, task):
+        # 取出该任务预备好的 (路径, 时长)；预备还在进行时等它完成，加载后被其他播放替换则作废
+        thread = self.preroll_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self.lock:
+            prepared, self.prepared = self.prepared, None
+        if prepared is None or prepared[0] != task['id'] or self.player.loaded_path != prepared[1]:
+            return None
+        return prepared[1:]
+    
+    def set_volume(self, volume):
+        self.player.set_volume(volume)
+        self.emit('volume_changed', volume=self.player.current_volume)
+    
+    def start_playback(self, duration_seconds, first_track=None, resume=None, keep_saved_session=False):
+        # first_track: 已经开始播放的第一首 (路径, 时长, 开始时间)；resume: 保存的会话位置。
+        # keep_saved_session: 抢占开始的会话不覆盖也不清除被打断会话保存的位置，结束后仍可继续播放
+        self.player.stop_event.clear()
+        self.keep_saved_session = keep_saved_session
+        
+        self.total_duration = duration_seconds
+        started = first_track[2] if first_track is not None else self.clock.monotonic()
+        self.session_deadline = started + duration_seconds
+        with self.lock:
+            self.is_playing = True
+            # 新会话会加载和排队其他曲目，之前预备的任务到点时重新加载
+            self.prepared = None
+        self.emit('playback_started', duration_seconds=duration_seconds, task=self.current_task)
+        
+        self.playback_thread = self.clock.thread(metrics.run, (self.play_music_sequence, duration_seconds,
+                                                               self.current_task, first_track, resume))
+        self.playback_thread.start()
+    
+    @property
+    def current_remaining(self):
+        if not self.is_playing or self.session_deadline is None:
+            return 0
+        return max(0, self.session_deadline - self.clock.monotonic())
+    
+    def build_play_plan(self):
+        # 会话开始时按当前播放顺序建一次，直接使用扫描时记录的时长，不再解析文件
+        with self.lock:
+            return PlayPlan((path, self.track_durations[path]) for path in self.music_files)
+    
+    def resume_point(self, plan, state):
+        # 优先按路径找到中断时的曲目，曲目已不在列表中时按中断时在计划中的累计位置查找
+        index = self.track_index(state['path'])
+        if index is not None and index < len(plan) and plan.paths[index] == state['path']:
+            return index, min(state['position'], plan.durations[index])
+        located = plan.locate(state['plan_offset'])
+        return located if located is not None else (len(plan), 0.0)
+    
+    def session_position(self):
+        # 当前会话的播放位置，供保存后恢复；未在播放时返回 None
+        plan, cursor, deadline = self.play_plan, self.play_cursor, self.session_deadline
+        if plan is None or cursor is None or deadline is None:
+            return None
+        index, track_start = cursor
+        now = self.clock.monotonic()
+        position = min(max(0.0, now - track_start), plan.durations[index])
+        task = self.current_task
+        return {'task_id': task['id'] if task else None, 'folder': self.library_folder,
+                'path': plan.paths[index], 'position': position, 'plan_offset': plan.offsets[index] + position,
+                'remaining': max(0.0, deadline - now), 'duration_seconds': self.total_duration}
+    
+    def save_session_position(self):
+        if self.keep_saved_session:
+            return
+        state = self.session_position()
+        if state is not None and state['remaining'] > 0:
+            self.schedule_store.save_session(state)
+    
+    def saved_session(self):
+        return self.schedule_store.load_session()
+    
+    def resume_session(self):
+        # 从上次中断的位置接着播放剩余时长，之前的曲目既不重播也不重新解析；返回是否开始播放
+        state = self.schedule_store.load_session()
+        if state is None or self.is_playing or not self.music_files or state['folder'] != self.library_folder:
+            return False
+        self.current_task = None
+        self.start_playback(state['remaining'], resume=state)
+        return True
+    
+    def record_track_start(self, file_path, gap):
+        # gap: 上一首应结束的时间到这一首实际开始之间的空白 (秒)
+        self.current_file = os.path.basename(file_path)
+        if gap is not None:
+            gap = max(0.0, gap)
+            self.last_track_gap = gap
+            self.track_gaps.append(gap)
+            metrics.observe('track_gap', gap)
+        metrics.incr('tracks_started')
+        self.emit('track_started', path=file_path, gap=gap)
+    
+    def record_firing(self, task, started=None):
+        # 从调度截止时间 (单调时钟) 到第一首曲目开始出声的延迟
+        due = task.get('due_monotonic')
+        if due is None:
+            return
+        latency = max(0.0, (started if started is not None else self.clock.monotonic()) - due)
+        task['latency'] = latency
+        self.firing_latency.observe(latency)
+        metrics.observe('firing_latency', latency)
+        self.emit('task_fired', task=task, latency=latency)
+    
+    def play_music_sequence(self, duration_seconds, task=None, first_track=None, resume=None):
+        # 按会话开始时建好的播放计划逐首播放；resume 为保存的会话位置时从那首曲目的中途接着播放
+        try:
+            deadline = self.session_deadline
+            plan = self.build_play_plan()
+            index, skip = (0, 0.0) if resume is None else self.resume_point(plan, resume)
+            self.play_plan = plan
+            if resume is not None and index < len(plan):
+                self.emit('session_resumed', path=plan.paths[index], position=skip)
+            if first_track is not None and (not plan.paths or plan.paths[0] != first_track[0]):
+                # 预备后曲库有变化，已加载的曲目不再是计划中的第一首
+                first_track = None
+            current = None
+            track_start = None
+            offset = 0.0
+            queued = None
+            
+            while True:
+                if first_track is not None:
+                    current, track_start, offset = index, first_track[2], 0.0
+                    first_track = None
+                    if task is not None:
+                        self.record_firing(task, track_start)
+                    self.record_track_start(plan.paths[current], None)
+                elif current is not None and queued is not None and self.player.is_playing():
+                    # 混音器已自行切换到排队的曲目，换成该曲目的增益。音乐流只有一个音量且不能预约在切换时改变，
+                    # 无缝模式下新曲目开头约 TRACK_END_RECHECK 秒仍是上一首的增益；关闭无缝衔接时加载即生效
+                    self.player.set_gain(self.track_gain(plan.paths[queued]))
+                    new_start = self.clock.monotonic() - self.player.get_position()
+                    self.record_track_start(plan.paths[queued], new_start - (track_start + plan.durations[current]))
+                    current, track_start, offset = queued, new_start, 0.0
+                else:
+                    if queued is not None:
+                        next_index = queued
+                    else:
+                        next_index = index if current is None else current + 1
+                    if next_index >= len(plan):
+                        break
+                    expected_end = track_start + plan.durations[current] if current is not None else None
+                    current = next_index
+                    self.player.load(plan.paths[current], self.track_gain(plan.paths[current]))
+                    # 只有恢复的第一首从中途开始
+                    offset = self.player.play(skip if expected_end is None else 0.0)
+                    started = self.clock.monotonic()
+                    track_start = started - offset
+                    if expected_end is None and task is not None:
+                        self.record_firing(task)
+                    self.record_track_start(plan.paths[current], started - expected_end if expected_end is not None else None)
+                
+                self.play_cursor = (current, track_start)
+                self.save_session_position()
+                # 无缝模式下始终让混音器排队下一首，切换由混音器完成
+                queued = current + 1 if self.gapless and current + 1 < len(plan) else None
+                if queued is not None:
+                    self.player.queue(plan.paths[queued])
+                
+                # 分段等待，每段结束时保存一次位置，异常退出后也能从最近的位置恢复
+                while True:
+                    checkpoint = min(deadline, self.clock.monotonic() + SESSION_CHECKPOINT_SECONDS)
+                    result = self.player.wait_for_track_end(plan.durations[current] - offset, checkpoint,
+                                                            track_start + offset)
+                    if result != 'deadline' or checkpoint >= deadline:
+                        break
+                    self.save_session_position()
+                if result == 'stopped':
+                    self.player.stop()
+                    return
+                if result == 'deadline':
+                    break
+            
+            self.stop_playback(save_position=False)
+        except Exception as e:
+            self.stop_playback()
+            self.emit('playback_error', message=str(e))
+    
+    def stop_playback(self, save_position=True, status=None, start_queued=True):
+        # 中途停止时记下播放位置，之后可以 resume_session 接着播放；会话正常结束时清除。
+        # status 为被停止的单次任务的状态 (默认已完成)；之后开始排队中的任务，除非 start_queued 为 False
+        if self.is_playing:
+            if save_position:
+                self.save_session_position()
+            elif not self.keep_saved_session:
+                self.schedule_store.clear_session()
+        with self.lock:
+            self.is_playing = False
+        self.player.stop_event.set()
+        self.player.stop()
+        self.session_deadline = None
+        self.play_plan = None
+        self.play_cursor = None
+        
+        task = self.current_task
+        self.current_task = None
+        if task:
+            self.finish_task(task, status)
+        self.emit('playback_stopped', task=task)
+        if start_queued:
+            self.start_waiting()
@@ -0,0 +1,254 @@
+import os
+import time
+import json
+import threading
+
+
+METRICS_PREFIX = "music_timer"
+DEFAULT_EXPORT_INTERVAL = 10.0
+
+
+class NullTimer:
+    # 未启用统计时 timer() 返回的空计时器，不读时钟也不加锁
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    # 计数器和计时器 (次数、总耗时、最大值)，按 (名称, 标签) 区分。
+    # 默认关闭，关闭时各记录方法只做一次属性判断
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+        self.profiler = None
+        self.started = time.time()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timers = {}
+            self.started = time.time()
+
+    def incr(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            stats = self.timers.get(key)
+            if stats is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds > stats[2]:
+                    stats[2] = seconds
+
+    def timer(self, name, **labels):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name, labels)
+
+    def run(self, func, *args, **kwargs):
+        # 开启 cProfile 采集时在独立的 Profile 中执行 func，结果累加到同一份统计
+        profiler = self.profiler
+        if profiler is None:
+            return func(*args, **kwargs)
+        return profiler.call(func, *args, **kwargs)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'started': self.started,
+                'timestamp': time.time(),
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'timers': [{'name': name, 'labels': dict(labels), 'count': count,
+                            'sum_seconds': total, 'max_seconds': maximum}
+                           for (name, labels), (count, total, maximum) in sorted(self.timers.items())],
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, ensure_ascii=False)
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+        for item in snapshot['counters']:
+            metric = f"{METRICS_PREFIX}_{item['name']}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{format_labels(item['labels'])} {item['value']}")
+        # summary 只有 _count 和 _sum，最大值单独作为 gauge；同一指标的各组标签要写在一起
+        families = {}
+        for item in snapshot['timers']:
+            name = f"{METRICS_PREFIX}_{item['name']}"
+            labels = format_labels(item['labels'])
+            summary, maximum = families.setdefault(name, ([], []))
+            summary.append(f"{name}_seconds_count{labels} {item['count']}")
+            summary.append(f"{name}_seconds_sum{labels} {item['sum_seconds']:.9f}")
+            maximum.append(f"{name}_max_seconds{labels} {item['max_seconds']:.9f}")
+        for name, (summary, maximum) in families.items():
+            lines.append(f"# TYPE {name}_seconds summary")
+            lines.extend(summary)
+            lines.append(f"# TYPE {name}_max_seconds gauge")
+            lines.extend(maximum)
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def write_atomic(path, text):
+    # 先写临时文件再替换，采集程序不会读到写了一半的文件
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class ProfileCapture:
+    # cProfile 只跟踪调用它的线程，因此每次 run 单独建一个 Profile，结束后合并
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = None
+
+    def call(self, func, *args, **kwargs):
+        import cProfile
+        import pstats
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12 起 cProfile 基于 sys.monitoring，同一时间只能有一个 Profile 启用，
+            # 其他线程正在采样时这次调用不计入，照常执行
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+
+    def dump(self):
+        with self.lock:
+            if self.stats is not None:
+                self.stats.dump_stats(self.path)
+
+
+class MetricsExporter:
+    # 后台线程定期把统计写到文件 (json 或 prometheus 文本格式)，停止时再写最后一次
+    def __init__(self, metrics, path, fmt="json", interval=DEFAULT_EXPORT_INTERVAL):
+        if fmt not in ("json", "prometheus"):
+            raise ValueError(f"不支持的统计输出格式: {fmt}")
+        self.metrics = metrics
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def export(self):
+        text = self.metrics.to_json() if self.fmt == "json" else self.metrics.to_prometheus()
+        write_atomic(self.path, text)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.export()
+            except OSError:
+                pass
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.export()
+
+
+metrics = Metrics()
+
+
+def setup_metrics(path=None, fmt="json", interval=DEFAULT_EXPORT_INTERVAL, profile_path=None):
+    # 指定输出文件时启用统计并返回已启动的导出器；profile_path 开启 cProfile 采集
+    exporter = None
+    if path:
+        exporter = MetricsExporter(metrics, path, fmt, interval)
+        metrics.enable()
+        exporter.start()
+    if profile_path:
+        metrics.profiler = ProfileCapture(profile_path)
+    return exporter
+
+
+def setup_metrics_from_env(environ=None):
+    # 图形界面没有命令行参数，通过环境变量开启:
+    # MUSIC_TIMER_METRICS=文件, MUSIC_TIMER_METRICS_FORMAT=json|prometheus,
+    # MUSIC_TIMER_METRICS_INTERVAL=秒, MUSIC_TIMER_PROFILE=文件
+    environ = os.environ if environ is None else environ
+    interval = float(environ.get("MUSIC_TIMER_METRICS_INTERVAL", DEFAULT_EXPORT_INTERVAL))
+    return setup_metrics(environ.get("MUSIC_TIMER_METRICS"),
+                         environ.get("MUSIC_TIMER_METRICS_FORMAT", "json"),
+                         interval, environ.get("MUSIC_TIMER_PROFILE"))
+
+
+def shutdown_metrics(exporter=None):
+    if exporter is not None:
+        exporter.stop()
+    if metrics.profiler is not None:
+        metrics.profiler.dump()
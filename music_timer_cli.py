@@ -0,0 +1,197 @@
+import sys
+import time
+import argparse
+import datetime
+from music_engine import (MusicTimerEngine, RecurrenceRule, parse_time, parse_duration, parse_dates, check_policy,
+                          PREROLL_SECONDS, CONFLICT_POLICIES, DEFAULT_POLICY)
+from music_metrics import setup_metrics, shutdown_metrics
+from schedule_io import read_schedule, write_schedule, ScheduleImportError
+
+
+def describe_event(event, data):
+    task = data.get('task')
+    if event == 'scan_finished':
+        return f"扫描完成: {data['count']} 首" + (" (已取消)" if data['cancelled'] else "")
+    if event == 'scan_empty':
+        return f"在 '{data['folder']}' 中未找到支持的音乐文件"
+    if event == 'scan_error':
+        return f"扫描时出现错误: {data['message']}"
+    if event == 'loudness_finished':
+        message = f"响度分析完成: {data['analyzed']} 首"
+        if data['failed']:
+            message += f"，{data['failed']} 首无法解码"
+        return message + (" (已取消)" if data['cancelled'] else "")
+    if event == 'loudness_error':
+        return f"响度分析时出现错误: {data['message']}"
+    if event == 'tasks_loaded' and data['tasks']:
+        return f"已恢复 {len(data['tasks'])} 个定时任务"
+    if event == 'task_added':
+        return f"已添加定时任务: {task['date']} {task['time']} 播放 {task['duration']} ({task['repeat']})"
+    if event == 'tasks_added':
+        return f"已批量添加 {len(data['tasks'])} 个定时任务"
+    if event == 'task_conflict':
+        ids = ", ".join("自身的下一次" if task_id == task['id'] else str(task_id) for task_id in data['conflicts'])
+        return (f"任务 {task['date']} {task['time']} 与任务 {ids} 的播放时间重叠，"
+                f"到点时按“{CONFLICT_POLICIES[task['policy']]}”处理")
+    if event == 'task_updated':
+        return f"任务 {task['date']} {task['time']}: {task['status']}"
+    if event == 'task_prepared':
+        return f"任务 {task['date']} {task['time']} 已预备: {data['path']}" + ("" if data['loaded'] else " (仅预热)")
+    if event == 'preroll_failed':
+        return f"任务 {task['date']} {task['time']} 预备失败: {data['message']}"
+    if event == 'conflict_resolved':
+        return f"任务 {task['date']} {task['time']} 到点时正在播放，按“{CONFLICT_POLICIES[data['policy']]}”处理"
+    if event == 'overlay_started':
+        return f"任务 {task['date']} {task['time']} 开始叠加播放: {task['sound'] or '曲库'}"
+    if event == 'task_fired':
+        return f"任务 {task['date']} {task['time']} 触发延迟 {data['latency'] * 1000:.1f} ms"
+    if event == 'session_resumed':
+        return f"从 {data['path']} 的第 {data['position']:.1f} 秒处继续播放"
+    if event == 'track_started':
+        if data['gap'] is None:
+            return f"播放: {data['path']}"
+        return f"播放: {data['path']} (间隙 {data['gap'] * 1000:.0f} ms)"
+    if event == 'playback_error':
+        return f"播放时出现错误: {data['message']}"
+    return None
+
+
+def describe_latency(histogram):
+    snapshot = histogram.snapshot()
+    if not snapshot['count']:
+        return None
+    parts = [f"触发 {snapshot['count']} 次"]
+    for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        bound = histogram.percentile(fraction)
+        parts.append(f"{label} ≤ {bound} ms" if bound is not None else f"{label} > {histogram.buckets_ms[-1]} ms")
+    parts.append(f"最大 {snapshot['max_seconds'] * 1000:.1f} ms")
+    return "触发延迟统计: " + ", ".join(parts)
+
+
+def task_key(target_time, duration_seconds, rule):
+    # 数据库中的时间只保存到秒，比较前去掉微秒
+    return (target_time.replace(microsecond=0), duration_seconds, rule.describe() if rule is not None else "单次")
+
+
+def restored_keys(engine):
+    return {task_key(task['datetime'], task['duration_seconds'], task['rule']) for task in engine.tasks.values()}
+
+
+def print_event(event, data):
+    message = describe_event(event, data)
+    if message is not None:
+        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="定时音乐播放器 (无界面模式)")
+    parser.add_argument("folder", help="音乐文件夹")
+    parser.add_argument("--at", action="append", default=[], metavar="H:M:S",
+                        help="定时播放时间，可重复指定")
+    parser.add_argument("--repeat", choices=("once", "daily", "weekdays"), default="once",
+                        help="--at 指定的时间是否重复")
+    parser.add_argument("--cron", action="append", default=[], metavar="EXPR",
+                        help="按 Cron 表达式 (分 时 日 月 周) 重复播放，可重复指定")
+    parser.add_argument("--exclude", default="", metavar="YYYY-MM-DD,...", help="重复任务跳过的日期")
+    parser.add_argument("--duration", default="00:10:00", metavar="H:M:S", help="每次播放时长")
+    parser.add_argument("--policy", choices=tuple(CONFLICT_POLICIES), default=DEFAULT_POLICY,
+                        help="到点时已有播放: queue 排队、preempt 打断当前播放、skip 跳过本次、mix 叠加播放")
+    parser.add_argument("--sound", metavar="FILE", help="叠加播放的音频文件 (如提示音)，需要 --policy mix")
+    parser.add_argument("--import", dest="import_file", metavar="FILE",
+                        help="从 CSV 或 JSON 文件导入定时任务 (列: date,time,duration,repeat,cron,exclude,policy,sound)")
+    parser.add_argument("--export", metavar="FILE", help="把当前的定时任务导出到 CSV 或 JSON 文件后退出")
+    parser.add_argument("--play-now", action="store_true", help="启动后立即播放")
+    parser.add_argument("--resume", action="store_true", help="从上次中断的位置继续播放剩余时长")
+    parser.add_argument("--volume", type=int, default=70, help="音量 (0-100)")
+    parser.add_argument("--no-gapless", action="store_true", help="关闭无缝衔接，逐首加载播放")
+    parser.add_argument("--no-normalize", action="store_true", help="关闭响度均衡，不分析曲目响度")
+    parser.add_argument("--preroll", type=float, default=PREROLL_SECONDS, metavar="SECONDS",
+                        help="在定时任务开始前多少秒预先加载第一首曲目，0 表示不预备")
+    parser.add_argument("--control", type=int, metavar="PORT",
+                        help="在该端口开启本机 HTTP 控制接口，0 表示自动选择端口")
+    parser.add_argument("--control-host", default="127.0.0.1", metavar="HOST", help="控制接口监听的地址")
+    parser.add_argument("--metrics", metavar="FILE", help="启用性能统计并定期写入该文件")
+    parser.add_argument("--metrics-format", choices=("json", "prometheus"), default="json",
+                        help="性能统计文件格式")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, metavar="SECONDS",
+                        help="性能统计写入间隔")
+    parser.add_argument("--profile", metavar="FILE", help="用 cProfile 采集扫描、调度和播放线程，退出时写入该文件")
+    args = parser.parse_args(argv)
+
+    try:
+        duration_seconds = parse_duration(args.duration)
+        check_policy(args.policy, args.sound)
+        exclude_dates = parse_dates(args.exclude)
+        requests = []
+        for t in args.at:
+            time_parts = parse_time(t)
+            rule = None
+            if args.repeat != "once":
+                rule = RecurrenceRule(args.repeat, time_parts, exclude_dates=exclude_dates)
+            requests.append((time_parts, rule))
+        for expr in args.cron:
+            requests.append((None, RecurrenceRule('cron', cron=expr, exclude_dates=exclude_dates)))
+        imported = read_schedule(args.import_file) if args.import_file else []
+    except ScheduleImportError as e:
+        print(f"导入 {args.import_file} 失败，{e}:\n{e.describe()}", file=sys.stderr)
+        return 1
+    except OSError as e:
+        parser.error(str(e))
+    except ValueError as e:
+        parser.error(str(e))
+
+    exporter = setup_metrics(args.metrics, args.metrics_format, args.metrics_interval, args.profile)
+    engine = MusicTimerEngine(gapless=not args.no_gapless, preroll_seconds=args.preroll,
+                              normalize=not args.no_normalize)
+    engine.subscribe(print_event)
+    engine.set_volume(args.volume / 100.0)
+    engine.start()
+    control_server = None
+    try:
+        if args.export:
+            count = write_schedule(engine.list_tasks(), args.export)
+            print(f"已导出 {count} 个定时任务到 {args.export}", flush=True)
+            return 0
+        
+        if args.control is not None:
+            from control_server import ControlServer
+            control_server = ControlServer(engine, args.control, args.control_host)
+            control_server.start()
+            print(f"控制接口: {control_server.url}", flush=True)
+        
+        engine.scan_library(args.folder)
+        if not engine.music_files:
+            return 1
+
+        # 已恢复的任务中相同时间、时长和重复规则的不再重复添加
+        pending = restored_keys(engine)
+        for time_parts, rule in requests:
+            target_time = engine.next_fire_time(time_parts, rule=rule)
+            if target_time is not None and task_key(target_time, duration_seconds, rule) not in pending:
+                engine.add_task(time_parts, duration_seconds, rule, args.policy, args.sound)
+        imported = [entry for entry in imported if task_key(*entry[:3]) not in pending]
+        if imported:
+            engine.add_tasks(imported)
+        if args.resume:
+            if not engine.resume_session():
+                print("没有可以继续的播放", flush=True)
+        elif args.play_now:
+            engine.start_playback(duration_seconds)
+
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if control_server is not None:
+            control_server.stop()
+        engine.shutdown()
+        shutdown_metrics(exporter)
+        summary = describe_latency(engine.firing_latency)
+        if summary is not None:
+            print(summary, flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import tempfile
+from music_clock import SimulatedClock
+from music_engine import (MusicTimerEngine, NullPlayer, TrackCache, ScheduleStore, RecurrenceRule, parse_time,
+                          parse_duration, parse_dates, TIME_FORMAT, PREROLL_SECONDS, CONFLICT_POLICIES,
+                          DEFAULT_POLICY)
+from schedule_io import read_schedule
+
+
+DEFAULT_TRACK_SECONDS = 180.0
+
+
+class TraceRecorder:
+    # 按虚拟时间记录任务触发、播放的曲目、重叠的播放会话和冲突的处理；指定 output 时逐行写出 JSON
+    def __init__(self, clock, output=None):
+        self.clock = clock
+        self.output = output
+        self.firings = 0
+        self.tracks = 0
+        self.sessions = 0
+        self.overlaps = 0
+        self.conflicts = 0
+        self.resolutions = dict.fromkeys(CONFLICT_POLICIES, 0)
+        self.errors = 0
+        self.max_latency = 0.0
+        self.open_sessions = 0
+
+    def write(self, event, **data):
+        if self.output is not None:
+            record = {'time': self.clock.now().strftime(TIME_FORMAT), 'event': event}
+            record.update(data)
+            self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def __call__(self, event, data):
+        task = data.get('task')
+        if event == 'task_fired':
+            self.firings += 1
+            self.max_latency = max(self.max_latency, data['latency'])
+            scheduled = self.clock.start + datetime.timedelta(seconds=task['due_monotonic'])
+            self.write('fired', task=task['id'], scheduled=scheduled.strftime(TIME_FORMAT), latency=data['latency'])
+        elif event == 'playback_started':
+            # 上一次播放还没结束时又开始了新的播放
+            if self.open_sessions:
+                self.overlaps += 1
+                self.write('overlap', task=task['id'] if task else None, open_sessions=self.open_sessions)
+            self.open_sessions += 1
+            self.sessions += 1
+        elif event == 'playback_stopped':
+            # 播放器只有一路，停止时所有进行中的会话都结束了
+            self.open_sessions = 0
+            self.write('stopped', task=task['id'] if task else None)
+        elif event == 'task_conflict':
+            self.conflicts += 1
+            self.write('conflict', task=task['id'], conflicts=data['conflicts'], policy=task['policy'])
+        elif event == 'conflict_resolved':
+            # 到点时主播放被占用，按任务的冲突策略处理
+            self.resolutions[data['policy']] += 1
+            self.write('resolved', task=task['id'], policy=data['policy'], current=data['current_id'])
+        elif event == 'track_started':
+            self.tracks += 1
+            self.write('track', path=data['path'], gap=data['gap'])
+        elif event in ('playback_error', 'preroll_failed'):
+            self.errors += 1
+            self.write(event, message=data['message'])
+
+    def summary(self):
+        return {'firings': self.firings, 'tracks': self.tracks, 'sessions': self.sessions,
+                'overlaps': self.overlaps, 'conflicts': self.conflicts, 'resolutions': dict(self.resolutions),
+                'errors': self.errors, 'max_latency_seconds': self.max_latency}
+
+
+def simulate(days=7.0, requests=(), entries=(), tracks=200, track_seconds=DEFAULT_TRACK_SECONDS, start=None,
+             output=None, preroll_seconds=PREROLL_SECONDS, gapless=True):
+    # requests: [(时间, 时长秒数, 重复规则[, 冲突策略])] 同 add_task 的参数；entries: read_schedule 的结果
+    clock = SimulatedClock(start)
+    recorder = TraceRecorder(clock, output)
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = MusicTimerEngine(player=NullPlayer(clock),
+                                  track_cache=TrackCache(os.path.join(workdir, "track_cache.db")),
+                                  schedule_store=ScheduleStore(os.path.join(workdir, "schedule.db")),
+                                  gapless=gapless, preroll_seconds=preroll_seconds, clock=clock)
+        # 曲库只需要路径和时长，不读文件
+        engine.apply_scan_batch([(f"track{i:05d}.mp3", track_seconds) for i in range(tracks)])
+        engine.subscribe(recorder)
+        engine.start()
+        for request in requests:
+            engine.add_task(*request)
+        if entries:
+            engine.add_tasks(list(entries))
+
+        wall_started = time.perf_counter()
+        end = days * 86400
+        while clock.advance(until=end):
+            pass
+        engine.scheduler.stop()
+        engine.stop_all()
+        clock.settle()
+        wall_seconds = time.perf_counter() - wall_started
+        engine.shutdown()
+
+    result = recorder.summary()
+    result.update({'days': days, 'start': clock.start.strftime(TIME_FORMAT), 'wall_seconds': wall_seconds,
+                   'speedup': days * 86400 / wall_seconds if wall_seconds else None})
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在虚拟时间里模拟定时任务和播放顺序，输出触发和播放记录")
+    parser.add_argument("--days", type=float, default=7.0, help="模拟的天数")
+    parser.add_argument("--start", metavar="YYYY-MM-DD HH:MM:SS", help="虚拟时间的起点，默认当前时间")
+    parser.add_argument("--tracks", type=int, default=200, help="虚拟曲库的曲目数")
+    parser.add_argument("--track-seconds", type=float, default=DEFAULT_TRACK_SECONDS, help="每首曲目的时长")
+    parser.add_argument("--at", action="append", default=[], metavar="H:M:S", help="定时播放时间，可重复指定")
+    parser.add_argument("--repeat", choices=("once", "daily", "weekdays"), default="daily",
+                        help="--at 指定的时间是否重复")
+    parser.add_argument("--cron", action="append", default=[], metavar="EXPR", help="Cron 表达式，可重复指定")
+    parser.add_argument("--exclude", default="", metavar="YYYY-MM-DD,...", help="重复任务跳过的日期")
+    parser.add_argument("--duration", default="00:05:00", metavar="H:M:S", help="每次播放时长")
+    parser.add_argument("--policy", choices=tuple(CONFLICT_POLICIES), default=DEFAULT_POLICY,
+                        help="--at、--cron 任务到点时已有播放的处理方式")
+    parser.add_argument("--import", dest="import_file", metavar="FILE", help="从 CSV 或 JSON 文件导入任务")
+    parser.add_argument("--preroll", type=float, default=PREROLL_SECONDS, metavar="SECONDS", help="预备提前的秒数")
+    parser.add_argument("--no-gapless", action="store_true", help="关闭无缝衔接")
+    parser.add_argument("--trace", metavar="FILE", help="把每次触发、播放的曲目和重叠写入该文件 (每行一个 JSON)")
+    args = parser.parse_args(argv)
+
+    try:
+        start = datetime.datetime.strptime(args.start, TIME_FORMAT) if args.start else None
+        duration_seconds = parse_duration(args.duration)
+        exclude_dates = parse_dates(args.exclude)
+        requests = []
+        for t in args.at:
+            time_parts = parse_time(t)
+            rule = RecurrenceRule(args.repeat, time_parts, exclude_dates=exclude_dates) if args.repeat != "once" else None
+            requests.append((time_parts, duration_seconds, rule, args.policy))
+        for expr in args.cron:
+            requests.append((None, duration_seconds, RecurrenceRule('cron', cron=expr, exclude_dates=exclude_dates),
+                             args.policy))
+        now = start if start is not None else datetime.datetime.now().replace(microsecond=0)
+        entries = read_schedule(args.import_file, now=now) if args.import_file else []
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not requests and not entries:
+        parser.error("至少需要 --at、--cron 或 --import 中的一项")
+
+    output = open(args.trace, "w", encoding="utf-8") if args.trace else None
+    try:
+        result = simulate(args.days, requests, entries, args.tracks, args.track_seconds, now, output,
+                          args.preroll, not args.no_gapless)
+    finally:
+        if output is not None:
+            output.close()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import os
+import csv
+import json
+import datetime
+from music_engine import (RecurrenceRule, parse_time, parse_duration, parse_dates, next_fire_time, check_policy,
+                          CONFLICT_POLICIES, DEFAULT_POLICY)
+
+
+# 导入导出的列: 单次任务按 date + time 触发 (省略 date 时为下一次到达 time 的时刻)，
+# 重复任务按 repeat 规则计算，date 只作参考；policy 为到点时已有播放的处理方式，sound 只用于叠加播放
+FIELDS = ('date', 'time', 'duration', 'repeat', 'cron', 'exclude', 'policy', 'sound')
+REPEAT_KINDS = {
+    '': None, 'once': None, '单次': None,
+    'daily': 'daily', '每天': 'daily',
+    'weekdays': 'weekdays', '工作日': 'weekdays',
+    'cron': 'cron',
+}
+POLICY_KINDS = {'': DEFAULT_POLICY}
+POLICY_KINDS.update((policy, policy) for policy in CONFLICT_POLICIES)
+POLICY_KINDS.update((label, policy) for policy, label in CONFLICT_POLICIES.items())
+JSON_READ_SIZE = 64 * 1024
+
+
+class ScheduleImportError(ValueError):
+    # errors: [(位置, 说明)]，一次性报告文件中的全部错误
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} 处错误")
+
+    def describe(self, limit=None):
+        shown = self.errors if limit is None else self.errors[:limit]
+        lines = [f"{where}: {message}" for where, message in shown]
+        if len(shown) < len(self.errors):
+            lines.append(f"…… 另有 {len(self.errors) - len(shown)} 处错误")
+        return "\n".join(lines)
+
+
+def schedule_format(path, fmt=None):
+    if fmt is None:
+        fmt = 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'json'
+    if fmt not in ('csv', 'json'):
+        raise ValueError(f"不支持的任务文件格式: {fmt}")
+    return fmt
+
+
+def iter_csv_records(f):
+    reader = csv.DictReader(f)
+    for record in reader:
+        yield f"第 {reader.line_num} 行", record
+
+
+def iter_json_records(f):
+    # 顶层数组或每行一个对象 (JSON Lines) 都按块读入后逐个解析，不把整个文件读进内存
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    index = 0
+    in_array = None
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position >= len(buffer) or not eof and len(buffer) - position < JSON_READ_SIZE // 2:
+            chunk = "" if eof else f.read(JSON_READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            if not buffer.strip(" \t\r\n,"):
+                if not eof:
+                    continue
+                if in_array:
+                    raise ValueError("JSON 数组没有结束")
+                return
+            continue
+        if in_array is None:
+            in_array = buffer[position] == '['
+            if in_array:
+                position += 1
+                continue
+        if in_array and buffer[position] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            if not eof:
+                # 对象可能被块边界截断，读入更多内容后重试
+                chunk = f.read(JSON_READ_SIZE)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            raise ValueError(f"第 {index + 1} 项之后 JSON 格式错误: {e.msg}")
+        position = end
+        index += 1
+        yield f"第 {index} 项", record
+
+
+def parse_record(record, now):
+    # 与手动添加相同的校验规则，返回 (触发时间, 时长秒数, 重复规则, 冲突策略, 叠加音频)
+    if not isinstance(record, dict):
+        raise ValueError("每项必须是包含 time、duration 等字段的对象")
+    # JSON 中的字段可能是数组、数字等，先检查类型，后面的解析只处理字符串
+    for field in FIELDS:
+        value = record.get(field)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{field} 必须是字符串")
+    record = {field: (record.get(field) or '').strip() for field in FIELDS}
+    repeat = record['repeat']
+    if repeat not in REPEAT_KINDS:
+        raise ValueError(f"未知的重复类型: {repeat}")
+    kind = REPEAT_KINDS[repeat]
+    time_parts = parse_time(record['time']) if kind != 'cron' else None
+    duration_seconds = parse_duration(record['duration'])
+    policy = record['policy']
+    if policy not in POLICY_KINDS:
+        raise ValueError(f"未知的冲突策略: {policy}")
+    policy = POLICY_KINDS[policy]
+    sound = record['sound'] or None
+    check_policy(policy, sound)
+    rule = None
+    if kind is not None:
+        rule = RecurrenceRule(kind, time_parts, record['cron'] or None, parse_dates(record['exclude']))
+    date_text = record['date']
+    if rule is None and date_text:
+        try:
+            day = datetime.date.fromisoformat(date_text)
+        except (TypeError, ValueError):
+            raise ValueError("日期格式错误，请使用 YYYY-MM-DD 格式")
+        target_time = datetime.datetime.combine(day, datetime.time(*time_parts))
+        if target_time <= now:
+            raise ValueError("播放时间已过")
+        return target_time, duration_seconds, rule, policy, sound
+    target_time = next_fire_time(time_parts, now, rule)
+    if target_time is None:
+        raise ValueError("重复规则在未来没有可触发的时间")
+    return target_time, duration_seconds, rule, policy, sound
+
+
+def read_schedule(path, fmt=None, now=None):
+    # 逐条解析并校验，有错误时收集全部错误后抛出 ScheduleImportError，不返回部分结果
+    fmt = schedule_format(path, fmt)
+    if now is None:
+        now = datetime.datetime.now()
+    entries = []
+    errors = []
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        records = iter_csv_records(f) if fmt == 'csv' else iter_json_records(f)
+        try:
+            for where, record in records:
+                try:
+                    entries.append(parse_record(record, now))
+                except ValueError as e:
+                    errors.append((where, str(e)))
+        except (ValueError, csv.Error) as e:
+            errors.append(("文件", str(e)))
+    if errors:
+        raise ScheduleImportError(errors)
+    return entries
+
+
+def task_record(task):
+    rule = task['rule']
+    record = {'date': task['date'], 'time': task['time'], 'duration': task['duration'],
+              'repeat': rule.kind if rule is not None else 'once',
+              'cron': (rule.cron or '') if rule is not None else '',
+              'exclude': '', 'policy': task['policy'], 'sound': task['sound'] or ''}
+    if rule is not None and rule.exclude_dates:
+        record['exclude'] = ",".join(sorted(d.isoformat() for d in rule.exclude_dates))
+    return record
+
+
+def write_schedule(tasks, path, fmt=None):
+    # 逐条写出，JSON 为每行一个对象的数组，导出的文件可以直接再导入
+    fmt = schedule_format(path, fmt)
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            for task in tasks:
+                writer.writerow(task_record(task))
+                count += 1
+        else:
+            f.write("[")
+            for task in tasks:
+                f.write(",\n" if count else "\n")
+                f.write(json.dumps(task_record(task), ensure_ascii=False))
+                count += 1
+            f.write("\n]\n")
+    return count
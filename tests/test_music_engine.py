@@ -0,0 +1,199 @@
+import os
+import sys
+import random
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from music_clock import SimulatedClock  # noqa: E402
+from music_engine import (MusicTimerEngine, NullPlayer, TrackCache, ScheduleStore, TrackList,  # noqa: E402
+                          TaskIntervalIndex, RecurrenceRule, parse_cron_field, next_fire_time)
+
+
+def test_next_fire_time_drops_microseconds():
+    # 添加任务时刻的微秒不带进目标时间，显示为 08:00:00 的任务就在整秒触发
+    now = datetime.datetime(2026, 1, 5, 7, 0, 0, 734000)
+    assert next_fire_time((8, 0, 0), now=now) == datetime.datetime(2026, 1, 5, 8, 0, 0)
+    assert next_fire_time((7, 0, 0), now=now) == datetime.datetime(2026, 1, 6, 7, 0, 0)
+
+
+def make_engine(tmp_path, clock, tracks=5):
+    engine = MusicTimerEngine(player=NullPlayer(clock),
+                              track_cache=TrackCache(str(tmp_path / "track_cache.db")),
+                              schedule_store=ScheduleStore(str(tmp_path / "schedule.db")), clock=clock)
+    engine.apply_scan_batch([(f"track{i:05d}.mp3", 30.0) for i in range(tracks)])
+    return engine
+
+
+def test_other_session_invalidates_preroll(tmp_path):
+    # 预备后另一个会话加载并排队了曲目，到点时不能直接 play() 混音器里剩下的内容
+    clock = SimulatedClock(datetime.datetime(2026, 1, 5, 7, 0, 0))
+    engine = make_engine(tmp_path, clock)
+    task = engine.add_task((8, 0, 0), 60)
+    engine.preroll_task(task)
+    assert engine.prepared is not None
+    engine.start_playback(60)
+    engine.stop_playback()
+    engine.join_playback_thread()
+    try:
+        assert engine.prepared is None
+        assert engine.take_preroll(task) is None
+    finally:
+        engine.shutdown()
+
+
+def test_track_list_matches_plain_list():
+    # 随机追加、删除 (触发压缩) 和交换，每一步都与普通列表比较
+    rng = random.Random(18)
+    tracks = TrackList(f"track{i}" for i in range(50))
+    expected = [f"track{i}" for i in range(50)]
+    for step in range(3000):
+        action = rng.random()
+        if action < 0.4 or len(expected) < 2:
+            path = f"added{step}"
+            tracks.append(path)
+            expected.append(path)
+        elif action < 0.7:
+            path = rng.choice(expected)
+            tracks.remove(path)
+            expected.remove(path)
+        else:
+            index, other = rng.randrange(len(expected)), rng.randrange(len(expected))
+            tracks.swap(index, other)
+            expected[index], expected[other] = expected[other], expected[index]
+        assert len(tracks) == len(expected)
+        index = rng.randrange(len(expected))
+        assert tracks[index] == expected[index]
+        assert tracks[-1 - index] == expected[-1 - index]
+        assert tracks.index(expected[index]) == index
+        start = rng.randrange(-2, len(expected) + 2)
+        stop = rng.randrange(len(expected) + 2)
+        assert tracks.slice(start, stop) == expected[max(0, start):stop]
+    assert list(tracks) == expected
+    assert all(tracks.index(path) == i for i, path in enumerate(expected))
+    assert all(path in tracks for path in expected)
+
+
+def naive_cron_next(expr, after, exclude_dates, horizon_days=400):
+    # 逐分钟检查，日期不符时直接跳到第二天零点；horizon_days 内找不到时返回 None
+    minute_field, hour_field, day_field, month_field, weekday_field = expr.split()
+    minutes = parse_cron_field(minute_field, 0, 59)
+    hours = parse_cron_field(hour_field, 0, 23)
+    days = parse_cron_field(day_field, 1, 31)
+    months = parse_cron_field(month_field, 1, 12)
+    weekdays = {d % 7 for d in parse_cron_field(weekday_field, 0, 7)}
+    moment = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    limit = after + datetime.timedelta(days=horizon_days)
+    while moment < limit:
+        day_ok = moment.day in days
+        weekday_ok = moment.isoweekday() % 7 in weekdays
+        if day_field == '*' or weekday_field == '*':
+            matches = day_ok and weekday_ok
+        else:
+            matches = day_ok or weekday_ok
+        if not matches or moment.month not in months or moment.date() in exclude_dates:
+            moment = datetime.datetime.combine(moment.date() + datetime.timedelta(days=1), datetime.time())
+            continue
+        if moment.hour in hours and moment.minute in minutes:
+            return moment
+        moment += datetime.timedelta(minutes=1)
+    return None
+
+
+def test_cron_next_after_matches_minute_search():
+    rng = random.Random(8)
+    choices = (('*', '*/15', '0', '5,35', '10-20/5', '59'),
+               ('*', '8', '9-17', '*/6', '0,12', '23'),
+               ('*', '1', '15', '31', '1-7', '*/10', '29'),
+               ('*', '2', '1-6', '*/3', '12'),
+               ('*', '1-5', '0', '7', '6,0', '3'))
+    base = datetime.datetime(2026, 1, 1)
+    for _ in range(300):
+        expr = " ".join(rng.choice(field) for field in choices)
+        exclude = {(base + datetime.timedelta(days=rng.randrange(800))).date() for _ in range(rng.randrange(4))}
+        rule = RecurrenceRule('cron', cron=expr, exclude_dates=exclude)
+        after = base + datetime.timedelta(seconds=rng.randrange(700 * 86400), microseconds=rng.randrange(10 ** 6))
+        expected = naive_cron_next(expr, after, exclude)
+        actual = rule.next_after(after)
+        if expected is None:
+            assert actual is None or actual >= after + datetime.timedelta(days=400), expr
+        else:
+            assert actual == expected, (expr, after)
+
+
+def test_removed_task_leaves_queue_and_overlay(tmp_path):
+    # 07:02 排队、07:01 叠加播放的任务在 07:03:20 被删除后，排队的不再开始，叠加播放立即停止
+    clock = SimulatedClock(datetime.datetime(2026, 1, 5, 6, 0, 0))
+    engine = make_engine(tmp_path, clock, tracks=50)
+    events = []
+    engine.subscribe(lambda event, data: events.append((event, data['task']['id'], clock.now()))
+                     if event in ('playback_started', 'overlay_started', 'overlay_stopped') else None)
+    engine.start()
+    engine.add_task((7, 0, 0), 600)
+    mixed = engine.add_task((7, 1, 0), 600, policy='mix')
+    queued = engine.add_task((7, 2, 0), 60, policy='queue')
+    while clock.advance(until=3800):
+        pass
+    assert queued['status'] == '排队中'
+    engine.remove_tasks([mixed['id'], queued['id']])
+    while clock.advance(until=7200):
+        pass
+    engine.scheduler.stop()
+    engine.stop_all()
+    clock.settle()
+    engine.shutdown()
+    removed_at = datetime.datetime(2026, 1, 5, 7, 3, 20)
+    assert [event for event in events if event[1] == queued['id']] == []
+    assert [event[0] for event in events if event[1] == mixed['id']] == ['overlay_started', 'overlay_stopped']
+    assert events[-1] == ('overlay_stopped', mixed['id'], removed_at)
+
+
+def test_preempted_session_can_be_resumed(tmp_path):
+    # 07:03 抢占 07:00 开始的 10 分钟播放；抢占的任务放完后仍能从被打断的位置继续播放剩下的 7 分钟
+    clock = SimulatedClock(datetime.datetime(2026, 1, 5, 6, 0, 0))
+    engine = make_engine(tmp_path, clock, tracks=50)
+    engine.start()
+    interrupted = engine.add_task((7, 0, 0), 600)
+    engine.add_task((7, 3, 0), 60, policy='preempt')
+    while clock.advance(until=3900):
+        pass
+    state = engine.saved_session()
+    assert state is not None
+    assert state['task_id'] == interrupted['id']
+    assert state['remaining'] == 420.0
+    assert engine.resume_session()
+    while clock.advance(until=7200):
+        pass
+    assert engine.saved_session() is None
+    engine.scheduler.stop()
+    engine.stop_all()
+    clock.settle()
+    engine.shutdown()
+
+
+def test_interval_index_matches_linear_scan():
+    # 随机增删 (包括更新已有任务的时间和个别很长的任务)，每一步都与逐个比较的结果对照
+    rng = random.Random(24)
+    base = datetime.datetime(2026, 1, 5)
+    index = TaskIntervalIndex()
+    spans = {}
+    for _ in range(5000):
+        if rng.random() < 0.7 or not spans:
+            task = {'id': rng.randrange(300), 'datetime': base + datetime.timedelta(seconds=rng.randrange(86400)),
+                    'duration_seconds': rng.choice((1, 60, 600, 3600, 3 * 86400))}
+            index.add(task)
+            spans[task['id']] = TaskIntervalIndex.span_of(task)
+        else:
+            task_id = rng.choice(list(spans))
+            index.remove(task_id)
+            del spans[task_id]
+        start = base.timestamp() + rng.randrange(-3600, 90000)
+        end = start + rng.randrange(1, 7200)
+        exclude = rng.choice(list(spans)) if spans else None
+        expected = [task_id for _, task_id in sorted((span[0], task_id) for task_id, span in spans.items())
+                    if task_id != exclude and spans[task_id][0] < end and spans[task_id][1] > start]
+        assert index.overlapping(start, end, exclude) == expected
+        assert len(index) == len(spans)
+        assert index.overlapping(start, start) == []
+    index.clear()
+    assert len(index) == 0 and index.overlapping(0, float('inf')) == []
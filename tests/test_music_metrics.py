@@ -0,0 +1,26 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from music_metrics import ProfileCapture  # noqa: E402
+
+
+def test_overlapping_profiled_calls_all_run(tmp_path):
+    # Python 3.12 起第二个 Profile 无法同时启用，重叠的调用照常执行而不是抛出 ValueError
+    capture = ProfileCapture(str(tmp_path / "profile.out"))
+    started = threading.Barrier(4)
+    results = []
+
+    def work(n):
+        results.append(capture.call(lambda: started.wait(5) is not None and n))
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    capture.dump()
+    assert sorted(results) == [0, 1, 2, 3]
+    assert os.path.exists(tmp_path / "profile.out")
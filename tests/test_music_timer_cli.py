@@ -0,0 +1,36 @@
+import os
+import sys
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from music_clock import SimulatedClock  # noqa: E402
+from music_engine import MusicTimerEngine, NullPlayer, TrackCache, ScheduleStore, RecurrenceRule  # noqa: E402
+from music_timer_cli import task_key, restored_keys  # noqa: E402
+
+
+def make_engine(tmp_path, clock):
+    return MusicTimerEngine(player=NullPlayer(clock),
+                            track_cache=TrackCache(str(tmp_path / "track_cache.db")),
+                            schedule_store=ScheduleStore(str(tmp_path / "schedule.db")), clock=clock)
+
+
+def test_restart_does_not_duplicate_command_line_tasks(tmp_path):
+    # 重启后命令行再次给出的 --at 任务与数据库中恢复的任务相同，不再重复添加 (添加时刻带微秒)
+    clock = SimulatedClock(datetime.datetime(2026, 1, 5, 7, 0, 0, 734000))
+    engine = make_engine(tmp_path, clock)
+    engine.add_task((8, 0, 0), 300)
+    engine.add_task((9, 0, 0), 60, RecurrenceRule('daily', (9, 0, 0)))
+    engine.shutdown()
+
+    engine = make_engine(tmp_path, clock)
+    engine.load_tasks()
+    pending = restored_keys(engine)
+    try:
+        assert len(pending) == 2
+        assert task_key(engine.next_fire_time((8, 0, 0)), 300, None) in pending
+        rule = RecurrenceRule('daily', (9, 0, 0))
+        assert task_key(engine.next_fire_time((9, 0, 0), rule=rule), 60, rule) in pending
+        assert task_key(datetime.datetime(2026, 1, 5, 8, 0, 0, 500000), 300, None) in pending
+    finally:
+        engine.shutdown()
@@ -0,0 +1,70 @@
+import os
+import sys
+import datetime
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from music_clock import SimulatedClock  # noqa: E402
+from music_engine import MusicTimerEngine, NullPlayer, TrackCache, ScheduleStore, RecurrenceRule  # noqa: E402
+from music_timer_sim import simulate  # noqa: E402
+
+
+# 起点带微秒，添加任务时刻的微秒不应影响触发时间
+START = datetime.datetime(2026, 1, 5, 0, 0, 0, 500000)
+
+
+def test_daily_weekday_and_cron_firings():
+    # 2026-01-05 是周一: 三天里每天、工作日各 3 次，Cron 每 6 小时一次共 12 次
+    result = simulate(3, [((8, 0, 0), 60, RecurrenceRule('daily', (8, 0, 0))),
+                          ((12, 0, 0), 60, RecurrenceRule('weekdays', (12, 0, 0))),
+                          (None, 60, RecurrenceRule('cron', cron="30 */6 * * *"))],
+                      start=START, tracks=20, track_seconds=60)
+    assert result['firings'] == 18
+    assert result['sessions'] == 18
+    assert result['overlaps'] == 0
+    assert result['conflicts'] == 0
+    assert result['errors'] == 0
+    assert result['max_latency_seconds'] == 0.0
+
+
+@pytest.mark.parametrize("policy, sessions", [('queue', 6), ('skip', 3)])
+def test_overlapping_tasks_follow_policy(policy, sessions):
+    # 08:05 的任务到点时 08:00 开始的 10 分钟还没放完: 排队的在之后播放，跳过的不再播放
+    result = simulate(3, [((8, 0, 0), 600, RecurrenceRule('daily', (8, 0, 0))),
+                          ((8, 5, 0), 300, RecurrenceRule('daily', (8, 5, 0)), policy)],
+                      start=START, tracks=20, track_seconds=60)
+    assert result['conflicts'] == 1
+    assert result['resolutions'][policy] == 3
+    assert result['sessions'] == sessions
+    assert result['overlaps'] == 0
+
+
+@pytest.mark.parametrize("policy, sessions", [('queue', 206), ('skip', 144)])
+def test_recurring_task_longer_than_period(policy, sessions):
+    # 每 5 分钟一次、每次 7 分钟: 添加时报告与自身重叠，之后每次到点都按策略处理而不是静默丢弃
+    result = simulate(1, [(None, 420, RecurrenceRule('cron', cron="*/5 * * * *"), policy)],
+                      start=START, tracks=20, track_seconds=60)
+    assert result['conflicts'] == 1
+    assert result['resolutions'][policy] == (287 if policy == 'queue' else 144)
+    assert result['sessions'] == sessions
+    assert result['overlaps'] == 0
+
+
+def test_one_shot_task_fires_on_the_second(tmp_path):
+    clock = SimulatedClock(datetime.datetime(2026, 1, 5, 7, 0, 0, 734000))
+    engine = MusicTimerEngine(player=NullPlayer(clock),
+                              track_cache=TrackCache(str(tmp_path / "track_cache.db")),
+                              schedule_store=ScheduleStore(str(tmp_path / "schedule.db")), clock=clock)
+    engine.apply_scan_batch([(f"track{i}.mp3", 60.0) for i in range(5)])
+    fired = []
+    engine.subscribe(lambda event, data: fired.append(clock.now()) if event == 'task_fired' else None)
+    engine.start()
+    engine.add_task((8, 0, 0), 60)
+    while clock.advance(until=7200):
+        pass
+    engine.scheduler.stop()
+    engine.stop_all()
+    clock.settle()
+    engine.shutdown()
+    assert fired == [datetime.datetime(2026, 1, 5, 8, 0, 0)]
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import datetime
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule_io import read_schedule, ScheduleImportError  # noqa: E402
+
+
+NOW = datetime.datetime(2026, 1, 1, 12, 0, 0)
+
+
+def write_json(tmp_path, records):
+    path = tmp_path / "tasks.json"
+    path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_non_string_fields_are_reported_per_row(tmp_path):
+    # 字段类型错误与其他错误一样逐项报告，不会抛出 AttributeError / TypeError
+    path = write_json(tmp_path, [
+        {'time': '08:00:00', 'duration': '00:05:00', 'repeat': 'daily', 'exclude': ["2027-01-01"]},
+        {'time': '08:00:00', 'duration': '00:05:00', 'policy': ["mix"]},
+        {'time': '08:00:00', 'duration': '00:05:00', 'repeat': ["daily"]},
+        {'time': 800, 'duration': '00:05:00'},
+        {'time': '08:00:00', 'duration': '00:05:00'},
+    ])
+    with pytest.raises(ScheduleImportError) as info:
+        read_schedule(path, now=NOW)
+    errors = info.value.errors
+    assert [where for where, _ in errors] == ["第 1 项", "第 2 项", "第 3 项", "第 4 项"]
+    assert [message for _, message in errors] == ["exclude 必须是字符串", "policy 必须是字符串",
+                                                  "repeat 必须是字符串", "time 必须是字符串"]
+
+
+def test_non_object_records_are_reported(tmp_path):
+    path = write_json(tmp_path, [["08:00:00", "00:05:00"], "08:00:00"])
+    with pytest.raises(ScheduleImportError) as info:
+        read_schedule(path, now=NOW)
+    assert len(info.value.errors) == 2
+
+
+def test_valid_records(tmp_path):
+    path = write_json(tmp_path, [
+        {'date': '2026-01-02', 'time': '08:00:00', 'duration': '00:05:00'},
+        {'time': '09:00:00', 'duration': '00:01:00', 'repeat': 'weekdays', 'exclude': '2026-01-05'},
+        {'duration': '00:01:00', 'repeat': 'cron', 'cron': '0 12 * * *', 'policy': '叠加', 'sound': 'ding.wav'},
+    ])
+    entries = read_schedule(path, now=NOW)
+    assert [entry[3] for entry in entries] == ['queue', 'queue', 'mix']
+    assert entries[0][0] == datetime.datetime(2026, 1, 2, 8, 0, 0)
+    assert entries[1][2].exclude_dates == {datetime.date(2026, 1, 5)}
+    assert entries[2][4] == 'ding.wav'